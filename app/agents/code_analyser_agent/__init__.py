@@ -1,12 +1,90 @@
-import re
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple, Type
 
-from agno.agent import Agent
-from agno.db.postgres import PostgresDb
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.agents.code_analyser_agent.models import AnaliseCodigoCompleta
-from app.agents.code_analyser_agent.prompt import PROMPT_CODE_ANALYZER_AGENT
-from app.core.config import settings
-from app.llm.agno import get_default_agno_model
+from app.agents.code_analyser_agent.cache import (
+    analysis_cache,
+    analysis_cache_key,
+    analysis_flights,
+)
+from app.agents.code_analyser_agent.models import (
+    AnaliseCodigo,
+    AnaliseCodigoCompleta,
+    AnaliseRapida,
+    ModoAnalise,
+)
+from app.agents.code_analyser_agent.prompt import (
+    PROMPT_ADAPT_CODE_ANALYSIS,
+    PROMPT_CODE_ANALYZER_AGENT,
+    PROMPT_QUICK_CODE_ANALYZER_AGENT,
+)
+from app.agents.code_analyser_agent.similar import (
+    SimilarAnalysis,
+    afind_similar_analysis,
+)
+from app.agents.code_analyser_agent.static import (
+    INLINE_MAX_CHARS,
+    PreAnalise,
+    answers_locally,
+    apply_pre_analysis,
+    format_pre_analysis,
+    local_analysis,
+    pre_analyse_code,
+)
+from app.agents.memory import (
+    STUDENT_MESSAGE_KEY,
+    BoundedMemoryAgent,
+    get_memory_policy,
+)
+from app.agents.storage import get_agent_storage
+from app.agents.template import compile_template
+from app.core.config import DEFAULT_AGNO_MODEL, settings
+from app.core.metrics import span
+from app.core.similarity import similarity_index
+from app.llm.agno import (
+    get_default_agno_model,
+    get_quick_agno_model,
+    observe_run_output,
+)
+from app.llm.utils.budget import TokenBudget
+
+# Id fixo do agente: os runs na sessão do agno são separados por agente
+CODE_ANALYSER_AGENT_ID = 'code-analyser'
+
+# Parâmetros padrão de `get_code_analyser_prompt` (entram na chave do cache)
+DEFAULT_PROMPT_PARAMS = {
+    'detalhamento_level': 'medio',
+    'educational_focus': 'ambos',
+    'include_code_suggestions': True,
+    'feedback_tone': 'encorajador',
+}
+
+
+@dataclass(frozen=True)
+class AnalysisModeConfig:
+    """Schema de saída, template e nome da etapa (métricas) de um modo."""
+
+    schema: Type[AnaliseCodigo]
+    template: str
+    stage: str
+
+
+ANALYSIS_MODES = {
+    ModoAnalise.COMPLETA: AnalysisModeConfig(
+        schema=AnaliseCodigoCompleta,
+        template=PROMPT_CODE_ANALYZER_AGENT,
+        stage='code_analyser',
+    ),
+    # Prompt curto, sem código corrigido nem recursos, e modelo com limite
+    # de tokens de saída (`QUICK_ANALYSIS_MAX_TOKENS`)
+    ModoAnalise.RAPIDA: AnalysisModeConfig(
+        schema=AnaliseRapida,
+        template=PROMPT_QUICK_CODE_ANALYZER_AGENT,
+        stage='quick_analyser',
+    ),
+}
 
 
 def get_code_analyser_prompt(
@@ -18,9 +96,10 @@ def get_code_analyser_prompt(
     include_code_suggestions: bool = True,
     feedback_tone: str = 'encorajador',
     template: str = PROMPT_CODE_ANALYZER_AGENT,
+    pre_analise: Optional[str] = None,
 ) -> str:
     """
-    Preenche o template do prompt usando regex - versão hardcoded
+    Preenche o template do prompt (pré-compilado em trechos e slots)
 
     Args:
             template: Template com variáveis {{}}
@@ -31,48 +110,291 @@ def get_code_analyser_prompt(
             feedback_language: pt-br, en, es
             include_code_suggestions: True/False
             feedback_tone: encorajador, neutro, direto
+            pre_analise: Resumo da pré-análise estática (calculado a partir
+                    do código quando omitido)
 
     Returns:
             Prompt com todas as variáveis preenchidas
     """
-
-    # Converter boolean para string
-    include_code_str = 'true' if include_code_suggestions else 'false'
-
-    # Mapeamento das variáveis
-    replacements = {
-        r'\{\{detalhamento_level\}\}': detalhamento_level,
-        r'\{\{educational_focus\}\}': educational_focus,
-        r'\{\{include_code_suggestions\}\}': include_code_str,
-        r'\{\{feedback_tone\}\}': feedback_tone,
-        r'\{\{student_message\}\}': student_message,
-        r'\{\{student_code\}\}': student_code,
-    }
-
-    # Aplicar substituições usando regex
-    resultado = template
-    for pattern, replacement in replacements.items():
-        resultado = re.sub(pattern, replacement, resultado)
-
-    return resultado
+    if pre_analise is None:
+        pre_analise = format_pre_analysis(pre_analyse_code(student_code))
+    return compile_template(template).render(
+        detalhamento_level=detalhamento_level,
+        educational_focus=educational_focus,
+        include_code_suggestions=(
+            'true' if include_code_suggestions else 'false'
+        ),
+        feedback_tone=feedback_tone,
+        student_message=student_message,
+        student_code=student_code,
+        pre_analise=pre_analise,
+    )
 
 
-def get_code_analyser_agno_agent(session_id: str):
-    return Agent(
-        output_schema=AnaliseCodigoCompleta,
-        model=get_default_agno_model(),
-        markdown=True,
-        db=PostgresDb(
-            db_url=settings.sqlalchemy_db_uri, session_table='sessions'
+def get_code_analyser_agno_agent(
+    session_id: str, mode: ModoAnalise = ModoAnalise.COMPLETA
+):
+    return BoundedMemoryAgent(
+        id=CODE_ANALYSER_AGENT_ID,
+        memory_policy=get_memory_policy(
+            history_turns=settings.ANALYSER_MEMORY_HISTORY_TURNS,
+            summarize=False,
         ),
+        output_schema=ANALYSIS_MODES[mode].schema,
+        model=(
+            get_quick_agno_model()
+            if mode == ModoAnalise.RAPIDA
+            else get_default_agno_model()
+        ),
+        markdown=True,
+        db=get_agent_storage(),
         session_id=session_id,
+        telemetry=settings.AGNO_TELEMETRY,
     )
 
 
 def call_code_analyser_agent(*, session_id: str, code: str, question: str):
-    agent = get_code_analyser_agno_agent(session_id)
+    pre = pre_analyse_code(code)
+    if answers_locally(pre):
+        return local_analysis(pre, ModoAnalise.COMPLETA)
 
-    return agent.run(
-        get_code_analyser_prompt(student_message=question, student_code=code),
+    agent = get_code_analyser_agno_agent(session_id)
+    analysis = agent.run(
+        get_code_analyser_prompt(
+            student_message=question,
+            student_code=code,
+            pre_analise=format_pre_analysis(pre),
+        ),
         stream=False,
+        metadata={STUDENT_MESSAGE_KEY: question},
     ).content
+    return apply_pre_analysis(analysis, pre)
+
+
+async def apre_analyse_code(code: str) -> PreAnalise:
+    """`pre_analyse_code` fora do event loop quando o código é grande."""
+    with span('static_analysis'):
+        if len(code) <= INLINE_MAX_CHARS:
+            return pre_analyse_code(code)
+        return await asyncio.to_thread(pre_analyse_code, code)
+
+
+async def acall_code_analyser_agent(
+    *,
+    session_id: str,
+    code: str,
+    question: str,
+    prompt_params: Optional[Dict[str, Any]] = None,
+    mode: ModoAnalise = ModoAnalise.COMPLETA,
+    pre: Optional[PreAnalise] = None,
+) -> AnaliseCodigo:
+    """
+    Versão assíncrona de `call_code_analyser_agent` (usa `Agent.arun`).
+
+    `pre` é a pré-análise estática do código, se já calculada.
+    """
+    config = ANALYSIS_MODES[mode]
+    if pre is None:
+        pre = await apre_analyse_code(code)
+    pre_analise = format_pre_analysis(pre)
+    agent = get_code_analyser_agno_agent(session_id, mode)
+    # Mede prompt + código + memória e corta (ou rejeita com 413) antes do
+    # LLM
+    history = await agent.aload_context()
+    code, history, _, _ = TokenBudget(DEFAULT_AGNO_MODEL).fit(
+        stage=config.stage,
+        prompt=(
+            compile_template(config.template).static_text
+            + pre_analise
+            + question
+        ),
+        code=code,
+        history=history,
+    )
+    agent.keep_context(len(history))
+
+    # Inclui a validação do JSON no schema, feita pelo agno
+    with span(config.stage, model=DEFAULT_AGNO_MODEL):
+        response = await agent.arun(
+            get_code_analyser_prompt(
+                student_message=question,
+                student_code=code,
+                template=config.template,
+                pre_analise=pre_analise,
+                **(prompt_params or {}),
+            ),
+            stream=False,
+            metadata={STUDENT_MESSAGE_KEY: question},
+        )
+    observe_run_output(response, stage=config.stage, model=DEFAULT_AGNO_MODEL)
+    return apply_pre_analysis(response.content, pre)
+
+
+async def aadapt_analysis(
+    *,
+    session_id: str,
+    code: str,
+    question: str,
+    similar: SimilarAnalysis,
+    mode: ModoAnalise = ModoAnalise.COMPLETA,
+    pre: PreAnalise,
+) -> AnaliseCodigo:
+    """
+    Adapta ao código atual a análise de um envio quase idêntico (nomes,
+    linhas e trechos citados), em vez de analisar do zero.
+    """
+    stage = 'analysis_adapt'
+    pre_analise = format_pre_analysis(pre)
+    previous_analysis = similar.analysis.model_dump_json(indent=2)
+    agent = get_code_analyser_agno_agent(session_id, mode)
+    history = await agent.aload_context()
+    code, history, _, _ = TokenBudget(DEFAULT_AGNO_MODEL).fit(
+        stage=stage,
+        prompt=(
+            compile_template(PROMPT_ADAPT_CODE_ANALYSIS).static_text
+            + pre_analise
+            + question
+            + similar.code
+            + previous_analysis
+        ),
+        code=code,
+        history=history,
+    )
+    agent.keep_context(len(history))
+
+    with span(stage, model=DEFAULT_AGNO_MODEL):
+        response = await agent.arun(
+            compile_template(PROMPT_ADAPT_CODE_ANALYSIS).render(
+                student_message=question,
+                student_code=code,
+                previous_code=similar.code,
+                previous_analysis=previous_analysis,
+                pre_analise=pre_analise,
+            ),
+            stream=False,
+            metadata={STUDENT_MESSAGE_KEY: question},
+        )
+    observe_run_output(response, stage=stage, model=DEFAULT_AGNO_MODEL)
+    return apply_pre_analysis(response.content, pre)
+
+
+async def aget_code_analysis(
+    *,
+    session_id: str,
+    code: str,
+    question: str,
+    db: AsyncSession,
+    prompt_params: Optional[Dict[str, Any]] = None,
+    mode: ModoAnalise = ModoAnalise.COMPLETA,
+) -> Tuple[AnaliseCodigo, str]:
+    """
+    Análise de código com cache: LRU local -> tabela `code_analysis` -> LLM,
+    com as chamadas ao LLM de pedidos idênticos simultâneos agrupadas.
+    Código Python que não compila é respondido pela pré-análise estática,
+    sem cache nem LLM.
+
+    Sem a chave no cache, um envio anterior quase idêntico (ver
+    `SimilarityIndex`), com os mesmos `prompt_params` e modo, tem a análise
+    reaproveitada quando só mudam espaços e comentários
+    (`SIMILARITY_REUSE_THRESHOLD`) e a pergunta é a mesma, ou adaptada pelo
+    LLM quando mudam nomes, pequenos trechos ou a pergunta.
+
+    Args:
+            mode: `full` (`AnaliseCodigoCompleta`) ou `quick` (`AnaliseRapida`)
+
+    Returns:
+            A análise e a `cache_key`, que deve ser salva junto com ela
+    """
+    prompt_params = {**DEFAULT_PROMPT_PARAMS, **(prompt_params or {})}
+    cache_key = analysis_cache_key(
+        code=code, question=question, prompt_params=prompt_params, mode=mode
+    )
+
+    pre = await apre_analyse_code(code)
+    if answers_locally(pre):
+        return local_analysis(pre, mode), cache_key
+
+    with span('analysis_cache'):
+        analysis = await analysis_cache.get(
+            cache_key, db, schema=ANALYSIS_MODES[mode].schema
+        )
+    similar = None
+    if analysis is None and settings.SIMILARITY_INDEX_ENABLED:
+        similar = await afind_similar_analysis(
+            code=code,
+            pre=pre,
+            question=question,
+            prompt_params=prompt_params,
+            mode=mode,
+            db=db,
+            schema=ANALYSIS_MODES[mode].schema,
+        )
+    if (
+        similar is not None
+        and similar.same_question
+        and similar.raw_similarity >= settings.SIMILARITY_REUSE_THRESHOLD
+    ):
+        similarity_index.stats.reused += 1
+        analysis = apply_pre_analysis(similar.analysis, pre)
+        analysis_cache.set(cache_key, analysis)
+    elif analysis is None:
+        # Só leituras até aqui: encerra a transação e devolve a conexão ao
+        # pool, em vez de segurá-la durante a chamada ao LLM
+        await db.rollback()
+        # Só a primeira requisição com a mesma chave chama o LLM; as
+        # simultâneas aguardam e compartilham o resultado
+        analysis, _ = await analysis_flights.do(
+            cache_key,
+            lambda: _analyse_and_cache(
+                cache_key=cache_key,
+                session_id=session_id,
+                code=code,
+                question=question,
+                prompt_params=prompt_params,
+                mode=mode,
+                pre=pre,
+                similar=similar,
+            ),
+        )
+
+    return analysis, cache_key
+
+
+async def _analyse_and_cache(
+    *,
+    cache_key: str,
+    session_id: str,
+    code: str,
+    question: str,
+    prompt_params: Dict[str, Any],
+    mode: ModoAnalise,
+    pre: PreAnalise,
+    similar: Optional[SimilarAnalysis] = None,
+) -> AnaliseCodigo:
+    # Uma execução idêntica pode ter terminado enquanto esta requisição
+    # consultava o banco
+    analysis = analysis_cache.memory.get(cache_key)
+    if analysis is not None:
+        return analysis
+
+    if similar is not None:
+        similarity_index.stats.adapted += 1
+        analysis = await aadapt_analysis(
+            session_id=session_id,
+            code=code,
+            question=question,
+            similar=similar,
+            mode=mode,
+            pre=pre,
+        )
+    else:
+        analysis = await acall_code_analyser_agent(
+            session_id=session_id,
+            code=code,
+            question=question,
+            prompt_params=prompt_params,
+            mode=mode,
+            pre=pre,
+        )
+    analysis_cache.set(cache_key, analysis)
+    return analysis
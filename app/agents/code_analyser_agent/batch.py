@@ -0,0 +1,273 @@
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional, Tuple
+
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.agents.code_analyser_agent import aget_code_analysis
+from app.agents.code_analyser_agent.models import ModoAnalise
+from app.core.config import settings
+from app.core.deps import async_session_maker
+from app.core.metrics import span
+from app.core.tasks import spawn
+from app.crud import TutoringTurnCreate, acreate_student_sessions
+from app.crud.writer import writer
+
+logger = logging.getLogger(__name__)
+
+
+class Submission(BaseModel):
+    """Entrega de um aluno na correção em lote"""
+
+    student_id: Optional[int] = None
+    code: str
+    question: str
+
+
+class GradingResult(BaseModel):
+    """Linha do NDJSON com o resultado de uma entrega"""
+
+    event: Literal['item'] = 'item'
+    index: int
+    student_id: Optional[int] = None
+    session_id: int
+    message_id: int
+    status: Literal['ok', 'error']
+    analysis: Optional[Dict[str, Any]] = None
+    cache_key: Optional[str] = None
+    detail: Optional[str] = None
+    duration: float
+
+
+class GradingSummary(BaseModel):
+    """Última linha do NDJSON"""
+
+    event: Literal['done'] = 'done'
+    total: int
+    succeeded: int
+    failed: int
+    duration: float
+
+
+class BatchGrader:
+    """
+    Correção em lote das entregas de uma turma.
+
+    As sessões são criadas num único insert e os ids das mensagens
+    reservados antes de começar; as análises (`aget_code_analysis`, com o
+    cache e o agrupamento de pedidos idênticos compartilhados) rodam até
+    `concurrency` por vez no worker, somando todos os lotes em andamento,
+    e os turnos são gravados pelo writer em inserts em massa de até
+    `flush_size` turnos.
+    """
+
+    def __init__(
+        self,
+        *,
+        session_maker: async_sessionmaker,
+        concurrency: int,
+        flush_size: int,
+    ):
+        self.session_maker = session_maker
+        self.concurrency = concurrency
+        self.flush_size = flush_size
+        # Compartilhado pelos lotes: dois lotes simultâneos não dobram as
+        # chamadas ao LLM do worker
+        self._slots = asyncio.Semaphore(concurrency)
+
+    async def _grade_one(
+        self,
+        *,
+        index: int,
+        submission: Submission,
+        session_id: int,
+        message_id: int,
+        mode: ModoAnalise,
+    ) -> Tuple[GradingResult, Optional[TutoringTurnCreate]]:
+        result = GradingResult(
+            index=index,
+            student_id=submission.student_id,
+            session_id=session_id,
+            message_id=message_id,
+            status='ok',
+            duration=0.0,
+        )
+        async with self._slots:
+            start = time.perf_counter()
+            try:
+                # Uma sessão do banco por entrega: a do cache não pode ser
+                # compartilhada entre análises simultâneas
+                async with self.session_maker() as db:
+                    analysis, cache_key = await aget_code_analysis(
+                        session_id=str(session_id),
+                        code=submission.code,
+                        question=submission.question,
+                        db=db,
+                        mode=mode,
+                    )
+            except Exception as e:
+                logger.warning(
+                    'Batch grading failed index=%d session=%d: %r',
+                    index,
+                    session_id,
+                    e,
+                )
+                result.status = 'error'
+                result.detail = str(getattr(e, 'detail', None) or e)
+                result.duration = round(time.perf_counter() - start, 3)
+                return result, None
+
+        result.duration = round(time.perf_counter() - start, 3)
+        result.analysis = analysis.model_dump()
+        result.cache_key = cache_key
+        turn = TutoringTurnCreate(
+            message_id=message_id,
+            session_id=session_id,
+            code=submission.code,
+            message=submission.question,
+            analysis=result.analysis,
+            cache_key=cache_key,
+        )
+        return result, turn
+
+    async def _grade_all(
+        self,
+        *,
+        submissions: List[Submission],
+        session_ids: List[int],
+        message_ids: List[int],
+        mode: ModoAnalise,
+        results: asyncio.Queue,
+    ) -> None:
+        """
+        Corrige as entregas e grava os turnos em lotes de `flush_size`,
+        publicando cada resultado em `results` (`None` no fim).
+
+        Se a correção for interrompida (ex.: falha na gravação), as
+        entregas ainda não publicadas saem como erro: o resumo sempre soma
+        o total.
+        """
+        tasks = [
+            asyncio.ensure_future(
+                self._grade_one(
+                    index=index,
+                    submission=submission,
+                    session_id=session_id,
+                    message_id=message_id,
+                    mode=mode,
+                )
+            )
+            for index, (submission, session_id, message_id) in enumerate(
+                zip(submissions, session_ids, message_ids)
+            )
+        ]
+        pending: List[TutoringTurnCreate] = []
+        reported = set()
+        detail = 'Correção interrompida'
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result, turn = await next_done
+                results.put_nowait(result)
+                reported.add(result.index)
+                if turn is not None:
+                    pending.append(turn)
+                if len(pending) >= self.flush_size:
+                    batch, pending = pending, []
+                    await writer.persist(batch)
+        except Exception as e:
+            detail = f'Correção interrompida: {e}'
+            raise
+        finally:
+            for task in tasks:
+                task.cancel()
+            for index, (submission, session_id, message_id) in enumerate(
+                zip(submissions, session_ids, message_ids)
+            ):
+                if index not in reported:
+                    results.put_nowait(
+                        GradingResult(
+                            index=index,
+                            student_id=submission.student_id,
+                            session_id=session_id,
+                            message_id=message_id,
+                            status='error',
+                            detail=detail,
+                            duration=0.0,
+                        )
+                    )
+            try:
+                if pending:
+                    await writer.persist(pending)
+            finally:
+                results.put_nowait(None)
+
+    @staticmethod
+    async def _stream_results(
+        results: asyncio.Queue, *, total: int, start: float
+    ) -> AsyncIterator[BaseModel]:
+        succeeded = failed = 0
+        while True:
+            result = await results.get()
+            if result is None:
+                break
+            if result.status == 'ok':
+                succeeded += 1
+            else:
+                failed += 1
+            yield result
+
+        yield GradingSummary(
+            total=total,
+            succeeded=succeeded,
+            failed=failed,
+            duration=round(time.perf_counter() - start, 3),
+        )
+
+    async def grade(
+        self,
+        submissions: List[Submission],
+        *,
+        mode: ModoAnalise = ModoAnalise.COMPLETA,
+    ) -> AsyncIterator[BaseModel]:
+        """
+        Cria as sessões, reserva os ids e inicia a correção (erros até aqui
+        saem antes da resposta). O stream devolvido emite cada
+        `GradingResult` assim que a entrega termina, fora de ordem, e o
+        `GradingSummary` no fim.
+
+        A correção roda numa task própria: se o cliente cair, ela continua
+        e os turnos são gravados mesmo assim.
+        """
+        start = time.perf_counter()
+        async with self.session_maker() as db:
+            with span('batch_sessions'):
+                session_ids = await acreate_student_sessions(
+                    [submission.student_id for submission in submissions], db
+                )
+        with span('message_id'):
+            message_ids = [
+                await writer.reserve_message_id() for _ in submissions
+            ]
+
+        results: asyncio.Queue = asyncio.Queue()
+        spawn(
+            self._grade_all(
+                submissions=submissions,
+                session_ids=session_ids,
+                message_ids=message_ids,
+                mode=mode,
+                results=results,
+            )
+        )
+        return self._stream_results(
+            results, total=len(submissions), start=start
+        )
+
+
+batch_grader = BatchGrader(
+    session_maker=async_session_maker,
+    concurrency=settings.BATCH_GRADING_CONCURRENCY,
+    flush_size=settings.BATCH_GRADING_FLUSH_SIZE,
+)
@@ -0,0 +1,155 @@
+import hashlib
+import json
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Type
+
+from pydantic import BaseModel, ValidationError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.agents.code_analyser_agent.models import (
+    AnaliseCodigo,
+    AnaliseCodigoCompleta,
+    AnaliseRapida,
+    ModoAnalise,
+)
+from app.agents.code_analyser_agent.prompt import (
+    PROMPT_CODE_ANALYZER_AGENT,
+    PROMPT_QUICK_CODE_ANALYZER_AGENT,
+)
+from app.core.cache import TTLCache
+from app.core.config import DEFAULT_AGNO_MODEL, settings
+from app.core.singleflight import SingleFlight
+from app.models import CodeAnalysis
+
+
+def _prompt_version(template: str, schema: Type[BaseModel]) -> str:
+    return hashlib.sha256(
+        (
+            template + json.dumps(schema.model_json_schema(), sort_keys=True)
+        ).encode()
+    ).hexdigest()[:16]
+
+
+# Mudam sempre que o template do prompt ou o schema de saída mudarem,
+# invalidando as entradas antigas do cache; os modos têm chaves distintas
+PROMPT_VERSIONS = {
+    ModoAnalise.COMPLETA: _prompt_version(
+        PROMPT_CODE_ANALYZER_AGENT, AnaliseCodigoCompleta
+    ),
+    ModoAnalise.RAPIDA: _prompt_version(
+        PROMPT_QUICK_CODE_ANALYZER_AGENT, AnaliseRapida
+    ),
+}
+
+
+def normalize_code(code: str) -> str:
+    """Normaliza quebras de linha e espaços que não alteram o código."""
+    lines = code.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+    return '\n'.join(line.rstrip() for line in lines).strip('\n')
+
+
+def analysis_cache_key(
+    *,
+    code: str,
+    question: str,
+    prompt_params: Dict[str, Any],
+    model_name: str = DEFAULT_AGNO_MODEL,
+    mode: ModoAnalise = ModoAnalise.COMPLETA,
+) -> str:
+    """Chave de conteúdo (sha256) de uma análise de código."""
+    payload = json.dumps(
+        {
+            'prompt_version': PROMPT_VERSIONS[mode],
+            'model': model_name,
+            'params': prompt_params,
+            'question': question.strip(),
+            'code': normalize_code(code),
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+@dataclass
+class AnalysisCacheStats:
+    memory_hits: int = 0
+    db_hits: int = 0
+    misses: int = 0
+
+    def as_dict(self) -> dict:
+        lookups = self.memory_hits + self.db_hits + self.misses
+        hits = self.memory_hits + self.db_hits
+        return {
+            **asdict(self),
+            'hit_ratio': hits / lookups if lookups else 0.0,
+        }
+
+
+class AnalysisCache:
+    """
+    Cache de análises (`AnaliseCodigoCompleta` ou `AnaliseRapida`) em dois
+    níveis:
+
+    1. LRU com TTL em memória (por worker);
+    2. tabela `code_analysis`, pela coluna `cache_key`.
+    """
+
+    def __init__(self, *, max_entries: int, ttl: float, db_ttl: float):
+        self.memory = TTLCache(max_entries=max_entries, ttl=ttl)
+        self.db_ttl = db_ttl
+        self.stats = AnalysisCacheStats()
+
+    async def get(
+        self,
+        key: str,
+        db: AsyncSession,
+        schema: Type[BaseModel] = AnaliseCodigoCompleta,
+    ) -> Optional[AnaliseCodigo]:
+        analysis = self.memory.get(key)
+        if analysis is not None:
+            self.stats.memory_hits += 1
+            return analysis
+
+        cutoff = datetime.now() - timedelta(seconds=self.db_ttl)
+        result = await db.exec(
+            select(CodeAnalysis.analysis)
+            .where(
+                CodeAnalysis.cache_key == key,
+                CodeAnalysis.created_at >= cutoff,
+            )
+            .order_by(CodeAnalysis.id.desc())
+            .limit(1)
+        )
+        row = result.first()
+        if row is not None:
+            try:
+                analysis = schema.model_validate(row)
+            except ValidationError:
+                analysis = None
+
+        if analysis is None:
+            self.stats.misses += 1
+            return None
+
+        self.stats.db_hits += 1
+        self.memory.set(key, analysis)
+        return analysis
+
+    def set(self, key: str, analysis: AnaliseCodigo) -> None:
+        # O nível do banco é preenchido quando a análise é salva com a
+        # mesma `cache_key` (ver `acreate_code_analysis`)
+        self.memory.set(key, analysis)
+
+
+analysis_cache = AnalysisCache(
+    max_entries=settings.ANALYSIS_CACHE_MAX_ENTRIES,
+    ttl=settings.ANALYSIS_CACHE_TTL,
+    db_ttl=settings.ANALYSIS_CACHE_DB_TTL,
+)
+
+# Análises em andamento por `cache_key`: pedidos idênticos simultâneos
+# (ex.: a turma enviando o mesmo exercício) esperam a mesma chamada ao LLM
+analysis_flights = SingleFlight()
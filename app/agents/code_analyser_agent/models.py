@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import List, Literal, Optional
+from typing import List, Literal, Optional, Union
 
 from pydantic import BaseModel, Field
 
@@ -159,6 +159,17 @@ class AnaliseRapida(BaseModel):
     sugestoes: List[str]
 
 
+# Qualquer uma das duas análises (o professor aceita ambas)
+AnaliseCodigo = Union[AnaliseCodigoCompleta, AnaliseRapida]
+
+
+class ModoAnalise(str, Enum):
+    """Profundidade da análise escolhida na requisição"""
+
+    COMPLETA = 'full'
+    RAPIDA = 'quick'
+
+
 # Modelos auxiliares para validações específicas
 class ConfigAnalise(BaseModel):
     """Configurações para personalizar a análise"""
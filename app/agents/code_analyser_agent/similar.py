@@ -0,0 +1,162 @@
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type
+
+from pydantic import ValidationError
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.agents.code_analyser_agent.cache import analysis_cache_key
+from app.agents.code_analyser_agent.models import (
+    AnaliseCodigo,
+    AnaliseCodigoCompleta,
+    ModoAnalise,
+)
+from app.agents.code_analyser_agent.static import (
+    INLINE_MAX_CHARS,
+    PreAnalise,
+    pre_analyse_code,
+)
+from app.core.metrics import span
+from app.core.similarity import similarity_index
+from app.models import CodeAnalysis, StudentMessage
+
+# (id, código, pergunta, análise gravada, cache_key) de um candidato
+CandidateRow = Tuple[int, str, str, dict, Optional[str]]
+
+
+@dataclass
+class SimilarAnalysis:
+    """Análise de um envio anterior quase idêntico ao código atual"""
+
+    message_id: int
+    code: str
+    analysis: AnaliseCodigo
+    # Estimada pelo MinHash (identificadores abstraídos)
+    similarity: float
+    # Exata, com os identificadores originais (ver `raw_similarity`)
+    raw_similarity: float
+    # Mesma pergunta do aluno: só então a análise pode ser reaproveitada
+    # sem passar pelo LLM
+    same_question: bool
+
+
+def _has_syntax_errors(analysis: AnaliseCodigo, code: str) -> bool:
+    """
+    Situação de sintaxe do envio anterior, pela análise gravada (que já
+    passou por `apply_pre_analysis`). A rápida não lista os erros por
+    categoria: nela o código é pré-analisado de novo.
+    """
+    if isinstance(analysis, AnaliseCodigoCompleta):
+        return bool(analysis.diagnostico_erros.erros_por_categoria.sintaticos)
+    return bool(pre_analyse_code(code).erros_sintaticos)
+
+
+def _first_match(
+    *,
+    code: str,
+    pre: PreAnalise,
+    question: str,
+    prompt_params: Dict[str, Any],
+    mode: ModoAnalise,
+    schema: Type[AnaliseCodigo],
+    rows: Sequence[CandidateRow],
+    similarities: Dict[int, float],
+) -> Optional[SimilarAnalysis]:
+    """Primeiro candidato válido, na ordem de `rows` (síncrono)"""
+    for message_id, previous_code, previous_question, payload, key in rows:
+        # Sem `cache_key` (gravada antes do cache) não há como conferir
+        if key != analysis_cache_key(
+            code=previous_code,
+            question=previous_question,
+            prompt_params=prompt_params,
+            mode=mode,
+        ):
+            continue
+        try:
+            analysis = schema.model_validate(payload)
+        except ValidationError:
+            # Gravada em outro modo (completa x rápida) ou schema antigo
+            continue
+        if _has_syntax_errors(analysis, previous_code) != bool(
+            pre.erros_sintaticos
+        ):
+            continue
+        return SimilarAnalysis(
+            message_id=message_id,
+            code=previous_code,
+            analysis=analysis,
+            similarity=similarities[message_id],
+            raw_similarity=similarity_index.raw_similarity(
+                code, previous_code
+            ),
+            same_question=previous_question.strip() == question.strip(),
+        )
+    return None
+
+
+async def afind_similar_analysis(
+    *,
+    code: str,
+    pre: PreAnalise,
+    question: str,
+    prompt_params: Dict[str, Any],
+    mode: ModoAnalise,
+    db: AsyncSession,
+    schema: Type[AnaliseCodigo],
+) -> Optional[SimilarAnalysis]:
+    """
+    Procura no `similarity_index` um código já analisado, quase idêntico
+    ao atual, cuja análise (no formato de `schema`) ainda é válida.
+
+    Candidatos com situação de sintaxe diferente da atual (ex.: o anterior
+    não compilava) são descartados: a análise deles não serve de base.
+    Também os gerados com outros `prompt_params`, modo, modelo ou versão
+    do prompt: a `cache_key` gravada com a análise é recalculada com a
+    pergunta anterior e os parâmetros atuais e precisa bater.
+
+    Assinatura e comparação com os candidatos rodam fora do event loop
+    quando algum dos códigos passa de `INLINE_MAX_CHARS`.
+    """
+    with span('similarity_lookup'):
+        if len(code) <= INLINE_MAX_CHARS:
+            signature = similarity_index.signature(code)
+        else:
+            signature = await asyncio.to_thread(
+                similarity_index.signature, code
+            )
+        candidates = dict(similarity_index.query(signature))
+        if not candidates:
+            return None
+
+        result = await db.exec(
+            select(
+                StudentMessage.id,
+                StudentMessage.code,
+                StudentMessage.message,
+                CodeAnalysis.analysis,
+                CodeAnalysis.cache_key,
+            )
+            .join(CodeAnalysis, CodeAnalysis.message_id == StudentMessage.id)
+            .where(StudentMessage.id.in_(list(candidates)))
+        )
+        rows: List[CandidateRow] = sorted(
+            result.all(), key=lambda row: candidates[row[0]], reverse=True
+        )
+
+    def match() -> Optional[SimilarAnalysis]:
+        return _first_match(
+            code=code,
+            pre=pre,
+            question=question,
+            prompt_params=prompt_params,
+            mode=mode,
+            schema=schema,
+            rows=rows,
+            similarities=candidates,
+        )
+
+    longest = max([len(code)] + [len(row[1]) for row in rows])
+    if longest <= INLINE_MAX_CHARS:
+        return match()
+    return await asyncio.to_thread(match)
@@ -0,0 +1,627 @@
+import ast
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from app.agents.code_analyser_agent.models import (
+    AnaliseCodigo,
+    AnaliseCodigoCompleta,
+    AnaliseGeral,
+    AnaliseRapida,
+    CodigoMelhorado,
+    DiagnosticoErros,
+    ErroDetalhado,
+    ErrosPorCategoria,
+    FeedbackConstrutivo,
+    ImpactoAprendizado,
+    ModoAnalise,
+    NivelAluno,
+)
+from app.core.config import settings
+
+PYTHON = 'Python'
+
+# Padrões característicos de cada linguagem; vence a que casar mais padrões
+# (ver `detect_language`)
+LANGUAGE_PATTERNS: Dict[str, List[re.Pattern]] = {
+    language: [re.compile(pattern, re.MULTILINE) for pattern in patterns]
+    for language, patterns in {
+        PYTHON: [
+            r'^\s*def\s+\w+\s*\(.*\)\s*(->.*)?:\s*$',
+            r'^\s*def\s+\w+\s*\(',
+            r'^\s*(import\s+\w+|from\s+[\w.]+\s+import\b)',
+            r'^\s*(if|elif|while|for)\b.*:\s*$',
+            r'^\s*(else|try|finally)\s*:\s*$',
+            r'\bprint\s*\(',
+            r'\bself\b',
+        ],
+        'JavaScript': [
+            r'\bfunction\s+\w+\s*\(',
+            r'\b(const|let|var)\s+\w+\s*=',
+            r'console\.log\s*\(',
+            r'=>',
+            r'===|!==',
+        ],
+        'TypeScript': [
+            r':\s*(string|number|boolean|any|void)\b',
+            r'^\s*(export\s+)?(interface|type)\s+\w+',
+        ],
+        'Java': [
+            r'\bpublic\s+(static\s+)?(class|void|int|String)\b',
+            r'System\.out\.print',
+            r'\bString\[\]',
+        ],
+        'C#': [
+            r'^\s*using\s+System',
+            r'Console\.Write',
+            r'\bnamespace\s+\w+',
+        ],
+        'C++': [
+            r'#include\s*<(iostream|vector|string|map|algorithm)>',
+            r'\bstd::',
+            r'\bcout\s*<<',
+        ],
+        'C': [
+            r'#include\s*<(stdio|stdlib|string)\.h>',
+            r'\bprintf\s*\(',
+            r'\bint\s+main\s*\(',
+        ],
+        'Go': [
+            r'^\s*package\s+\w+',
+            r'\bfunc\s+\w+\s*\(',
+            r'\bfmt\.Print',
+            r':=',
+        ],
+        'Rust': [r'\bfn\s+\w+\s*\(', r'\blet\s+mut\b', r'\bprintln!\s*\('],
+        'PHP': [r'<\?php', r'\$\w+\s*='],
+        'Ruby': [r'^\s*puts\b', r'^\s*end\s*$', r'\bdo\s*\|\w+\|'],
+        'SQL': [
+            r'(?i)\bselect\b[\s\S]+?\bfrom\b',
+            r'(?i)\b(insert\s+into|create\s+table|update\s+\w+\s+set)\b',
+        ],
+    }.items()
+}
+
+# A linguagem detectada só é confirmada com pelo menos `MIN_LANGUAGE_SCORE`
+# padrões e `MIN_LANGUAGE_MARGIN` a mais que a segunda colocada: um único
+# `print(` aparece em Python, Lua, Swift, Kotlin, R...
+MIN_LANGUAGE_SCORE = 2
+MIN_LANGUAGE_MARGIN = 1
+
+# Linguagens em que `#` inicia comentário (para o lexer de delimitadores)
+HASH_COMMENT_LANGUAGES = {PYTHON, 'PHP', 'Ruby'}
+
+OPENING = {'(': ')', '[': ']', '{': '}'}
+CLOSING = {value: key for key, value in OPENING.items()}
+
+# Código maior que isso é pré-analisado (e comparado no índice de
+# similaridade) fora do event loop: com 2 KB cada etapa leva poucos ms no
+# loop; com 50 KB, entre 40 e 100 ms
+INLINE_MAX_CHARS = 2_000
+
+# Pontuação da resposta local para código que não compila
+SYNTAX_ERROR_SCORE = 20
+
+# Código válido porém aninhado demais (ex.: `1 + 1 + ...` com centenas de
+# termos) estoura a pilha do compilador ou do `ast.NodeVisitor`: a
+# pré-análise desiste e o código vai para o LLM
+TOO_DEEP = (RecursionError, MemoryError)
+
+
+@dataclass
+class MetricasCodigo:
+    linhas_codigo: int = 0
+    funcoes: int = 0
+    classes: int = 0
+    complexidade_ciclomatica: int = 1
+    complexidade_maxima_funcao: int = 0
+    aninhamento_maximo: int = 0
+    imports: List[str] = field(default_factory=list)
+
+
+@dataclass
+class PreAnalise:
+    """Resultado da análise estática local, feita antes do LLM."""
+
+    linguagem: Optional[str] = None
+    # Sem confirmação, `linguagem` é só um palpite: não corrige a resposta
+    # do LLM nem ativa a verificação pelo compilador do Python
+    linguagem_confirmada: bool = False
+    # Python é verificado pelo próprio compilador; nas demais linguagens os
+    # erros vêm de um lexer simples e são só indícios
+    verificado: bool = False
+    erros_sintaticos: List[ErroDetalhado] = field(default_factory=list)
+    metricas: MetricasCodigo = field(default_factory=MetricasCodigo)
+    padroes: List[str] = field(default_factory=list)
+
+    @property
+    def tem_erro_sintatico_verificado(self) -> bool:
+        return self.verificado and bool(self.erros_sintaticos)
+
+
+def detect_language(code: str) -> Tuple[Optional[str], bool]:
+    """
+    Linguagem mais provável do código e se ela está confirmada (pontuação
+    e vantagem sobre a segunda colocada suficientes).
+    """
+    scores = {
+        language: sum(1 for pattern in patterns if pattern.search(code))
+        for language, patterns in LANGUAGE_PATTERNS.items()
+    }
+    ranking = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    (language, score), (runner_up, runner_up_score) = ranking[0], ranking[1]
+    if score == 0:
+        return None, False
+    # Empate com Python: o compilador desempata, sem confirmar
+    if score == runner_up_score and PYTHON in (language, runner_up):
+        try:
+            compile(code, '<aluno>', 'exec', dont_inherit=True)
+        except (SyntaxError, ValueError):
+            return runner_up if language == PYTHON else language, False
+        except TOO_DEEP:
+            # Sem como saber se compila: fica o palpite, sem confirmar
+            return language, False
+        return PYTHON, False
+    confirmed = (
+        score >= MIN_LANGUAGE_SCORE
+        and score - runner_up_score >= MIN_LANGUAGE_MARGIN
+    )
+    return language, confirmed
+
+
+def _syntax_error(
+    line: Optional[int], message: str, fix: str
+) -> ErroDetalhado:
+    where = f'Linha {line}: ' if line else ''
+    return ErroDetalhado(
+        tipo='Erro de sintaxe',
+        descricao=f'{where}{message}',
+        correcao_sugerida=fix,
+        impacto_aprendizado=ImpactoAprendizado.ALTO,
+    )
+
+
+class _PythonMetrics(ast.NodeVisitor):
+    BRANCHES = (
+        ast.If,
+        ast.For,
+        ast.AsyncFor,
+        ast.While,
+        ast.IfExp,
+        ast.ExceptHandler,
+        ast.With,
+        ast.AsyncWith,
+        ast.Assert,
+        ast.comprehension,
+        ast.match_case,
+    )
+    NESTING = (
+        ast.If,
+        ast.For,
+        ast.AsyncFor,
+        ast.While,
+        ast.Try,
+        ast.With,
+        ast.AsyncWith,
+        ast.Match,
+    )
+
+    def __init__(self):
+        self.metricas = MetricasCodigo()
+        self.padroes: List[str] = []
+        self._function_complexity: List[int] = []
+        self._function_names: List[str] = []
+        self._depth = 0
+
+    def _add_complexity(self, amount: int) -> None:
+        self.metricas.complexidade_ciclomatica += amount
+        if self._function_complexity:
+            self._function_complexity[-1] += amount
+
+    def generic_visit(self, node):
+        if isinstance(node, self.BRANCHES):
+            self._add_complexity(1)
+        elif isinstance(node, ast.BoolOp):
+            self._add_complexity(len(node.values) - 1)
+
+        nests = isinstance(node, self.NESTING)
+        if nests:
+            self._depth += 1
+            self.metricas.aninhamento_maximo = max(
+                self.metricas.aninhamento_maximo, self._depth
+            )
+        super().generic_visit(node)
+        if nests:
+            self._depth -= 1
+
+    def _visit_function(self, node):
+        self.metricas.funcoes += 1
+        for default in node.args.defaults + node.args.kw_defaults:
+            if isinstance(default, (ast.List, ast.Dict, ast.Set)):
+                self.padroes.append(
+                    f'argumento padrão mutável em `{node.name}` '
+                    f'(linha {node.lineno})'
+                )
+        self._function_complexity.append(1)
+        self._function_names.append(node.name)
+        # Uma função não aumenta o aninhamento dos blocos de outra
+        depth, self._depth = self._depth, 0
+        self.generic_visit(node)
+        self._depth = depth
+        self._function_names.pop()
+        self.metricas.complexidade_maxima_funcao = max(
+            self.metricas.complexidade_maxima_funcao,
+            self._function_complexity.pop(),
+        )
+
+    visit_FunctionDef = _visit_function
+    visit_AsyncFunctionDef = _visit_function
+
+    def visit_ClassDef(self, node):
+        self.metricas.classes += 1
+        self.generic_visit(node)
+
+    def visit_Import(self, node):
+        self.metricas.imports.extend(alias.name for alias in node.names)
+        self.generic_visit(node)
+
+    def visit_ImportFrom(self, node):
+        if node.module:
+            self.metricas.imports.append(node.module)
+        self.generic_visit(node)
+
+    def visit_ExceptHandler(self, node):
+        if node.type is None:
+            self.padroes.append(f'`except` sem tipo (linha {node.lineno})')
+        self.generic_visit(node)
+
+    def visit_Compare(self, node):
+        for op, right in zip(node.ops, node.comparators):
+            if (
+                isinstance(op, (ast.Eq, ast.NotEq))
+                and isinstance(right, ast.Constant)
+                and right.value is None
+            ):
+                self.padroes.append(
+                    f'comparação com `None` usando `==`/`!=` '
+                    f'(linha {node.lineno})'
+                )
+        self.generic_visit(node)
+
+    def visit_For(self, node):
+        iterator = node.iter
+        if (
+            isinstance(iterator, ast.Call)
+            and isinstance(iterator.func, ast.Name)
+            and iterator.func.id == 'range'
+            and len(iterator.args) == 1
+            and isinstance(iterator.args[0], ast.Call)
+            and isinstance(iterator.args[0].func, ast.Name)
+            and iterator.args[0].func.id == 'len'
+        ):
+            self.padroes.append(
+                f'`for i in range(len(...))` (linha {node.lineno})'
+            )
+        self.generic_visit(node)
+
+    def visit_Global(self, node):
+        self.padroes.append(
+            f'uso de `global` ({", ".join(node.names)}, linha {node.lineno})'
+        )
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        if (
+            self._function_names
+            and isinstance(node.func, ast.Name)
+            and node.func.id == self._function_names[-1]
+        ):
+            pattern = f'recursão em `{node.func.id}`'
+            if pattern not in self.padroes:
+                self.padroes.append(pattern)
+        self.generic_visit(node)
+
+
+def _code_lines(code: str, comment: str = '#') -> int:
+    """Linhas com código (sem linhas em branco e só de comentário)."""
+    return sum(
+        1
+        for line in code.splitlines()
+        if line.strip() and not line.strip().startswith(comment)
+    )
+
+
+def _give_up_python(pre: PreAnalise) -> None:
+    """Pré-análise sem confirmação: nada de resposta local nem correção
+    da resposta do LLM, só a contagem de linhas."""
+    pre.linguagem_confirmada = False
+    pre.verificado = False
+    pre.erros_sintaticos = []
+    pre.metricas = MetricasCodigo(linhas_codigo=pre.metricas.linhas_codigo)
+    pre.padroes = []
+
+
+def _pre_analyse_python(code: str, pre: PreAnalise) -> None:
+    pre.verificado = True
+    pre.metricas.linhas_codigo = _code_lines(code)
+    try:
+        tree = compile(
+            code, '<aluno>', 'exec', flags=ast.PyCF_ONLY_AST, dont_inherit=True
+        )
+    except SyntaxError as e:
+        pre.erros_sintaticos.append(
+            _syntax_error(
+                e.lineno,
+                f'{e.msg}' + (f' em `{e.text.strip()}`' if e.text else ''),
+                'Revise a linha indicada (e a anterior): parênteses, '
+                'colchetes ou aspas sem fechar, `:` ausente ou indentação '
+                'inconsistente são as causas mais comuns.',
+            )
+        )
+        return
+    except ValueError as e:
+        # Ex.: caractere nulo no código
+        pre.erros_sintaticos.append(
+            _syntax_error(None, str(e), 'Remova os caracteres inválidos.')
+        )
+        return
+    except TOO_DEEP:
+        _give_up_python(pre)
+        return
+
+    visitor = _PythonMetrics()
+    try:
+        visitor.visit(tree)
+    except TOO_DEEP:
+        _give_up_python(pre)
+        return
+    visitor.metricas.linhas_codigo = pre.metricas.linhas_codigo
+    pre.metricas = visitor.metricas
+    pre.padroes = visitor.padroes
+
+
+def _pre_analyse_generic(code: str, pre: PreAnalise) -> None:
+    """Lexer simples: delimitadores balanceados, ignorando strings e
+    comentários, e uma estimativa de complexidade por palavras-chave."""
+    hash_comments = pre.linguagem in HASH_COMMENT_LANGUAGES
+    stack: List[tuple] = []
+    depth = 0
+    line = 1
+    index = 0
+    length = len(code)
+
+    while index < length:
+        char = code[index]
+        pair = code[index : index + 2]
+        if char == '\n':
+            line += 1
+        elif pair == '//' or (char == '#' and hash_comments):
+            end = code.find('\n', index)
+            index = length if end == -1 else end
+            continue
+        elif pair == '/*':
+            end = code.find('*/', index + 2)
+            end = length if end == -1 else end + 2
+            line += code.count('\n', index, end)
+            index = end
+            continue
+        elif char in '"\'`':
+            start_line = line
+            index += 1
+            while index < length and code[index] != char:
+                if code[index] == '\\':
+                    index += 1
+                elif code[index] == '\n':
+                    line += 1
+                    if char != '`':
+                        break
+                index += 1
+            if index >= length or code[index] != char:
+                pre.erros_sintaticos.append(
+                    _syntax_error(
+                        start_line,
+                        f'string iniciada com {char} não foi fechada',
+                        f'Feche a string com {char} na mesma linha.',
+                    )
+                )
+                if index < length:
+                    line += 1
+        elif char in OPENING:
+            stack.append((char, line))
+            if char == '{':
+                depth += 1
+                pre.metricas.aninhamento_maximo = max(
+                    pre.metricas.aninhamento_maximo, depth
+                )
+        elif char in CLOSING:
+            if not stack or stack[-1][0] != CLOSING[char]:
+                pre.erros_sintaticos.append(
+                    _syntax_error(
+                        line,
+                        f'`{char}` fechado sem o `{CLOSING[char]}` '
+                        'correspondente',
+                        'Confira o par de delimitadores deste bloco.',
+                    )
+                )
+            else:
+                stack.pop()
+            if char == '}':
+                depth = max(0, depth - 1)
+        index += 1
+
+    for char, opened_at in stack:
+        pre.erros_sintaticos.append(
+            _syntax_error(
+                opened_at,
+                f'`{char}` aberto e não fechado',
+                f'Feche o bloco com `{OPENING[char]}`.',
+            )
+        )
+
+    # Só os primeiros erros: os seguintes costumam ser consequência deles
+    del pre.erros_sintaticos[3:]
+    pre.metricas.linhas_codigo = _code_lines(
+        code, '#' if hash_comments else '//'
+    )
+    pre.metricas.complexidade_ciclomatica = 1 + len(
+        re.findall(r'\b(if|for|while|case|catch)\b|&&|\|\|', code)
+    )
+
+
+def pre_analyse_code(code: str) -> PreAnalise:
+    """
+    Identifica a linguagem, os erros de sintaxe, métricas básicas e padrões
+    óbvios do código, sem chamar o LLM (microssegundos a poucos ms).
+    """
+    language, confirmed = detect_language(code)
+    pre = PreAnalise(linguagem=language, linguagem_confirmada=confirmed)
+    if pre.linguagem == PYTHON and confirmed:
+        _pre_analyse_python(code, pre)
+    elif pre.linguagem is not None:
+        _pre_analyse_generic(code, pre)
+    return pre
+
+
+def answers_locally(pre: PreAnalise) -> bool:
+    """Se a análise pode ser montada localmente, sem o LLM analisador."""
+    return (
+        settings.STATIC_ANALYSIS_LOCAL_ANSWER
+        and pre.tem_erro_sintatico_verificado
+    )
+
+
+def format_pre_analysis(pre: PreAnalise) -> str:
+    """Resumo compacto da pré-análise para o prompt do analisador."""
+    if pre.linguagem is None:
+        return '- linguagem: não identificada localmente'
+
+    metricas = pre.metricas
+    source = 'compilador' if pre.verificado else 'lexer simples'
+    if pre.linguagem_confirmada:
+        lines = [f'- linguagem: {pre.linguagem}']
+    else:
+        lines = [
+            f'- linguagem: provavelmente {pre.linguagem} (não confirmada; '
+            'identifique pelo código)'
+        ]
+    if pre.erros_sintaticos:
+        lines.append(f'- erros de sintaxe ({source}):')
+        lines.extend(
+            f'  - {erro.descricao}' for erro in pre.erros_sintaticos
+        )
+    else:
+        lines.append(f'- erros de sintaxe ({source}): nenhum')
+
+    parts = [f'{metricas.linhas_codigo} linhas de código']
+    if pre.verificado:
+        parts.append(f'{metricas.funcoes} funções')
+        parts.append(f'{metricas.classes} classes')
+    parts.append(
+        f'complexidade ciclomática {metricas.complexidade_ciclomatica}'
+    )
+    if metricas.complexidade_maxima_funcao:
+        parts.append(
+            f'máx. {metricas.complexidade_maxima_funcao} por função'
+        )
+    parts.append(f'aninhamento máximo {metricas.aninhamento_maximo}')
+    lines.append(f'- métricas: {", ".join(parts)}')
+    if metricas.imports:
+        lines.append(f'- imports: {", ".join(sorted(set(metricas.imports)))}')
+    if pre.padroes:
+        lines.append(f'- padrões: {"; ".join(pre.padroes)}')
+    return '\n'.join(lines)
+
+
+def local_analysis(pre: PreAnalise, mode: ModoAnalise) -> AnaliseCodigo:
+    """
+    Análise montada sem o LLM para código Python que não compila: o erro de
+    sintaxe é o assunto da resposta e o professor o explica ao aluno. Sem
+    código executável não há como avaliar o nível: usamos INICIANTE.
+    """
+    erros = pre.erros_sintaticos
+    if mode == ModoAnalise.RAPIDA:
+        return AnaliseRapida(
+            nivel_aluno=NivelAluno.INICIANTE,
+            linguagem=pre.linguagem,
+            total_erros=len(erros),
+            pontuacao=SYNTAX_ERROR_SCORE,
+            principais_problemas=[erro.descricao for erro in erros],
+            sugestoes=[erro.correcao_sugerida for erro in erros],
+        )
+
+    return AnaliseCodigoCompleta(
+        analise_geral=AnaliseGeral(
+            nivel_aluno=NivelAluno.INICIANTE,
+            linguagem_programacao=pre.linguagem,
+            objetivo_codigo=(
+                'Não avaliado: o código tem erro de sintaxe e não executa'
+            ),
+            topicos_envolvidos=[],
+            pontuacao_geral=SYNTAX_ERROR_SCORE,
+        ),
+        diagnostico_erros=DiagnosticoErros(
+            total_erros=len(erros),
+            erros_por_categoria=ErrosPorCategoria(sintaticos=erros),
+        ),
+        feedback_construtivo=FeedbackConstrutivo(
+            pontos_fortes=[],
+            areas_melhoria=['Sintaxe da linguagem'],
+            proximos_passos=[
+                'Corrija o erro de sintaxe e envie o código novamente '
+                'para uma análise completa'
+            ],
+            recursos_recomendados=[],
+        ),
+        codigo_melhorado=CodigoMelhorado(
+            incluir=False, explicacao_mudancas=''
+        ),
+    )
+
+
+def apply_pre_analysis(
+    analysis: AnaliseCodigo, pre: PreAnalise
+) -> AnaliseCodigo:
+    """
+    Corrige a resposta do LLM com o que a pré-análise sabe com certeza:
+    a linguagem (quando confirmada) e, em Python, se há ou não erros de
+    sintaxe.
+    """
+    if pre.linguagem is None or not pre.linguagem_confirmada:
+        return analysis
+
+    if isinstance(analysis, AnaliseRapida):
+        if pre.linguagem.lower() not in analysis.linguagem.lower():
+            analysis = analysis.model_copy(update={'linguagem': pre.linguagem})
+        return analysis
+
+    geral = analysis.analise_geral
+    if pre.linguagem.lower() not in geral.linguagem_programacao.lower():
+        analysis = analysis.model_copy(
+            update={
+                'analise_geral': geral.model_copy(
+                    update={'linguagem_programacao': pre.linguagem}
+                )
+            }
+        )
+
+    if not pre.verificado:
+        return analysis
+
+    # Em Python o compilador é a fonte da verdade para erros de sintaxe
+    categorias = analysis.diagnostico_erros.erros_por_categoria
+    if pre.erros_sintaticos and categorias.sintaticos:
+        return analysis
+    categorias = categorias.model_copy(
+        update={'sintaticos': list(pre.erros_sintaticos)}
+    )
+    total = sum(
+        len(getattr(categorias, name))
+        for name in ErrosPorCategoria.model_fields
+    )
+    return analysis.model_copy(
+        update={
+            'diagnostico_erros': DiagnosticoErros(
+                total_erros=total, erros_por_categoria=categorias
+            )
+        }
+    )
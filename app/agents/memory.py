@@ -0,0 +1,458 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Set, Tuple
+
+from agno.agent import Agent
+from agno.db.base import SessionType
+from agno.models.message import Message
+from agno.run.agent import RunOutput
+from agno.run.base import RunStatus
+from agno.session.agent import AgentSession
+from agno.session.summary import SessionSummary
+
+from app.agents.template import compile_template
+from app.core.config import settings
+from app.core.metrics import span
+from app.core.tasks import spawn
+from app.llm.agno import observe_run_output
+from app.llm.utils.budget import CHARS_PER_TOKEN, get_token_counter
+
+logger = logging.getLogger(__name__)
+
+# Chave do `metadata` do run com a mensagem do aluno: o histórico repete a
+# pergunta, e não o prompt inteiro (template, código e análise)
+STUDENT_MESSAGE_KEY = 'student_message'
+
+# Tamanho máximo de cada mensagem de um turno enviado para o resumo
+SUMMARY_TURN_MAX_CHARS = 2000
+
+PROMPT_MEMORY_SUMMARY = """
+Você mantém o resumo de uma sessão de tutoria de programação entre um
+aluno e um professor. Atualize o resumo anterior com os turnos novos.
+
+Registre o que o aluno está tentando fazer, os conceitos já trabalhados,
+as dificuldades e erros recorrentes, o que já foi explicado e as perguntas
+que ficaram em aberto. Não invente nada que não esteja nos turnos. Responda
+só com o resumo, em português, em no máximo {{max_words}} palavras.
+
+## Resumo anterior
+{{previous_summary}}
+
+## Turnos novos
+{{turns}}
+"""
+
+
+@dataclass(frozen=True)
+class MemoryPolicy:
+    """
+    Quanto da sessão um agente vê e guarda.
+
+    - history_turns: últimos turnos do próprio agente repassados ao modelo;
+    - max_history_tokens: limite de tokens desses turnos (os mais antigos
+      saem primeiro);
+    - max_stored_runs: runs do agente guardados na sessão; acima disso os
+      antigos são compactados;
+    - summarize: os turnos compactados entram no resumo da sessão (que vai
+      para o system message); senão são só descartados.
+    """
+
+    history_turns: int
+    max_history_tokens: int
+    max_stored_runs: int
+    summarize: bool = False
+
+
+def get_memory_policy(*, history_turns: int, summarize: bool) -> MemoryPolicy:
+    return MemoryPolicy(
+        history_turns=history_turns,
+        max_history_tokens=settings.MEMORY_HISTORY_MAX_TOKENS,
+        # Compactar abaixo do histórico apagaria turnos ainda repassados
+        max_stored_runs=max(settings.MEMORY_MAX_STORED_RUNS, history_turns),
+        summarize=summarize and settings.MEMORY_SUMMARY_ENABLED,
+    )
+
+
+def _runs_of(session: AgentSession, agent_id: str) -> List[RunOutput]:
+    return [run for run in session.runs or [] if run.agent_id == agent_id]
+
+
+def _folded_runs(
+    runs: List[RunOutput], policy: MemoryPolicy
+) -> List[RunOutput]:
+    """Runs que saem numa compactação (o mais recente sempre fica)"""
+    return runs[: len(runs) - max(policy.history_turns, 1)]
+
+
+def _content_of(message: Message) -> str:
+    return message.get_content_string() or ''
+
+
+def turn_messages(run: RunOutput) -> List[Message]:
+    """Pergunta do aluno e resposta do agente de um run."""
+    messages = [
+        message
+        for message in run.messages or []
+        if not message.from_history
+    ]
+    question = (run.metadata or {}).get(STUDENT_MESSAGE_KEY)
+    if question is None:
+        question = next(
+            (
+                _content_of(message)
+                for message in messages
+                if message.role == 'user'
+            ),
+            '',
+        )
+    answer = next(
+        (
+            _content_of(message)
+            for message in reversed(messages)
+            if message.role == 'assistant'
+        ),
+        '',
+    )
+    return [
+        Message(role='user', content=question),
+        Message(role='assistant', content=answer),
+    ]
+
+
+def bounded_history(
+    session: AgentSession,
+    agent_id: str,
+    policy: MemoryPolicy,
+    max_turns: Optional[int] = None,
+) -> List[Message]:
+    """
+    Últimos `history_turns` turnos completos do agente, dentro do limite de
+    tokens; turnos inteiros são descartados a partir do mais antigo.
+    `max_turns` limita ainda mais (o que coube no orçamento do prompt).
+    """
+    if policy.history_turns <= 0:
+        return []
+
+    runs = [
+        run
+        for run in _runs_of(session, agent_id)
+        if run.status == RunStatus.completed
+    ][-policy.history_turns:]
+    turns = [turn_messages(run) for run in runs]
+
+    count = get_token_counter().count
+    sizes = [sum(count(_content_of(m)) for m in turn) for turn in turns]
+    while turns and sum(sizes) > policy.max_history_tokens:
+        turns.pop(0)
+        sizes.pop(0)
+    if max_turns is not None and len(turns) > max_turns:
+        del turns[: len(turns) - max_turns]
+        del sizes[: len(sizes) - max_turns]
+
+    history = [message for turn in turns for message in turn]
+    for message in history:
+        message.from_history = True
+    logger.debug(
+        'memory history agent=%s turns=%d tokens=%d',
+        agent_id,
+        len(turns),
+        sum(sizes),
+    )
+    return history
+
+
+def _format_turn(run: RunOutput) -> str:
+    question, answer = turn_messages(run)
+    return (
+        f'Aluno: {_content_of(question)[:SUMMARY_TURN_MAX_CHARS]}\n'
+        f'Professor: {_content_of(answer)[:SUMMARY_TURN_MAX_CHARS]}'
+    )
+
+
+async def asummarize_turns(
+    model, previous: Optional[SessionSummary], runs: List[RunOutput]
+) -> SessionSummary:
+    """Novo resumo da sessão: o resumo anterior mais os turnos compactados"""
+    max_tokens = settings.MEMORY_SUMMARY_MAX_TOKENS
+    prompt = compile_template(PROMPT_MEMORY_SUMMARY).render(
+        previous_summary=previous.summary if previous else '(vazio)',
+        turns='\n\n'.join(_format_turn(run) for run in runs),
+        # Uma palavra em português fica perto de 1.5 token
+        max_words=str(int(max_tokens / 1.5)),
+    )
+    model_id = getattr(model, 'id', '')
+    agent = Agent(model=model, telemetry=settings.AGNO_TELEMETRY)
+    with span('memory_summary', model=model_id):
+        response = await agent.arun(prompt, stream=False)
+    observe_run_output(response, stage='memory_summary', model=model_id)
+
+    summary = str(response.content or '').strip()
+    return SessionSummary(
+        summary=summary[: int(max_tokens * CHARS_PER_TOKEN)],
+        updated_at=datetime.now(),
+    )
+
+
+async def acompact_session(
+    *,
+    db,
+    model,
+    session: AgentSession,
+    agent_id: str,
+    policy: MemoryPolicy,
+) -> None:
+    """
+    Compacta os runs antigos de um agente na sessão.
+
+    Mantém os últimos `history_turns` runs, resume os demais e os remove.
+    A sessão é relida logo antes da gravação e só os runs compactados
+    saem, para não apagar um turno gravado enquanto o resumo era gerado.
+    """
+    folded = _folded_runs(_runs_of(session, agent_id), policy)
+    if not folded:
+        return
+
+    summary = await asummarize_turns(model, session.summary, folded)
+
+    folded_ids = {run.run_id for run in folded}
+
+    def merge() -> None:
+        current = db.get_session(
+            session_id=session.session_id, session_type=SessionType.AGENT
+        )
+        if current is None:
+            return
+        current.runs = [
+            run for run in current.runs or [] if run.run_id not in folded_ids
+        ]
+        current.summary = summary
+        db.upsert_session(current)
+
+    with span('memory_compaction'):
+        await asyncio.to_thread(merge)
+    logger.info(
+        'memory compaction session=%s agent=%s folded=%d',
+        session.session_id,
+        agent_id,
+        len(folded),
+    )
+
+
+# Compactações em andamento neste worker (sessão, agente)
+_compacting: Set[Tuple[str, str]] = set()
+
+
+def schedule_compaction(
+    *, db, model, session: AgentSession, agent_id: str, policy: MemoryPolicy
+) -> None:
+    """Agenda `acompact_session` se ainda não houver uma para a sessão."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        # `Agent.run` síncrono: fica para o próximo turno assíncrono
+        return
+
+    key = (session.session_id, agent_id)
+    if key in _compacting:
+        return
+    _compacting.add(key)
+    task = spawn(
+        acompact_session(
+            db=db,
+            model=model,
+            session=session,
+            agent_id=agent_id,
+            policy=policy,
+        )
+    )
+    task.add_done_callback(lambda _: _compacting.discard(key))
+
+
+class BoundedMemoryAgent(Agent):
+    """
+    Agente do agno com memória limitada pela `MemoryPolicy`.
+
+    O analisador e o professor usam o mesmo `session_id`, então o histórico
+    vem só dos runs do próprio agente (`id` fixo), como pares pergunta do
+    aluno / resposta, e não pelo `add_history_to_context` do agno, que
+    misturaria os dois agentes e repetiria os prompts inteiros.
+
+    Ao salvar a sessão, as cópias do histórico saem dos runs e, passando de
+    `max_stored_runs`, os runs antigos são compactados: sem resumo, saem
+    já nesta gravação (não há chamada ao modelo); com resumo, fora do
+    caminho crítico (`acompact_session`).
+
+    No `arun`, a leitura e a gravação da sessão (síncronas no agno 2.0, no
+    engine psycopg2) rodam numa thread: o event loop não para durante as
+    idas ao banco nem esperando uma conexão do pool.
+
+    Antes do `arun`, `aload_context` devolve o resumo e os turnos que vão
+    ao modelo, para o `TokenBudget` contar com eles; `keep_context` aplica
+    o que coube no orçamento.
+    """
+
+    def __init__(self, *, memory_policy: MemoryPolicy, **kwargs):
+        super().__init__(
+            add_history_to_context=False,
+            add_session_summary_to_context=memory_policy.summarize,
+            **kwargs,
+        )
+        self.memory_policy = memory_policy
+        # No `arun`, a sessão a gravar fica aqui até `_asave_pending`
+        self._defer_save = False
+        self._pending_save: Optional[AgentSession] = None
+        # Itens de `aload_context` (resumo, turnos) e turnos mantidos
+        self._context: Tuple[bool, int] = (False, 0)
+        self._history_limit: Optional[int] = None
+
+    def arun(self, input, *, stream: Optional[bool] = None, **kwargs):
+        if stream is None:
+            stream = bool(self.stream)
+        if stream:
+            return self._offloaded_stream(input, **kwargs)
+        return self._offloaded_run(input, **kwargs)
+
+    async def _offloaded_run(self, input, **kwargs) -> RunOutput:
+        await self._aload_session()
+        try:
+            return await super().arun(input, stream=False, **kwargs)
+        finally:
+            await self._asave_pending()
+
+    async def _offloaded_stream(self, input, **kwargs) -> AsyncIterator:
+        await self._aload_session()
+        try:
+            async for event in super().arun(input, stream=True, **kwargs):
+                yield event
+        finally:
+            await self._asave_pending()
+
+    async def _aload_session(self) -> None:
+        """
+        Lê a sessão numa thread; o agno a reaproveita no `arun` (o
+        `_read_or_create_session` devolve a que já está em memória).
+        """
+        self._defer_save = True
+        if self.db is None or self.session_id is None:
+            return
+        if (
+            self._agent_session is not None
+            and self._agent_session.session_id == self.session_id
+        ):
+            # Já lida no `aload_context`
+            return
+        with span('agent_session_load'):
+            self._agent_session = await asyncio.to_thread(
+                self._read_or_create_session, session_id=self.session_id
+            )
+
+    async def aload_context(self) -> List[str]:
+        """
+        Resumo da sessão (se vai ao system message) e turnos do histórico
+        que o `arun` repassará ao modelo, do mais antigo ao mais recente.
+        Lê a sessão, que o `arun` reaproveita.
+        """
+        await self._aload_session()
+        session = self._agent_session
+        if session is None:
+            return []
+        has_summary = bool(
+            self.add_session_summary_to_context and session.summary
+        )
+        history = bounded_history(session, self.id, self.memory_policy)
+        turns = [
+            f'{_content_of(question)}\n{_content_of(answer)}'
+            for question, answer in zip(history[::2], history[1::2])
+        ]
+        self._context = (has_summary, len(turns))
+        if has_summary:
+            return [session.summary.summary] + turns
+        return turns
+
+    def keep_context(self, kept: int) -> None:
+        """
+        Mantém só os `kept` itens mais recentes de `aload_context`: saem
+        primeiro o resumo e depois os turnos mais antigos.
+        """
+        has_summary, turns = self._context
+        dropped = has_summary + turns - kept
+        if dropped <= 0:
+            return
+        if has_summary:
+            self.add_session_summary_to_context = False
+            dropped -= 1
+        self._history_limit = turns - dropped
+
+    async def _asave_pending(self) -> None:
+        """Grava numa thread a sessão que o `arun` mandou salvar"""
+        self._defer_save = False
+        session, self._pending_save = self._pending_save, None
+        if session is None:
+            return
+        summarize = self._prepare_save(session)
+        with span('agent_session_save'):
+            await asyncio.to_thread(super().save_session, session)
+        if summarize:
+            self._schedule_compaction(session)
+
+    def _get_run_messages(self, *, session: AgentSession, **kwargs):
+        run_messages = super()._get_run_messages(session=session, **kwargs)
+        history = bounded_history(
+            session, self.id, self.memory_policy, self._history_limit
+        )
+        if history:
+            messages = run_messages.messages
+            # Entre o system message (e mensagens extras) e a do aluno
+            position = next(
+                (
+                    index
+                    for index, message in enumerate(messages)
+                    if message is run_messages.user_message
+                ),
+                len(messages),
+            )
+            messages[position:position] = history
+        return run_messages
+
+    def save_session(self, session: AgentSession) -> None:
+        if self._defer_save:
+            # Chamado de dentro do `arun`, no event loop
+            self._pending_save = session
+            return
+        summarize = self._prepare_save(session)
+        super().save_session(session)
+        if summarize:
+            self._schedule_compaction(session)
+
+    def _prepare_save(self, session: AgentSession) -> bool:
+        """
+        Tira as cópias do histórico dos runs e compacta os antigos sem
+        resumo; retorna se a compactação com resumo deve ser agendada.
+        """
+        runs = _runs_of(session, self.id)
+        for run in runs:
+            if run.messages:
+                run.messages = [
+                    message
+                    for message in run.messages
+                    if not message.from_history
+                ]
+        policy = self.memory_policy
+        compact = len(runs) > policy.max_stored_runs
+        if compact and not policy.summarize:
+            folded_ids = {run.run_id for run in _folded_runs(runs, policy)}
+            session.runs = [
+                run for run in session.runs if run.run_id not in folded_ids
+            ]
+        return compact and policy.summarize
+
+    def _schedule_compaction(self, session: AgentSession) -> None:
+        schedule_compaction(
+            db=self.db,
+            model=self.model,
+            session=session,
+            agent_id=self.id,
+            policy=self.memory_policy,
+        )
@@ -0,0 +1,18 @@
+from functools import lru_cache
+
+from agno.db.postgres import PostgresDb
+
+from app.core.deps import engine
+
+AGENT_SESSION_TABLE = 'sessions'
+
+
+@lru_cache(maxsize=1)
+def get_agent_storage() -> PostgresDb:
+    """
+    Storage de sessões do agno compartilhado por todos os agentes do worker.
+
+    Reaproveita o `engine` síncrono (e o pool configurado em `Settings`)
+    em vez de criar um engine novo por agente e por requisição.
+    """
+    return PostgresDb(db_engine=engine, session_table=AGENT_SESSION_TABLE)
@@ -1,42 +1,81 @@
-import re
-
-from agno.agent import Agent
-from agno.db.postgres import PostgresDb
-
-from app.agents.code_analyser_agent import AnaliseCodigoCompleta
+from app.agents.code_analyser_agent import AnaliseCodigo
+from app.agents.memory import (
+    STUDENT_MESSAGE_KEY,
+    BoundedMemoryAgent,
+    get_memory_policy,
+)
+from app.agents.storage import get_agent_storage
 from app.agents.teacher_agent.prompt import PROMPT_TEACHER_AGENT
-from app.core.config import settings
-from app.llm.agno import get_default_agno_model
+from app.agents.template import compile_template
+from app.core.config import DEFAULT_AGNO_MODEL, settings
+from app.core.metrics import instrument_stream, span
+from app.llm.agno import (
+    generate_stream,
+    get_default_agno_model,
+    observe_run_output,
+)
+from app.llm.utils.budget import TokenBudget
+
+# Id fixo do agente: os runs na sessão do agno são separados por agente
+TEACHER_AGENT_ID = 'teacher'
 
 
 def get_teacher_agent_prompt(
     *,
     student_message: str,
     student_code: str,
-    code_analysis: AnaliseCodigoCompleta,
+    code_analysis: AnaliseCodigo,
     template: str = PROMPT_TEACHER_AGENT,
 ) -> str:
-    replacements = {
-        r'\{\{student_message\}\}': student_message,
-        r'\{\{student_code\}\}': student_code,
-        r'\{\{code_analysis\}\}': str(code_analysis.model_dump()),
-    }
+    return compile_template(template).render(
+        student_message=student_message,
+        student_code=student_code,
+        code_analysis=str(code_analysis.model_dump()),
+    )
 
-    resultado = template
-    for pattern, replacement in replacements.items():
-        resultado = re.sub(pattern, replacement, resultado)
 
-    return resultado
+async def aget_budgeted_teacher_agent_prompt(
+    *,
+    agent: BoundedMemoryAgent,
+    student_message: str,
+    student_code: str,
+    code_analysis: AnaliseCodigo,
+) -> str:
+    """
+    Prompt do professor ajustado ao orçamento de tokens do modelo, contando
+    o resumo e os turnos da sessão que o `agent` repassa junto.
+    """
+    history = await agent.aload_context()
+    student_code, history, code_analysis, _ = TokenBudget(
+        DEFAULT_AGNO_MODEL
+    ).fit(
+        stage='teacher',
+        prompt=compile_template(PROMPT_TEACHER_AGENT).static_text
+        + student_message,
+        code=student_code,
+        history=history,
+        analysis=code_analysis,
+    )
+    agent.keep_context(len(history))
+    return get_teacher_agent_prompt(
+        student_message=student_message,
+        student_code=student_code,
+        code_analysis=code_analysis,
+    )
 
 
 def get_teacher_agent_agno_agent(session_id: str):
-    return Agent(
+    return BoundedMemoryAgent(
+        id=TEACHER_AGENT_ID,
+        memory_policy=get_memory_policy(
+            history_turns=settings.TEACHER_MEMORY_HISTORY_TURNS,
+            summarize=True,
+        ),
         markdown=True,
         model=get_default_agno_model(),
-        db=PostgresDb(
-            db_url=settings.sqlalchemy_db_uri, session_table='sessions'
-        ),
+        db=get_agent_storage(),
         session_id=session_id,
+        telemetry=settings.AGNO_TELEMETRY,
     )
 
 
@@ -45,7 +84,7 @@ def call_teacher_agent_agent(
     session_id: str,
     code: str,
     question: str,
-    code_analysis: AnaliseCodigoCompleta,
+    code_analysis: AnaliseCodigo,
 ):
     agent = get_teacher_agent_agno_agent(session_id)
 
@@ -56,4 +95,60 @@ def call_teacher_agent_agent(
             code_analysis=code_analysis,
         ),
         stream=False,
+        metadata={STUDENT_MESSAGE_KEY: question},
     ).content
+
+
+async def acall_teacher_agent_agent(
+    *,
+    session_id: str,
+    code: str,
+    question: str,
+    code_analysis: AnaliseCodigo,
+):
+    """Versão assíncrona de `call_teacher_agent_agent` (usa `Agent.arun`)."""
+    agent = get_teacher_agent_agno_agent(session_id)
+    prompt = await aget_budgeted_teacher_agent_prompt(
+        agent=agent,
+        student_message=question,
+        student_code=code,
+        code_analysis=code_analysis,
+    )
+
+    with span('teacher', model=DEFAULT_AGNO_MODEL):
+        response = await agent.arun(
+            prompt, stream=False, metadata={STUDENT_MESSAGE_KEY: question}
+        )
+    observe_run_output(response, stage='teacher', model=DEFAULT_AGNO_MODEL)
+    return response.content
+
+
+async def stream_teacher_agent_agent(
+    *,
+    session_id: str,
+    code: str,
+    question: str,
+    code_analysis: AnaliseCodigo,
+):
+    """
+    Prepara o prompt (erros como o 413 saem aqui) e devolve a resposta do
+    professor token a token (async iterator).
+    """
+    with span('teacher_prompt'):
+        agent = get_teacher_agent_agno_agent(session_id)
+        prompt = await aget_budgeted_teacher_agent_prompt(
+            agent=agent,
+            student_message=question,
+            student_code=code,
+            code_analysis=code_analysis,
+        )
+
+    return instrument_stream(
+        generate_stream(
+            agent=agent,
+            input=prompt,
+            metadata={STUDENT_MESSAGE_KEY: question},
+        ),
+        stage='teacher',
+        model=DEFAULT_AGNO_MODEL,
+    )
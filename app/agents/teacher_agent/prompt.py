@@ -13,6 +13,11 @@ Você receberá um objeto `AnaliseCodigoCompleta` contendo:
 - Feedback construtivo estruturado
 - Código melhorado (quando disponível)
 
+Ou, no modo de análise rápida, um objeto `AnaliseRapida` mais enxuto, com
+`nivel_aluno`, `linguagem`, `total_erros`, `pontuacao`, `principais_problemas`
+e `sugestoes`. Nesse caso, baseie-se nos problemas principais e seja mais
+breve, sem inventar detalhes que a análise não traz.
+
 # PROCESSO DE PENSAMENTO PEDAGÓGICO
 
 ## 1. DIAGNÓSTICO PEDAGÓGICO
@@ -0,0 +1,51 @@
+import re
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+_PLACEHOLDER = re.compile(r'\{\{(\w+)\}\}')
+
+
+class CompiledTemplate:
+    """
+    Template de prompt com variáveis `{{nome}}` pré-processado uma única vez.
+
+    O texto é quebrado em trechos estáticos e slots; `render` só preenche os
+    slots e faz um único `''.join`, sem regex. Os valores são inseridos
+    literalmente (barras invertidas no código do aluno, como `\\n` ou `\\d`,
+    são preservadas) e não são reprocessados: um `{{...}}` dentro do código
+    do aluno continua intacto.
+    """
+
+    def __init__(self, template: str):
+        self.template = template
+        parts = _PLACEHOLDER.split(template)
+        # `split` alterna trechos estáticos (índices pares) e nomes de
+        # variáveis (índices ímpares)
+        self._parts: List[str] = parts
+        self._slots: Tuple[Tuple[int, str], ...] = tuple(
+            (index, parts[index]) for index in range(1, len(parts), 2)
+        )
+        self.variables = frozenset(name for _, name in self._slots)
+        # Texto fixo do template (sem as variáveis), usado na contagem de
+        # tokens do prompt
+        self.static_text = ''.join(parts[0::2])
+
+    def render(self, **values: str) -> str:
+        missing = self.variables - values.keys()
+        if missing:
+            raise KeyError(
+                f'Missing template variables: {", ".join(sorted(missing))}'
+            )
+
+        parts = self._parts.copy()
+        for index, name in self._slots:
+            parts[index] = values[name]
+        return ''.join(parts)
+
+    def render_dict(self, values: Dict[str, str]) -> str:
+        return self.render(**values)
+
+
+@lru_cache(maxsize=32)
+def compile_template(template: str) -> CompiledTemplate:
+    return CompiledTemplate(template)
@@ -0,0 +1,395 @@
+import asyncio
+import logging
+import math
+import time
+import uuid
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timedelta
+from typing import Deque, Dict, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import delete
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core.config import settings
+from app.core.deps import async_session_maker
+from app.core.metrics import (
+    ADMISSION_QUEUE_DEPTH,
+    ADMISSION_WAIT_DURATION,
+    current_endpoint,
+)
+from app.core.tasks import spawn
+from app.models import SessionTurnLease
+
+logger = logging.getLogger(__name__)
+
+# Peso da última medição na média móvel da duração dos turnos
+SERVICE_TIME_EWMA_WEIGHT = 0.2
+
+
+class _QueueFull(Exception):
+    pass
+
+
+class _Gate:
+    """
+    Semáforo com fila FIFO limitada.
+
+    Ao liberar uma vaga com alguém na fila, ela passa direto para o
+    primeiro da fila, sem que um recém-chegado a tome.
+    """
+
+    def __init__(self, capacity: int, max_queue: int):
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def idle(self) -> bool:
+        return self.active == 0 and not self.waiters
+
+    def try_acquire(self) -> bool:
+        if self.active < self.capacity and not self.waiters:
+            self.active += 1
+            return True
+        return False
+
+    async def acquire(self, timeout: float) -> None:
+        """Ocupa uma vaga; `_QueueFull` ou `TimeoutError` se não der"""
+        if self.try_acquire():
+            return
+        if len(self.waiters) >= self.max_queue:
+            raise _QueueFull
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, max(timeout, 0))
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # A vaga chegou junto com o timeout/cancelamento
+                self.release()
+            elif waiter in self.waiters:
+                self.waiters.remove(waiter)
+            raise
+
+    def release(self) -> None:
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+class SessionLeases:
+    """
+    Um turno ativo por sessão entre todos os workers.
+
+    O turno que começa grava uma linha em `session_turn_leases` com um
+    token próprio (`INSERT ... ON CONFLICT`, uma ida ao banco); se outro
+    turno já tem a sessão, `claim` devolve None. A linha sai no fim do
+    turno, e uma deixada por um worker que caiu vale até `ttl` segundos.
+    Sem conexão presa durante o turno, ao contrário de um advisory lock.
+    """
+
+    def __init__(self, *, session_maker: async_sessionmaker, ttl: float):
+        self.session_maker = session_maker
+        self.ttl = ttl
+
+    async def claim(self, session_id: int) -> Optional[str]:
+        """Token do turno, ou None se a sessão já tem um turno ativo"""
+        token = uuid.uuid4().hex
+        now = datetime.now()
+        async with self.session_maker() as db:
+            dialect = (
+                postgresql
+                if db.bind.dialect.name == 'postgresql'
+                else sqlite
+            )
+            statement = dialect.insert(SessionTurnLease).values(
+                session_id=session_id,
+                holder=token,
+                expires_at=now + timedelta(seconds=self.ttl),
+            )
+            # Só toma o lugar de um turno expirado
+            statement = statement.on_conflict_do_update(
+                index_elements=[SessionTurnLease.session_id],
+                set_={
+                    'holder': statement.excluded.holder,
+                    'expires_at': statement.excluded.expires_at,
+                },
+                where=SessionTurnLease.expires_at < now,
+            ).returning(SessionTurnLease.holder)
+            holder = await db.scalar(statement)
+            await db.commit()
+        return token if holder == token else None
+
+    async def release(self, session_id: int, token: str) -> None:
+        async with self.session_maker() as db:
+            await db.exec(
+                delete(SessionTurnLease).where(
+                    SessionTurnLease.session_id == session_id,
+                    SessionTurnLease.holder == token,
+                )
+            )
+            await db.commit()
+
+
+@dataclass
+class AdmissionStats:
+    admitted: int = 0
+    rejected_session: int = 0
+    rejected_queue_full: int = 0
+    rejected_deadline: int = 0
+    timeouts: int = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class AdmissionTicket:
+    """
+    Vaga de um turno; `arelease` no fim da geração, `release` onde não dá
+    para esperar (idempotentes).
+    """
+
+    controller: 'AdmissionController'
+    session_key: Optional[int]
+    # Token do `SessionLeases` (None sem sessão ou sem banco)
+    lease: Optional[str] = None
+    admitted_at: float = field(default_factory=time.perf_counter)
+    released: bool = False
+
+    def release(self) -> None:
+        """Libera a vaga; o lease da sessão sai em segundo plano"""
+        if not self.released:
+            self.released = True
+            self.controller._release(self)
+            if self.lease is not None:
+                leases = self.controller.leases
+                spawn(leases.release(self.session_key, self.lease))
+
+    async def arelease(self) -> None:
+        """
+        Libera a vaga depois de remover o lease: o próximo turno da sessão,
+        enviado assim que o cliente recebe o fim da resposta, não esbarra
+        no lease deste (429).
+        """
+        if self.released:
+            return
+        self.released = True
+        leases = self.controller.leases
+        try:
+            if self.lease is not None:
+                await leases.release(self.session_key, self.lease)
+        except asyncio.CancelledError:
+            spawn(leases.release(self.session_key, self.lease))
+            raise
+        except Exception:
+            # Expira sozinho após o TTL
+            logger.exception('Could not release session lease')
+        finally:
+            self.controller._release(self)
+
+
+class AdmissionController:
+    """
+    Controle de admissão dos turnos de tutoria (vagas por worker).
+
+    - global: até `max_in_flight` turnos ao mesmo tempo; os excedentes
+      esperam numa fila de até `max_queue` turnos, por até `max_wait`
+      segundos. Fila cheia, espera estimada acima do prazo ou prazo
+      esgotado recebem 503 com `Retry-After`;
+    - por sessão: um turno ativo por `session_id`; até `session_queue`
+      turnos esperam o anterior terminar no worker, os demais recebem 429.
+      Com `leases`, a regra vale entre workers: um turno da mesma sessão
+      em andamento em outro worker também dá 429.
+
+    A espera estimada usa a posição na fila e a média móvel da duração
+    dos turnos, para recusar logo quem não seria atendido a tempo em vez de
+    segurar a conexão até o prazo. Para ser usado a partir do event loop.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_in_flight: int,
+        max_queue: int,
+        max_wait: float,
+        session_queue: int,
+        leases: Optional[SessionLeases] = None,
+    ):
+        self.max_wait = max_wait
+        self.session_queue = session_queue
+        self.leases = leases
+        self._global = _Gate(max_in_flight, max_queue)
+        self._sessions: Dict[int, _Gate] = {}
+        self.service_time: Optional[float] = None
+        self.stats = AdmissionStats()
+
+    def status(self) -> dict:
+        return {
+            **self.stats.as_dict(),
+            'in_flight': self._global.active,
+            'queued': len(self._global.waiters),
+            'active_sessions': len(self._sessions),
+            'service_time_ewma': (
+                None
+                if self.service_time is None
+                else round(self.service_time, 3)
+            ),
+        }
+
+    def _estimated_wait(self) -> float:
+        if self.service_time is None:
+            return 0.0
+        # Vagas liberam em média a cada service_time / capacidade
+        position = len(self._global.waiters) + 1
+        return position * self.service_time / self._global.capacity
+
+    def _reject(
+        self, status_code: int, detail: str, start: float, outcome: str
+    ) -> HTTPException:
+        ADMISSION_WAIT_DURATION.observe(
+            time.perf_counter() - start,
+            endpoint=current_endpoint(),
+            outcome=outcome,
+        )
+        retry_after = math.ceil(self._estimated_wait() or 1)
+        return HTTPException(
+            status_code=status_code,
+            detail=detail,
+            headers={'Retry-After': str(retry_after)},
+        )
+
+    def _session_busy(self, start: float) -> HTTPException:
+        self.stats.rejected_session += 1
+        return self._reject(
+            429,
+            'Já existe um turno em andamento nesta sessão',
+            start,
+            'rejected',
+        )
+
+    async def _acquire_session(self, session_key: int, start: float):
+        gate = self._sessions.get(session_key)
+        if gate is None:
+            gate = self._sessions[session_key] = _Gate(1, self.session_queue)
+        try:
+            await gate.acquire(self.max_wait)
+        except (_QueueFull, asyncio.TimeoutError):
+            raise self._session_busy(start)
+        finally:
+            if gate.idle:
+                self._sessions.pop(session_key, None)
+
+    async def _claim_lease(
+        self, session_key: int, start: float
+    ) -> Optional[str]:
+        """Lease da sessão entre workers (429 se outro worker tem o turno)"""
+        try:
+            lease = await self.leases.claim(session_key)
+        except Exception:
+            # Sem o banco, vale só a regra do worker
+            logger.exception('Could not claim session lease %s', session_key)
+            return None
+        if lease is None:
+            raise self._session_busy(start)
+        return lease
+
+    def _release_session(self, session_key: int) -> None:
+        gate = self._sessions.get(session_key)
+        if gate is None:
+            return
+        gate.release()
+        if gate.idle:
+            del self._sessions[session_key]
+
+    async def acquire(
+        self, session_key: Optional[int] = None
+    ) -> AdmissionTicket:
+        start = time.perf_counter()
+        ADMISSION_QUEUE_DEPTH.observe(
+            len(self._global.waiters), endpoint=current_endpoint()
+        )
+
+        if session_key is not None:
+            await self._acquire_session(session_key, start)
+
+        lease = None
+        try:
+            if session_key is not None and self.leases is not None:
+                lease = await self._claim_lease(session_key, start)
+            remaining = self.max_wait - (time.perf_counter() - start)
+            if not self._global.try_acquire():
+                if self._estimated_wait() > remaining:
+                    self.stats.rejected_deadline += 1
+                    raise self._reject(
+                        503,
+                        'Servidor ocupado, tente novamente em instantes',
+                        start,
+                        'rejected',
+                    )
+                try:
+                    await self._global.acquire(remaining)
+                except _QueueFull:
+                    self.stats.rejected_queue_full += 1
+                    raise self._reject(
+                        503,
+                        'Servidor ocupado, tente novamente em instantes',
+                        start,
+                        'rejected',
+                    )
+                except asyncio.TimeoutError:
+                    self.stats.timeouts += 1
+                    raise self._reject(
+                        503,
+                        'Servidor ocupado, tente novamente em instantes',
+                        start,
+                        'timeout',
+                    )
+        except BaseException:
+            if session_key is not None:
+                self._release_session(session_key)
+            if lease is not None:
+                spawn(self.leases.release(session_key, lease))
+            raise
+
+        self.stats.admitted += 1
+        ADMISSION_WAIT_DURATION.observe(
+            time.perf_counter() - start,
+            endpoint=current_endpoint(),
+            outcome='admitted',
+        )
+        return AdmissionTicket(
+            controller=self, session_key=session_key, lease=lease
+        )
+
+    def _release(self, ticket: AdmissionTicket) -> None:
+        duration = time.perf_counter() - ticket.admitted_at
+        self.service_time = (
+            duration
+            if self.service_time is None
+            else SERVICE_TIME_EWMA_WEIGHT * duration
+            + (1 - SERVICE_TIME_EWMA_WEIGHT) * self.service_time
+        )
+        self._global.release()
+        if ticket.session_key is not None:
+            self._release_session(ticket.session_key)
+
+
+admission = AdmissionController(
+    max_in_flight=settings.ADMISSION_MAX_IN_FLIGHT,
+    max_queue=settings.ADMISSION_MAX_QUEUE,
+    max_wait=settings.ADMISSION_MAX_WAIT,
+    session_queue=settings.ADMISSION_SESSION_QUEUE,
+    leases=SessionLeases(
+        session_maker=async_session_maker,
+        ttl=settings.ADMISSION_SESSION_LEASE_TTL,
+    ),
+)
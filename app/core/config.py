@@ -7,6 +7,7 @@ load_dotenv()
 
 LLM_LLAMA_33_70B_INSTRUCT: str = 'meta/llama-3.3-70b-instruct'
 GEMINI_2_0_FLASH: str = 'gemini-2.0-flash'
+GEMINI_2_5_FLASH: str = 'gemini-2.5-flash'
 
 LLM_PARAMETERS = {
     LLM_LLAMA_33_70B_INSTRUCT: {
@@ -19,10 +20,23 @@ LLM_PARAMETERS = {
         'temperature': 0.3,
         'context_length': 500000,
     },
+    GEMINI_2_5_FLASH: {
+        'max_tokens': 12000,
+        'temperature': 0.3,
+        'context_length': 1000000,
+    },
 }
 
 NVIDIA_CHAT_MODELS = [LLM_LLAMA_33_70B_INSTRUCT]
-GOOGLE_CHAT_MODELS = [GEMINI_2_0_FLASH]
+GOOGLE_CHAT_MODELS = [GEMINI_2_0_FLASH, GEMINI_2_5_FLASH]
+
+DEFAULT_AGNO_MODEL = GEMINI_2_5_FLASH
+
+# Rota do LangChain: o modelo pedido primeiro, depois os demais (um por
+# provedor) para hedge e failover
+LANGCHAIN_ROUTE_MODELS = [GEMINI_2_0_FLASH, LLM_LLAMA_33_70B_INSTRUCT]
+# Rota dos agentes do agno (analisador, professor, resumo da memória)
+AGNO_ROUTE_MODELS = [DEFAULT_AGNO_MODEL, LLM_LLAMA_33_70B_INSTRUCT]
 
 
 class Settings(BaseSettings):
@@ -43,8 +57,134 @@ class Settings(BaseSettings):
     def sqlalchemy_db_uri(self) -> str:
         return f'postgresql://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_SERVER}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}'
 
+    @computed_field
+    @property
+    def sqlalchemy_async_db_uri(self) -> str:
+        return f'postgresql+psycopg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_SERVER}:{self.POSTGRES_PORT}/{self.POSTGRES_DB}'
+
+    # Pools de conexão, por worker. No máximo, cada worker abre
+    # DB_POOL_SIZE + DB_MAX_OVERFLOW conexões no engine assíncrono
+    # (endpoints, writer, índice de similaridade) e DB_SYNC_POOL_SIZE +
+    # DB_SYNC_MAX_OVERFLOW no síncrono (só o storage de sessões do agno e o
+    # que ainda é síncrono): 16 + 4 = 20 por worker, 80 com `--workers 4`,
+    # abaixo do `max_connections=100` padrão do PostgreSQL
+    DB_POOL_SIZE: int = 8
+    DB_MAX_OVERFLOW: int = 8
+    DB_SYNC_POOL_SIZE: int = 2
+    DB_SYNC_MAX_OVERFLOW: int = 2
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+
     NVIDIA_NIM_API_KEY: str = ''
     GEMINI_API_KEY: str = ''
 
+    # Cache de análises de código (LRU em memória + tabela code_analysis)
+    ANALYSIS_CACHE_MAX_ENTRIES: int = 1024
+    ANALYSIS_CACHE_TTL: int = 3600
+    ANALYSIS_CACHE_DB_TTL: int = 7 * 24 * 3600
+
+    # Análise rápida (`AnaliseRapida`): limite de tokens de saída e de
+    # raciocínio (thinking) do Gemini 2.5
+    QUICK_ANALYSIS_MAX_TOKENS: int = 1024
+    QUICK_ANALYSIS_THINKING_BUDGET: int = 0
+
+    # Índice de códigos quase idênticos (MinHash/LSH, por worker): análises
+    # de códigos com similaridade a partir de SIMILARITY_THRESHOLD são
+    # adaptadas por um prompt curto; a partir de SIMILARITY_REUSE_THRESHOLD
+    # (com os nomes originais e a mesma pergunta) são reaproveitadas sem
+    # LLM. O snapshot em SIMILARITY_INDEX_PATH (vazio = sem snapshot)
+    # acelera a subida
+    SIMILARITY_INDEX_ENABLED: bool = True
+    SIMILARITY_THRESHOLD: float = 0.8
+    SIMILARITY_REUSE_THRESHOLD: float = 0.95
+    SIMILARITY_NUM_PERM: int = 64
+    SIMILARITY_BANDS: int = 8
+    SIMILARITY_SHINGLE_SIZE: int = 5
+    SIMILARITY_MIN_TOKENS: int = 20
+    SIMILARITY_INDEX_MAX_ENTRIES: int = 20000
+    SIMILARITY_INDEX_PATH: str = '.cache/similarity_index.bin'
+    SIMILARITY_INDEX_REFRESH: float = 60.0
+
+    # Código Python que não compila recebe a análise montada localmente
+    # (pré-análise estática), sem chamar o LLM analisador
+    STATIC_ANALYSIS_LOCAL_ANSWER: bool = True
+
+    # Gravação assíncrona (write-behind) dos turnos de tutoria
+    WRITE_BEHIND_MAX_PENDING: int = 1000
+    WRITE_BEHIND_BATCH_SIZE: int = 100
+    MESSAGE_ID_BLOCK_SIZE: int = 50
+
+    # Orçamento de tokens de entrada por chamada ao modelo
+    TOKEN_BUDGET_MAX_INPUT_TOKENS: int = 60000
+    # Código maior que limite * fator é rejeitado (413) sem tokenizar
+    TOKEN_BUDGET_HOPELESS_FACTOR: float = 4.0
+    # Tokenizer do Hugging Face para contagem exata (vazio = aproximação)
+    TOKENIZER_NAME: str = ''
+
+    # Admissão de turnos de `/call/agno/` (por worker): turnos simultâneos,
+    # fila de espera limitada e espera máxima antes de 503. Por sessão, um
+    # turno ativo e até ADMISSION_SESSION_QUEUE na fila (0 = 429 imediato)
+    ADMISSION_MAX_IN_FLIGHT: int = 32
+    ADMISSION_MAX_QUEUE: int = 64
+    ADMISSION_MAX_WAIT: float = 10.0
+    ADMISSION_SESSION_QUEUE: int = 0
+    # Validade do lease de sessão entre workers (`session_turn_leases`):
+    # o de um worker que caiu no meio do turno é liberado após este tempo
+    ADMISSION_SESSION_LEASE_TTL: float = 600.0
+
+    # Intervalo dos heartbeats do modo SSE de `/call/agno/` (segundos sem
+    # eventos antes de um comentário `: ping`)
+    SSE_HEARTBEAT_INTERVAL: float = 15.0
+
+    # Streams retomáveis de `/call/agno/` (por worker): a geração segue sem
+    # cliente conectado por STREAM_RESUME_GRACE s; terminado o turno, os
+    # eventos ficam STREAM_RESUME_TTL s disponíveis para reconexão
+    STREAM_RESUME_GRACE: float = 30.0
+    STREAM_RESUME_TTL: float = 300.0
+    STREAM_RESUME_MAX_STREAMS: int = 1000
+    # Identificador do worker nos headers de retomada (`X-Stream-Worker`),
+    # para o proxy encaminhar a retomada ao worker que tem o buffer. Vazio
+    # = `host-pid`; só configure com um worker por instância
+    STREAM_WORKER_ID: str = ''
+
+    # Roteamento entre provedores (Gemini e NVIDIA): sem resposta após
+    # LLM_HEDGE_DELAY s (0 desliga), um segundo pedido vai para o próximo
+    # provedor e vale o que responder primeiro; erro ou LLM_REQUEST_TIMEOUT
+    # sem resposta levam ao próximo (failover). Após
+    # LLM_CIRCUIT_FAILURE_THRESHOLD falhas seguidas o provedor fica fora
+    # por LLM_CIRCUIT_RESET_TIMEOUT s (circuit breaker)
+    LLM_HEDGE_DELAY: float = 2.0
+    LLM_REQUEST_TIMEOUT: float = 30.0
+    LLM_CIRCUIT_FAILURE_THRESHOLD: int = 3
+    LLM_CIRCUIT_RESET_TIMEOUT: float = 30.0
+    # Hedge e timeout das chamadas sem streaming dos agentes do agno (ex.:
+    # a análise inteira em JSON), que demoram mais que um primeiro chunk
+    LLM_RESPONSE_HEDGE_DELAY: float = 20.0
+    LLM_RESPONSE_TIMEOUT: float = 120.0
+
+    # Correção em lote (`/call/agno/batch/`): itens por pedido, análises
+    # simultâneas no worker (somando todos os lotes) e turnos gravados por
+    # insert em massa
+    BATCH_GRADING_MAX_ITEMS: int = 200
+    BATCH_GRADING_CONCURRENCY: int = 8
+    BATCH_GRADING_FLUSH_SIZE: int = 25
+
+    # Memória das sessões do agno: turnos recentes repassados ao modelo,
+    # limite de tokens desse histórico e runs guardados por agente antes
+    # de os antigos serem resumidos (em segundo plano) e removidos
+    TEACHER_MEMORY_HISTORY_TURNS: int = 3
+    ANALYSER_MEMORY_HISTORY_TURNS: int = 0
+    MEMORY_HISTORY_MAX_TOKENS: int = 4000
+    MEMORY_MAX_STORED_RUNS: int = 8
+    MEMORY_SUMMARY_ENABLED: bool = True
+    MEMORY_SUMMARY_MAX_TOKENS: int = 600
+
+    # Importa provedores/SDKs no master do gunicorn antes do fork
+    PRELOAD_MODULES: bool = True
+
+    # Telemetria do agno faz uma chamada HTTP extra ao final de cada run
+    AGNO_TELEMETRY: bool = False
+
 
 settings = Settings()
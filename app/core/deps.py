@@ -1,13 +1,39 @@
-from collections.abc import Generator
+from collections.abc import AsyncGenerator, Generator
 from typing import Annotated
 
 from fastapi import Depends
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.core.config import settings
 
-engine = create_engine(str(settings.sqlalchemy_db_uri))
+pool_options = {
+    'pool_timeout': settings.DB_POOL_TIMEOUT,
+    'pool_recycle': settings.DB_POOL_RECYCLE,
+    'pool_pre_ping': settings.DB_POOL_PRE_PING,
+}
+
+# Storage de sessões do agno e rotas legadas: poucas conexões, usadas em
+# threads e por pouco tempo
+engine = create_engine(
+    str(settings.sqlalchemy_db_uri),
+    pool_size=settings.DB_SYNC_POOL_SIZE,
+    max_overflow=settings.DB_SYNC_MAX_OVERFLOW,
+    **pool_options,
+)
+
+async_engine = create_async_engine(
+    str(settings.sqlalchemy_async_db_uri),
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    **pool_options,
+)
+
+async_session_maker = async_sessionmaker(
+    async_engine, class_=AsyncSession, expire_on_commit=False
+)
 
 
 def get_db() -> Generator[Session, None, None]:
@@ -15,4 +41,26 @@ def get_db() -> Generator[Session, None, None]:
         yield session
 
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with async_session_maker() as session:
+        yield session
+
+
+def get_pool_status() -> dict:
+    """Métricas dos pools de conexão deste worker."""
+    return {
+        name: {
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow(),
+        }
+        for name, pool in (
+            ('sync', engine.pool),
+            ('async', async_engine.pool),
+        )
+    }
+
+
 SessionDep = Annotated[Session, Depends(get_db)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_db)]
@@ -0,0 +1,338 @@
+import asyncio
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from starlette.exceptions import HTTPException
+
+# Buckets (em segundos) pensados para turnos de tutoria, que vão de
+# milissegundos (cache) a dezenas de segundos (LLM)
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60, 120,
+)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+CHAR_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000)
+BATCH_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500)
+
+# Escopo ASGI da requisição atual (preenchido pelo `MetricsMiddleware`);
+# a rota só é conhecida depois do roteamento, então o label do endpoint é
+# lido do escopo no momento da medição
+_request_scope: ContextVar[Optional[dict]] = ContextVar(
+    'metrics_request_scope', default=None
+)
+
+
+def _escape(value: str) -> str:
+    return (
+        value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+    )
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    Histograma no formato do Prometheus, sem dependências externas.
+
+    `observe` faz uma busca binária nos buckets e incrementa contadores
+    (custo de poucos microssegundos); os valores acumulados só são
+    calculados em `render`.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str],
+        buckets: Sequence[float] = DURATION_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [contagem por bucket (+Inf no fim), soma, total]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._series[key] = series
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> List[str]:
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} histogram',
+        ]
+        with self._lock:
+            snapshot = [
+                (key, list(series[0]), series[1], series[2])
+                for key, series in sorted(self._series.items())
+            ]
+
+        for key, counts, total, count in snapshot:
+            labels = ','.join(
+                f'{name}="{_escape(value)}"'
+                for name, value in zip(self.labelnames, key)
+            )
+            prefix = f'{labels},' if labels else ''
+            cumulative = 0
+            for bound, bucket_count in zip(
+                (*self.buckets, float('inf')), counts
+            ):
+                cumulative += bucket_count
+                lines.append(
+                    f'{self.name}_bucket{{{prefix}le="{_format_value(bound)}"}}'
+                    f' {cumulative}'
+                )
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: Dict[str, Histogram] = {}
+
+    def histogram(self, name: str, documentation: str, labelnames, **kwargs):
+        metric = Histogram(name, documentation, labelnames, **kwargs)
+        self.metrics[name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+HTTP_REQUEST_DURATION = registry.histogram(
+    'http_request_duration_seconds',
+    'Tempo total da requisição, incluindo o corpo em streaming',
+    ('endpoint', 'method', 'status'),
+)
+HTTP_TIME_TO_FIRST_BYTE = registry.histogram(
+    'http_time_to_first_byte_seconds',
+    'Tempo até o primeiro byte do corpo da resposta',
+    ('endpoint', 'method', 'status'),
+)
+STAGE_DURATION = registry.histogram(
+    'tutoring_stage_duration_seconds',
+    'Duração de cada etapa de um turno de tutoria',
+    ('endpoint', 'stage', 'model', 'outcome'),
+)
+LLM_TIME_TO_FIRST_TOKEN = registry.histogram(
+    'llm_time_to_first_token_seconds',
+    'Tempo até o primeiro token das respostas em streaming',
+    ('endpoint', 'stage', 'model'),
+)
+LLM_PROMPT_TOKENS = registry.histogram(
+    'llm_prompt_tokens',
+    'Tokens de entrada por chamada ao LLM (estimados pelo TokenBudget)',
+    ('endpoint', 'stage', 'model'),
+    buckets=TOKEN_BUCKETS,
+)
+LLM_OUTPUT_CHARS = registry.histogram(
+    'llm_output_chars',
+    'Caracteres gerados por chamada ao LLM',
+    ('endpoint', 'stage', 'model', 'outcome'),
+    buckets=CHAR_BUCKETS,
+)
+LLM_TOKENS = registry.histogram(
+    'llm_tokens',
+    'Tokens por chamada ao LLM informados pelo provedor (input/output)',
+    ('endpoint', 'stage', 'model', 'kind'),
+    buckets=TOKEN_BUCKETS,
+)
+LLM_PROVIDER_ATTEMPT_DURATION = registry.histogram(
+    'llm_provider_attempt_seconds',
+    'Tempo até a resposta (ou primeiro token) de cada tentativa por '
+    'provedor: primary, hedge ou failover',
+    ('endpoint', 'provider', 'model', 'kind', 'outcome'),
+)
+ADMISSION_WAIT_DURATION = registry.histogram(
+    'admission_wait_seconds',
+    'Espera na fila de admissão por turno (admitted, rejected, timeout)',
+    ('endpoint', 'outcome'),
+)
+ADMISSION_QUEUE_DEPTH = registry.histogram(
+    'admission_queue_depth',
+    'Turnos já na fila de admissão quando um novo turno chega',
+    ('endpoint',),
+    buckets=(0, *BATCH_BUCKETS),
+)
+WRITE_BEHIND_FLUSH_DURATION = registry.histogram(
+    'write_behind_flush_seconds',
+    'Duração da gravação de um lote de turnos de tutoria',
+    ('outcome',),
+)
+WRITE_BEHIND_BATCH_SIZE = registry.histogram(
+    'write_behind_batch_size',
+    'Turnos gravados por lote',
+    ('outcome',),
+    buckets=BATCH_BUCKETS,
+)
+
+
+def current_endpoint() -> str:
+    """Template da rota da requisição atual (ex.: `/call/agno/`)."""
+    scope = _request_scope.get()
+    if scope is None:
+        return ''
+    route = scope.get('route')
+    # Rotas desconhecidas ficam agrupadas para não explodir a cardinalidade
+    return getattr(route, 'path', None) or 'unmatched'
+
+
+def outcome_of(exc: Optional[BaseException]) -> str:
+    if exc is None:
+        return 'ok'
+    if isinstance(exc, (asyncio.CancelledError, GeneratorExit)):
+        return 'cancelled'
+    if isinstance(exc, HTTPException) and exc.status_code < 500:
+        return 'rejected'
+    return 'error'
+
+
+@contextmanager
+def span(stage: str, *, model: str = ''):
+    """Mede a duração de uma etapa (`with span('analyser', model=...)`)."""
+    start = time.perf_counter()
+    exc = None
+    try:
+        yield
+    except BaseException as e:
+        exc = e
+        raise
+    finally:
+        STAGE_DURATION.observe(
+            time.perf_counter() - start,
+            endpoint=current_endpoint(),
+            stage=stage,
+            model=model,
+            outcome=outcome_of(exc),
+        )
+
+
+def observe_llm_call(
+    stage: str,
+    *,
+    model: str,
+    chars: int,
+    input_tokens: int = 0,
+    output_tokens: int = 0,
+) -> None:
+    """Registra o tamanho da saída e os tokens informados pelo provedor."""
+    endpoint = current_endpoint()
+    LLM_OUTPUT_CHARS.observe(
+        chars, endpoint=endpoint, stage=stage, model=model, outcome='ok'
+    )
+    for kind, tokens in (('input', input_tokens), ('output', output_tokens)):
+        if tokens:
+            LLM_TOKENS.observe(
+                tokens, endpoint=endpoint, stage=stage, model=model, kind=kind
+            )
+
+
+async def instrument_stream(
+    stream: AsyncIterator[str], *, stage: str, model: str
+) -> AsyncIterator[str]:
+    """
+    Repassa um stream de texto do LLM medindo o tempo até o primeiro
+    token, a duração total e os caracteres gerados.
+    """
+    endpoint = current_endpoint()
+    start = time.perf_counter()
+    first_token = True
+    chars = 0
+    exc = None
+    try:
+        async for chunk in stream:
+            if first_token:
+                first_token = False
+                LLM_TIME_TO_FIRST_TOKEN.observe(
+                    time.perf_counter() - start,
+                    endpoint=endpoint,
+                    stage=stage,
+                    model=model,
+                )
+            chars += len(chunk)
+            yield chunk
+    except BaseException as e:
+        exc = e
+        raise
+    finally:
+        outcome = outcome_of(exc)
+        STAGE_DURATION.observe(
+            time.perf_counter() - start,
+            endpoint=endpoint,
+            stage=stage,
+            model=model,
+            outcome=outcome,
+        )
+        LLM_OUTPUT_CHARS.observe(
+            chars, endpoint=endpoint, stage=stage, model=model, outcome=outcome
+        )
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI que mede a duração e o TTFB de cada requisição e
+    expõe o escopo para os labels de endpoint das etapas internas.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        token = _request_scope.set(scope)
+        start = time.perf_counter()
+        status = 500
+        first_byte = None
+
+        async def send_with_metrics(message):
+            nonlocal status, first_byte
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif first_byte is None and message.get('body'):
+                first_byte = time.perf_counter()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            labels = {
+                'endpoint': current_endpoint(),
+                'method': scope['method'],
+                'status': str(status),
+            }
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start, **labels
+            )
+            if first_byte is not None:
+                HTTP_TIME_TO_FIRST_BYTE.observe(first_byte - start, **labels)
+            _request_scope.reset(token)
@@ -0,0 +1,57 @@
+import gc
+import importlib
+import time
+from typing import Dict, Iterable
+
+from app.core.config import settings
+
+# Módulos pesados usados pelos workers (framework, provedores de LLM, SDKs
+# e drivers). Nenhum módulo da aplicação entra aqui: eles criam engines
+# e pools de conexão, que não devem ser compartilhados entre processos.
+PRELOAD_MODULES = (
+    'fastapi',
+    'sqlmodel',
+    'sqlalchemy.ext.asyncio',
+    'agno.agent',
+    'agno.db.postgres',
+    'agno.models.google',
+    'agno.models.nvidia',
+    'langchain_core.output_parsers',
+    'langchain_core.runnables',
+    'langchain_google_genai',
+    'langchain_nvidia_ai_endpoints',
+    'psycopg',
+    'psycopg2',
+)
+
+
+def preload_modules(
+    modules: Iterable[str] = PRELOAD_MODULES,
+) -> Dict[str, float]:
+    """
+    Importa os módulos pesados uma vez no processo master do gunicorn, antes
+    do fork, para que os workers compartilhem essas páginas de memória
+    (copy-on-write) e não paguem o import no boot ou na primeira requisição.
+
+    Returns:
+            Tempo de import (s) de cada módulo
+    """
+    timings = {}
+    for module in modules:
+        start = time.perf_counter()
+        importlib.import_module(module)
+        timings[module] = time.perf_counter() - start
+
+    if settings.TOKENIZER_NAME:
+        from app.llm.utils.budget import get_token_counter
+
+        start = time.perf_counter()
+        get_token_counter()
+        timings[f'tokenizer:{settings.TOKENIZER_NAME}'] = (
+            time.perf_counter() - start
+        )
+
+    # Move os objetos já criados para a geração permanente: o GC dos
+    # workers não os percorre e não "suja" as páginas compartilhadas
+    gc.freeze()
+    return timings
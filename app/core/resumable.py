@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, AsyncIterator, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.tasks import spawn
+
+logger = logging.getLogger(__name__)
+
+# (evento, dados) gerados pelo pipeline de um turno
+StreamEvent = Tuple[str, Any]
+
+
+class ResumableStream:
+    """
+    Eventos de um turno gerados uma vez e lidos por quantos clientes
+    vierem, cada um a partir do seu ponto.
+
+    O produtor roda numa task própria, independente da conexão HTTP: o
+    evento de número `seq` (a partir de 1) fica em `events[seq - 1]` e
+    `subscribe(after)` repassa os eventos depois de `after` e segue até o
+    fim. Sem nenhum cliente conectado por `grace` segundos, a geração é
+    cancelada (o `finally` do produtor ainda roda).
+    """
+
+    def __init__(
+        self,
+        key: int,
+        producer: AsyncIterator[StreamEvent],
+        *,
+        grace: float,
+        on_finish=None,
+    ):
+        self.key = key
+        self.grace = grace
+        self.events: List[StreamEvent] = []
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.subscribers = 0
+        self._changed = asyncio.Event()
+        self.abandoned = False
+        self._on_finish = on_finish
+        self._grace_timer: Optional[asyncio.TimerHandle] = None
+        # Até o primeiro cliente chegar também vale o prazo
+        self._start_grace()
+        self._task = spawn(self._produce(producer))
+
+    async def _produce(self, producer: AsyncIterator[StreamEvent]) -> None:
+        try:
+            async for event in producer:
+                self.events.append(event)
+                self._notify()
+        finally:
+            self.done = True
+            self.finished_at = time.monotonic()
+            self._cancel_grace()
+            self._notify()
+            if self._on_finish is not None:
+                self._on_finish(self)
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _start_grace(self) -> None:
+        self._grace_timer = asyncio.get_running_loop().call_later(
+            self.grace, self._abandon
+        )
+
+    def _cancel_grace(self) -> None:
+        if self._grace_timer is not None:
+            self._grace_timer.cancel()
+            self._grace_timer = None
+
+    def _abandon(self) -> None:
+        self._grace_timer = None
+        if not self.done and self.subscribers == 0:
+            logger.info(
+                'Stream %s abandoned after %.0fs without clients',
+                self.key,
+                self.grace,
+            )
+            self.abandoned = True
+            self._task.cancel()
+
+    async def subscribe(
+        self, after: int = 0
+    ) -> AsyncIterator[Tuple[int, str, Any]]:
+        """(seq, evento, dados) depois de `after`, até o fim do stream"""
+        self.subscribers += 1
+        self._cancel_grace()
+        try:
+            position = max(after, 0)
+            while True:
+                if position < len(self.events):
+                    position += 1
+                    event, data = self.events[position - 1]
+                    yield position, event, data
+                    continue
+                if self.done:
+                    return
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                self._start_grace()
+
+
+@dataclass
+class StreamRegistryStats:
+    started: int = 0
+    completed: int = 0
+    abandoned: int = 0
+    resumed: int = 0
+    evicted: int = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class StreamRegistry:
+    """
+    Streams retomáveis deste worker, pelo id da mensagem do aluno
+    (`student_messages.id`).
+
+    Streams terminados ficam disponíveis por `ttl` segundos para quem
+    reconectar; acima de `max_streams`, os terminados mais antigos saem
+    antes. Em memória e por worker: a retomada precisa chegar ao mesmo
+    worker, identificado por `worker_id` (senão o turno é lido do
+    histórico, depois de gravado).
+    """
+
+    def __init__(
+        self,
+        *,
+        grace: float,
+        ttl: float,
+        max_streams: int,
+        worker_id: str = '',
+    ):
+        self.grace = grace
+        self.ttl = ttl
+        self.max_streams = max_streams
+        self._worker_id = worker_id
+        self._streams: 'OrderedDict[int, ResumableStream]' = OrderedDict()
+        self.stats = StreamRegistryStats()
+
+    @property
+    def worker_id(self) -> str:
+        """Worker dono dos buffers (configurado ou `host-pid`)"""
+        # Calculado na hora: com `--preload` o módulo é importado no
+        # master, antes do fork dos workers
+        return self._worker_id or f'{socket.gethostname()}-{os.getpid()}'
+
+    def start(
+        self, key: int, producer: AsyncIterator[StreamEvent]
+    ) -> ResumableStream:
+        self._evict(incoming=1)
+        stream = ResumableStream(
+            key, producer, grace=self.grace, on_finish=self._finished
+        )
+        self._streams[key] = stream
+        self.stats.started += 1
+        return stream
+
+    def get(self, key: int) -> Optional[ResumableStream]:
+        self._evict()
+        stream = self._streams.get(key)
+        if stream is not None:
+            self.stats.resumed += 1
+        return stream
+
+    def status(self) -> dict:
+        running = sum(
+            1 for stream in self._streams.values() if not stream.done
+        )
+        return {
+            **self.stats.as_dict(),
+            'worker': self.worker_id,
+            'running': running,
+            'buffered': len(self._streams),
+            'buffered_events': sum(
+                len(stream.events) for stream in self._streams.values()
+            ),
+        }
+
+    def _finished(self, stream: ResumableStream) -> None:
+        if stream.abandoned:
+            self.stats.abandoned += 1
+        else:
+            self.stats.completed += 1
+
+    def _evict(self, incoming: int = 0) -> None:
+        now = time.monotonic()
+        finished = [
+            key for key, stream in self._streams.items() if stream.done
+        ]
+        overflow = len(self._streams) + incoming - self.max_streams
+        for key in finished:
+            stream = self._streams[key]
+            if overflow > 0 or now - stream.finished_at > self.ttl:
+                del self._streams[key]
+                self.stats.evicted += 1
+                overflow -= 1
+
+
+streams = StreamRegistry(
+    grace=settings.STREAM_RESUME_GRACE,
+    ttl=settings.STREAM_RESUME_TTL,
+    max_streams=settings.STREAM_RESUME_MAX_STREAMS,
+    worker_id=settings.STREAM_WORKER_ID,
+)
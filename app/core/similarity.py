@@ -0,0 +1,413 @@
+import asyncio
+import logging
+import os
+import pickle
+import random
+import re
+import time
+import zlib
+from array import array
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core.config import settings
+from app.core.deps import async_session_maker
+from app.models import CodeAnalysis, StudentMessage
+
+logger = logging.getLogger(__name__)
+
+# Muda quando o tokenizer ou o cálculo das assinaturas mudar (invalida os
+# snapshots antigos)
+INDEX_VERSION = 1
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_PERMUTATION_SEED = 1729
+
+# Strings e comentários antes dos demais tokens, para que um `#` dentro de
+# uma string não seja tomado por comentário
+_TOKEN = re.compile(
+    r'(?P<string>"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\')'
+    r'|(?P<comment>#[^\n]*|//[^\n]*|/\*.*?\*/)'
+    r'|(?P<word>[A-Za-z_]\w*)'
+    r'|(?P<number>\d+(?:\.\d+)?)'
+    r'|(?P<symbol>\S)',
+    re.S,
+)
+
+# Palavras-chave e funções comuns das linguagens das aulas: ficam como
+# estão; os demais identificadores são renomeados pela ordem de aparição
+KEYWORDS = frozenset(
+    """
+    and as assert async await break case catch char class const continue
+    def default del do double elif else enum except extends false final
+    finally float for from function global if implements import in int
+    instanceof interface is lambda let long new nonlocal not null or pass
+    private protected public raise return short static struct super switch
+    this throw throws try typeof var void while with yield True False None
+    bool boolean string str list dict set tuple print len range input open
+    map filter zip sorted sum min max abs enumerate isinstance append
+    printf scanf cout cin endl console log main std include
+    """.split()
+)
+
+
+def code_tokens(code: str, *, abstract: bool) -> List[str]:
+    """
+    Tokens do código, sem comentários nem espaços.
+
+    Com `abstract`, identificadores viram `v0`, `v1`, ... (pela ordem de
+    aparição) e strings viram `"s"`, então renomear variáveis ou mudar
+    mensagens não altera a sequência.
+    """
+    names: Dict[str, str] = {}
+    tokens = []
+    for match in _TOKEN.finditer(code):
+        kind = match.lastgroup
+        if kind == 'comment':
+            continue
+        text = match.group()
+        if abstract:
+            if kind == 'string':
+                text = '"s"'
+            elif kind == 'word' and text not in KEYWORDS:
+                text = names.setdefault(text, f'v{len(names)}')
+        tokens.append(text)
+    return tokens
+
+
+def shingles(tokens: Sequence[str], size: int) -> Set[int]:
+    """Hashes (crc32, estáveis entre processos) das janelas de tokens"""
+    if len(tokens) < size:
+        return {zlib.crc32(' '.join(tokens).encode())} if tokens else set()
+    return {
+        zlib.crc32(' '.join(tokens[start:start + size]).encode())
+        for start in range(len(tokens) - size + 1)
+    }
+
+
+def jaccard(first: Set[int], second: Set[int]) -> float:
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+
+@dataclass
+class SimilarityStats:
+    lookups: int = 0
+    matches: int = 0
+    reused: int = 0
+    adapted: int = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class SimilarityIndex:
+    """
+    Índice local de códigos quase idênticos (MinHash + LSH) sobre o
+    `StudentMessage.code` das mensagens que já têm análise.
+
+    Cada código vira um conjunto de shingles dos tokens abstraídos
+    (`code_tokens(abstract=True)`), resumido numa assinatura MinHash de
+    `num_perm` valores de 32 bits. A assinatura é dividida em `bands`
+    faixas; códigos com alguma faixa idêntica são candidatos, e ficam os
+    que têm similaridade estimada (fração de valores iguais) a partir de
+    `threshold`.
+
+    - incremental: `aadd` a cada lote gravado pelo writer e, a cada
+      `refresh_interval` segundos, as análises novas do banco (gravadas por
+      outros workers), pelo `CodeAnalysis.id`;
+    - boot rápido: as assinaturas ficam num snapshot em `path`, gravado no
+      shutdown; na subida só as análises posteriores a ele são lidas do
+      banco, em segundo plano;
+    - memória limitada: até `max_entries` mensagens, saindo as mais
+      antigas.
+
+    Por worker e sem rede ou GPU. Uma análise que escape do índice (ex.:
+    gravada fora de ordem por outro worker) só custa a chamada ao LLM.
+    """
+
+    def __init__(
+        self,
+        *,
+        session_maker: async_sessionmaker,
+        num_perm: int,
+        bands: int,
+        shingle_size: int,
+        min_tokens: int,
+        threshold: float,
+        max_entries: int,
+        path: str,
+        refresh_interval: float,
+    ):
+        if num_perm % bands:
+            raise ValueError('num_perm must be a multiple of bands')
+        self.session_maker = session_maker
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.min_tokens = min_tokens
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.stats = SimilarityStats()
+
+        generator = random.Random(_PERMUTATION_SEED)
+        self._permutations = [
+            (
+                generator.randrange(1, _MERSENNE_PRIME),
+                generator.randrange(0, _MERSENNE_PRIME),
+            )
+            for _ in range(num_perm)
+        ]
+        self._signatures: 'OrderedDict[int, array]' = OrderedDict()
+        self._buckets: Dict[int, List[int]] = {}
+        # Maior `CodeAnalysis.id` já lido do banco
+        self._cursor = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    @property
+    def params(self) -> tuple:
+        return (INDEX_VERSION, self.num_perm, self.bands, self.shingle_size)
+
+    def status(self) -> dict:
+        return {
+            **self.stats.as_dict(),
+            'entries': len(self._signatures),
+            'buckets': len(self._buckets),
+        }
+
+    # Assinaturas (CPU; fora do event loop para lotes e códigos grandes)
+
+    def signature(self, code: str) -> Optional[array]:
+        """Assinatura MinHash do código (None se curto demais)"""
+        tokens = code_tokens(code, abstract=True)
+        if len(tokens) < self.min_tokens:
+            return None
+        hashes = shingles(tokens, self.shingle_size)
+        prime = _MERSENNE_PRIME
+        return array(
+            'I',
+            (
+                min([(a * x + b) % prime for x in hashes]) & _MAX_HASH
+                for a, b in self._permutations
+            ),
+        )
+
+    def raw_similarity(self, first: str, second: str) -> float:
+        """
+        Jaccard exato dos shingles com os identificadores originais (só
+        comentários e espaços ignorados).
+        """
+        return jaccard(
+            shingles(code_tokens(first, abstract=False), self.shingle_size),
+            shingles(code_tokens(second, abstract=False), self.shingle_size),
+        )
+
+    def _band_keys(self, signature: array) -> Iterable[int]:
+        rows = self.rows
+        for band in range(self.bands):
+            yield hash(
+                (band, signature[band * rows:(band + 1) * rows].tobytes())
+            )
+
+    # Índice (só no event loop)
+
+    def add(self, message_id: int, signature: Optional[array]) -> None:
+        if signature is None or message_id in self._signatures:
+            return
+        self._signatures[message_id] = signature
+        for key in self._band_keys(signature):
+            self._buckets.setdefault(key, []).append(message_id)
+        while len(self._signatures) > self.max_entries:
+            self._remove(next(iter(self._signatures)))
+
+    def _remove(self, message_id: int) -> None:
+        signature = self._signatures.pop(message_id)
+        for key in self._band_keys(signature):
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                continue
+            bucket.remove(message_id)
+            if not bucket:
+                del self._buckets[key]
+
+    def query(
+        self, signature: Optional[array], limit: int = 5
+    ) -> List[Tuple[int, float]]:
+        """(message_id, similaridade estimada) a partir do `threshold`"""
+        self.stats.lookups += 1
+        if signature is None:
+            return []
+        candidates: Set[int] = set()
+        for key in self._band_keys(signature):
+            candidates.update(self._buckets.get(key, ()))
+
+        scored = []
+        for message_id in candidates:
+            other = self._signatures[message_id]
+            equal = sum(1 for a, b in zip(signature, other) if a == b)
+            similarity = equal / self.num_perm
+            if similarity >= self.threshold:
+                scored.append((message_id, similarity))
+        # Mais parecidos primeiro; no empate, o mais recente
+        scored.sort(key=lambda item: (item[1], item[0]), reverse=True)
+        if scored:
+            self.stats.matches += 1
+        return scored[:limit]
+
+    async def aadd(self, items: Sequence[Tuple[int, str]]) -> None:
+        """Indexa (message_id, código) calculando as assinaturas em thread"""
+        items = [item for item in items if item[0] not in self._signatures]
+        if not items:
+            return
+        signatures = await asyncio.to_thread(
+            lambda: [self.signature(code) for _, code in items]
+        )
+        for (message_id, _), signature in zip(items, signatures):
+            self.add(message_id, signature)
+
+    # Carga, atualização e snapshot
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Encerra a atualização e grava o snapshot."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        if self.path:
+            try:
+                await asyncio.to_thread(self._save_snapshot)
+            except OSError:
+                logger.exception('Could not save similarity index snapshot')
+
+    async def _run(self) -> None:
+        start = time.perf_counter()
+        if self.path:
+            try:
+                await asyncio.to_thread(self._load_snapshot)
+            except Exception:
+                logger.exception('Ignoring unreadable similarity snapshot')
+        snapshot_entries = len(self._signatures)
+        await self._refresh(initial=True)
+        logger.info(
+            'similarity index ready entries=%d snapshot=%d in %.2fs',
+            len(self._signatures),
+            snapshot_entries,
+            time.perf_counter() - start,
+        )
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            await self._refresh(initial=False)
+
+    async def _refresh(self, *, initial: bool, page_size: int = 500) -> None:
+        """Indexa as análises gravadas depois de `_cursor`."""
+        try:
+            async with self.session_maker() as db:
+                if initial and not self._signatures:
+                    # Sem snapshot: só as `max_entries` análises mais novas
+                    newest = await db.scalar(select(func.max(CodeAnalysis.id)))
+                    self._cursor = max(
+                        self._cursor, (newest or 0) - self.max_entries
+                    )
+                while True:
+                    rows = (
+                        await db.execute(
+                            select(
+                                CodeAnalysis.id,
+                                CodeAnalysis.message_id,
+                                StudentMessage.code,
+                            )
+                            .join(
+                                StudentMessage,
+                                StudentMessage.id == CodeAnalysis.message_id,
+                            )
+                            .where(CodeAnalysis.id > self._cursor)
+                            .order_by(CodeAnalysis.id)
+                            .limit(page_size)
+                        )
+                    ).all()
+                    if not rows:
+                        return
+                    await self.aadd(
+                        [(message_id, code) for _, message_id, code in rows]
+                    )
+                    self._cursor = rows[-1][0]
+        except Exception:
+            logger.exception('Similarity index refresh failed')
+
+    def _save_snapshot(self) -> None:
+        ids = array('q', self._signatures.keys())
+        signatures = array('I')
+        for signature in self._signatures.values():
+            signatures.extend(signature)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        # Cada worker grava no seu arquivo temporário; o último a terminar
+        # fica com o snapshot
+        temporary = f'{self.path}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as file:
+            pickle.dump(
+                {
+                    'params': self.params,
+                    'cursor': self._cursor,
+                    'ids': ids.tobytes(),
+                    'signatures': signatures.tobytes(),
+                },
+                file,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(temporary, self.path)
+
+    def _load_snapshot(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb') as file:
+            snapshot = pickle.load(file)
+        if snapshot['params'] != self.params:
+            logger.info('Similarity snapshot has other params, rebuilding')
+            return
+        ids = array('q')
+        ids.frombytes(snapshot['ids'])
+        signatures = array('I')
+        signatures.frombytes(snapshot['signatures'])
+        entries = OrderedDict()
+        buckets: Dict[int, List[int]] = {}
+        for index in range(max(len(ids) - self.max_entries, 0), len(ids)):
+            signature = signatures[
+                index * self.num_perm:(index + 1) * self.num_perm
+            ]
+            entries[ids[index]] = signature
+            for key in self._band_keys(signature):
+                buckets.setdefault(key, []).append(ids[index])
+        self._signatures = entries
+        self._buckets = buckets
+        self._cursor = snapshot['cursor']
+
+
+similarity_index = SimilarityIndex(
+    session_maker=async_session_maker,
+    num_perm=settings.SIMILARITY_NUM_PERM,
+    bands=settings.SIMILARITY_BANDS,
+    shingle_size=settings.SIMILARITY_SHINGLE_SIZE,
+    min_tokens=settings.SIMILARITY_MIN_TOKENS,
+    threshold=settings.SIMILARITY_THRESHOLD,
+    max_entries=settings.SIMILARITY_INDEX_MAX_ENTRIES,
+    path=settings.SIMILARITY_INDEX_PATH,
+    refresh_interval=settings.SIMILARITY_INDEX_REFRESH,
+)
@@ -0,0 +1,66 @@
+import asyncio
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+T = TypeVar('T')
+
+
+@dataclass
+class SingleFlightStats:
+    leaders: int = 0
+    followers: int = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+class SingleFlight:
+    """
+    Junta chamadas simultâneas com a mesma chave em uma única execução.
+
+    A primeira chamada cria uma task com a coroutine; as que chegam enquanto
+    ela está em andamento aguardam a mesma task e recebem o mesmo resultado
+    (ou a mesma exceção). Todas aguardam via `asyncio.shield`: se o cliente
+    que iniciou a execução cair, ela continua para os demais. Por processo,
+    para ser usado a partir do event loop.
+    """
+
+    def __init__(self):
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        self.stats = SingleFlightStats()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._tasks
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    async def do(
+        self, key: Hashable, fn: Callable[[], Awaitable[T]]
+    ) -> Tuple[T, bool]:
+        """
+        Executa `fn()` ou aguarda a execução em andamento da mesma chave.
+
+        Returns:
+                O resultado e se ele foi compartilhado (`True` para quem só
+                aguardou a execução de outra requisição)
+        """
+        task = self._tasks.get(key)
+        shared = task is not None
+        if shared:
+            self.stats.followers += 1
+        else:
+            self.stats.leaders += 1
+            task = asyncio.create_task(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+
+        return await asyncio.shield(task), shared
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # Marca a exceção como lida caso todos os interessados tenham
+        # desistido (evita o aviso "exception was never retrieved")
+        if not task.cancelled():
+            task.exception()
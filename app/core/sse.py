@@ -0,0 +1,66 @@
+import asyncio
+import json
+from typing import Any, AsyncIterator, Optional
+
+from starlette.requests import Request
+
+EVENT_STREAM_MEDIA_TYPE = 'text/event-stream'
+
+# Comentário do SSE: ignorado pelos clientes, mas mantém a conexão ativa
+# nos proxies (que costumam derrubar conexões ociosas após 30-60 s)
+HEARTBEAT = ': ping\n\n'
+
+# Headers de um stream SSE: sem cache e sem buffer no nginx
+EVENT_STREAM_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no',
+}
+
+
+def accepts_event_stream(request: Request) -> bool:
+    """O cliente pediu Server-Sent Events (`Accept: text/event-stream`)"""
+    return EVENT_STREAM_MEDIA_TYPE in request.headers.get('accept', '')
+
+
+def format_event(event: str, data: Any, id: Optional[str] = None) -> str:
+    """Um evento SSE com `data` em JSON (numa linha só)"""
+    lines = []
+    if id is not None:
+        lines.append(f'id: {id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, ensure_ascii=False)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+async def with_heartbeats(
+    stream: AsyncIterator[str], interval: float
+) -> AsyncIterator[str]:
+    """
+    Repassa um stream SSE, intercalando um `HEARTBEAT` a cada `interval`
+    segundos sem eventos (ex.: durante a análise do código).
+
+    O próximo item continua sendo aguardado durante o heartbeat, sem
+    cancelar a etapa em andamento.
+    """
+    iterator = stream.__aiter__()
+    next_item: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if next_item is None:
+                next_item = asyncio.ensure_future(iterator.__anext__())
+            done, _ = await asyncio.wait({next_item}, timeout=interval)
+            if not done:
+                yield HEARTBEAT
+                continue
+
+            finished, next_item = next_item, None
+            try:
+                item = finished.result()
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        if next_item is not None:
+            next_item.cancel()
+            await asyncio.gather(next_item, return_exceptions=True)
+        await iterator.aclose()
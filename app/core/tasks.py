@@ -0,0 +1,31 @@
+import asyncio
+import logging
+from collections.abc import Coroutine
+
+logger = logging.getLogger(__name__)
+
+# Referências fortes para as tasks em andamento (o event loop só guarda
+# referências fracas e a task poderia ser coletada antes de terminar)
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _on_done(task: asyncio.Task) -> None:
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(
+            'Background task failed', exc_info=task.exception()
+        )
+
+
+def spawn(coro: Coroutine) -> asyncio.Task:
+    """Agenda uma coroutine que deve terminar mesmo se o cliente cair."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_on_done)
+    return task
+
+
+async def wait_background_tasks() -> None:
+    """Aguarda as tasks agendadas com `spawn` (usado no shutdown)."""
+    if _background_tasks:
+        await asyncio.gather(*_background_tasks, return_exceptions=True)
@@ -1,9 +1,12 @@
 from datetime import datetime
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
 from fastapi import Depends, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from sqlalchemy import DateTime, String, Text, insert, literal, select
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.models import (
     CodeAnalysis,
@@ -27,6 +30,7 @@ class StudentMessageCreate(BaseModel):
 class CodeAnalysisCreate(BaseModel):
     message_id: int
     analysis: Dict[str, Any]
+    cache_key: Optional[str] = None
 
 
 class TeacherResponseCreate(BaseModel):
@@ -34,7 +38,25 @@ class TeacherResponseCreate(BaseModel):
     response: str
 
 
-async def create_student_session(db: Session):
+class TutoringTurnCreate(BaseModel):
+    session_id: int
+    code: str
+    message: str
+    analysis: Dict[str, Any]
+    cache_key: Optional[str] = None
+    response: Optional[str] = None
+    # Reserved id (see app.crud.writer.MessageIdAllocator), if any
+    message_id: Optional[int] = None
+    created_at: datetime = Field(default_factory=datetime.now)
+
+
+class TutoringTurn(BaseModel):
+    message_id: int
+    analysis_id: int
+    response_id: Optional[int] = None
+
+
+def create_student_session(db: Session):
     """Create a new student session"""
     db_session = StudentSession(created_at=datetime.now())
     db.add(db_session)
@@ -43,7 +65,7 @@ async def create_student_session(db: Session):
     return db_session
 
 
-async def create_student_message(
+def create_student_message(
     message_data: StudentMessageCreate, db: Session
 ):
     """Create a new student message"""
@@ -64,7 +86,7 @@ async def create_student_message(
     return db_message
 
 
-async def create_code_analysis(analysis_data: CodeAnalysisCreate, db: Session):
+def create_code_analysis(analysis_data: CodeAnalysisCreate, db: Session):
 
     message_exists = db.get(StudentMessage, analysis_data.message_id)
     if not message_exists:
@@ -73,6 +95,7 @@ async def create_code_analysis(analysis_data: CodeAnalysisCreate, db: Session):
     db_analysis = CodeAnalysis(
         message_id=analysis_data.message_id,
         analysis=analysis_data.analysis,
+        cache_key=analysis_data.cache_key,
         created_at=datetime.now(),
     )
     db.add(db_analysis)
@@ -82,7 +105,7 @@ async def create_code_analysis(analysis_data: CodeAnalysisCreate, db: Session):
     return db_analysis
 
 
-async def create_teacher_response(
+def create_teacher_response(
     response_data: TeacherResponseCreate, db: Session
 ):
     """Create a new teacher response"""
@@ -101,3 +124,263 @@ async def create_teacher_response(
     db.refresh(db_response)
 
     return db_response
+
+
+# Async versions (AsyncSession over psycopg3), used by the API endpoints
+async def acreate_student_session(db: AsyncSession):
+    """Create a new student session"""
+    # The id comes back from INSERT ... RETURNING and the async sessions
+    # don't expire on commit, so no refresh round trip is needed
+    db_session = StudentSession(created_at=datetime.now())
+    db.add(db_session)
+    await db.commit()
+    return db_session
+
+
+async def astudent_session_exists(session_id: int, db: AsyncSession) -> bool:
+    """Primary key lookup, without loading the row"""
+    found = await db.scalar(
+        select(StudentSession.id).where(StudentSession.id == session_id)
+    )
+    return found is not None
+
+
+async def acreate_student_sessions(
+    student_ids: List[Optional[int]], db: AsyncSession
+) -> List[int]:
+    """
+    Create one session per student id in a single multi-row INSERT and
+    return the new ids in the same order.
+    """
+    now = datetime.now()
+    ids = await db.scalars(
+        insert(StudentSession).returning(
+            StudentSession.id, sort_by_parameter_order=True
+        ),
+        [
+            {'student_id': student_id, 'created_at': now}
+            for student_id in student_ids
+        ],
+    )
+    result = list(ids)
+    await db.commit()
+    return result
+
+
+async def acreate_student_message(
+    message_data: StudentMessageCreate, db: AsyncSession
+):
+    """Create a new student message"""
+    # Verify session exists
+    session_exists = await db.get(StudentSession, message_data.session_id)
+    if not session_exists:
+        raise HTTPException(status_code=404, detail='Session not found')
+
+    db_message = StudentMessage(
+        session_id=message_data.session_id,
+        code=message_data.code,
+        message=message_data.message,
+        created_at=datetime.now(),
+    )
+    db.add(db_message)
+    await db.commit()
+    await db.refresh(db_message)
+    return db_message
+
+
+async def acreate_code_analysis(
+    analysis_data: CodeAnalysisCreate, db: AsyncSession
+):
+    """Create a new code analysis"""
+    message_exists = await db.get(StudentMessage, analysis_data.message_id)
+    if not message_exists:
+        raise HTTPException(status_code=404, detail='Message not found')
+
+    db_analysis = CodeAnalysis(
+        message_id=analysis_data.message_id,
+        analysis=analysis_data.analysis,
+        cache_key=analysis_data.cache_key,
+        created_at=datetime.now(),
+    )
+    db.add(db_analysis)
+    await db.commit()
+    await db.refresh(db_analysis)
+
+    return db_analysis
+
+
+async def acreate_teacher_response(
+    response_data: TeacherResponseCreate, db: AsyncSession
+):
+    """Create a new teacher response"""
+    # Verify message exists
+    message_exists = await db.get(StudentMessage, response_data.message_id)
+    if not message_exists:
+        raise HTTPException(status_code=404, detail='Message not found')
+
+    db_response = TeacherResponse(
+        message_id=response_data.message_id,
+        response=response_data.response,
+        created_at=datetime.now(),
+    )
+    db.add(db_response)
+    await db.commit()
+    await db.refresh(db_response)
+
+    return db_response
+
+
+def _student_message_values(turn: TutoringTurnCreate) -> Dict[str, Any]:
+    values = {
+        'session_id': turn.session_id,
+        'code': turn.code,
+        'message': turn.message,
+        'created_at': turn.created_at,
+    }
+    if turn.message_id is not None:
+        values['id'] = turn.message_id
+    return values
+
+
+def _tutoring_turn_cte_statement(turn: TutoringTurnCreate):
+    """Single INSERT ... RETURNING statement (data-modifying CTEs)."""
+    now = turn.created_at
+    message = (
+        insert(StudentMessage)
+        .values(**_student_message_values(turn))
+        .returning(StudentMessage.id)
+        .cte('new_message')
+    )
+    analysis = (
+        insert(CodeAnalysis)
+        .from_select(
+            ['message_id', 'analysis', 'cache_key', 'created_at'],
+            select(
+                message.c.id,
+                literal(turn.analysis, CodeAnalysis.analysis.type),
+                literal(turn.cache_key, String),
+                literal(now, DateTime),
+            ),
+        )
+        .returning(CodeAnalysis.id)
+        .cte('new_analysis')
+    )
+    columns = [
+        message.c.id.label('message_id'),
+        analysis.c.id.label('analysis_id'),
+    ]
+    froms = [message, analysis]
+
+    if turn.response is not None:
+        response = (
+            insert(TeacherResponse)
+            .from_select(
+                ['message_id', 'response', 'created_at'],
+                select(
+                    message.c.id,
+                    literal(turn.response, Text),
+                    literal(now, DateTime),
+                ),
+            )
+            .returning(TeacherResponse.id)
+            .cte('new_response')
+        )
+        columns.append(response.c.id.label('response_id'))
+        froms.append(response)
+
+    return select(*columns).select_from(*froms)
+
+
+async def apersist_tutoring_turn(
+    turn: TutoringTurnCreate, db: AsyncSession
+) -> TutoringTurn:
+    """
+    Persist a whole tutoring turn (message, analysis and, optionally, the
+    teacher response) in one transaction.
+
+    On PostgreSQL this is a single statement. Existence checks are left
+    to the foreign keys.
+    """
+    now = turn.created_at
+    try:
+        if db.bind.dialect.name == 'postgresql':
+            row = (
+                await db.execute(_tutoring_turn_cte_statement(turn))
+            ).one()
+            result = TutoringTurn(**row._mapping)
+        else:
+            # Dialects without data-modifying CTEs (e.g. SQLite)
+            message_id = await db.scalar(
+                insert(StudentMessage)
+                .values(**_student_message_values(turn))
+                .returning(StudentMessage.id)
+            )
+            analysis_id = await db.scalar(
+                insert(CodeAnalysis)
+                .values(
+                    message_id=message_id,
+                    analysis=turn.analysis,
+                    cache_key=turn.cache_key,
+                    created_at=now,
+                )
+                .returning(CodeAnalysis.id)
+            )
+            response_id = None
+            if turn.response is not None:
+                response_id = await db.scalar(
+                    insert(TeacherResponse)
+                    .values(
+                        message_id=message_id,
+                        response=turn.response,
+                        created_at=now,
+                    )
+                    .returning(TeacherResponse.id)
+                )
+            result = TutoringTurn(
+                message_id=message_id,
+                analysis_id=analysis_id,
+                response_id=response_id,
+            )
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=404, detail='Session not found')
+
+    return result
+
+
+async def apersist_tutoring_turns(
+    turns: List[TutoringTurnCreate], db: AsyncSession
+) -> None:
+    """
+    Bulk insert many tutoring turns in one transaction (one multi-row
+    INSERT per table). Every turn must carry a reserved `message_id`.
+    """
+    await db.execute(
+        insert(StudentMessage),
+        [_student_message_values(turn) for turn in turns],
+    )
+    await db.execute(
+        insert(CodeAnalysis),
+        [
+            {
+                'message_id': turn.message_id,
+                'analysis': turn.analysis,
+                'cache_key': turn.cache_key,
+                'created_at': turn.created_at,
+            }
+            for turn in turns
+        ],
+    )
+    responses = [
+        {
+            'message_id': turn.message_id,
+            'response': turn.response,
+            'created_at': turn.created_at,
+        }
+        for turn in turns
+        if turn.response is not None
+    ]
+    if responses:
+        await db.execute(insert(TeacherResponse), responses)
+    await db.commit()
@@ -0,0 +1,284 @@
+from datetime import datetime
+from enum import Enum
+from typing import List, Optional
+
+from pydantic import BaseModel
+from sqlalchemy import distinct, exists, func, literal, select, true
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.models import (
+    ANALYSIS_LANGUAGE,
+    ANALYSIS_LEVEL,
+    ANALYSIS_SCORE,
+    ANALYSIS_TOTAL_ERRORS,
+    CodeAnalysis,
+    StudentMessage,
+)
+
+# Aggregates run in the database over the JSONB column and the expression
+# indexes declared in app.models; only the aggregated rows come back
+
+
+class ErrorCategory(str, Enum):
+    SINTATICOS = 'sintaticos'
+    LOGICOS = 'logicos'
+    ESTRUTURAIS = 'estruturais'
+    PERFORMANCE = 'performance'
+    BOAS_PRATICAS = 'boas_praticas'
+
+
+class BreakdownField(str, Enum):
+    LEVEL = 'level'
+    LANGUAGE = 'language'
+
+
+BREAKDOWN_EXPRESSIONS = {
+    BreakdownField.LEVEL: ANALYSIS_LEVEL,
+    BreakdownField.LANGUAGE: ANALYSIS_LANGUAGE,
+}
+
+
+class SessionScore(BaseModel):
+    session_id: int
+    analyses: int
+    avg_score: Optional[float] = None
+    min_score: Optional[int] = None
+    max_score: Optional[int] = None
+    last_analysis_at: datetime
+
+
+class TopicCount(BaseModel):
+    topic: str
+    analyses: int
+
+
+class SessionErrorImpact(BaseModel):
+    session_id: int
+    analyses: int
+    last_analysis_at: datetime
+
+
+class AnalysisBreakdown(BaseModel):
+    key: Optional[str] = None
+    analyses: int
+    avg_score: Optional[float] = None
+    avg_errors: Optional[float] = None
+
+
+def _is_postgres(db: AsyncSession) -> bool:
+    return db.bind.dialect.name == 'postgresql'
+
+
+def _with_filters(
+    statement,
+    *,
+    since: Optional[datetime] = None,
+    session_id: Optional[int] = None,
+    level: Optional[str] = None,
+    language: Optional[str] = None,
+):
+    if since is not None:
+        statement = statement.where(CodeAnalysis.created_at >= since)
+    if session_id is not None:
+        statement = statement.where(StudentMessage.session_id == session_id)
+    if level is not None:
+        statement = statement.where(ANALYSIS_LEVEL == level.upper())
+    if language is not None:
+        statement = statement.where(ANALYSIS_LANGUAGE == language.lower())
+    return statement
+
+
+def _analyses_with_messages(*columns):
+    return (
+        select(*columns)
+        .select_from(CodeAnalysis)
+        .join(StudentMessage, StudentMessage.id == CodeAnalysis.message_id)
+    )
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(float(value), 2)
+
+
+async def asession_scores(
+    db: AsyncSession,
+    *,
+    since: Optional[datetime] = None,
+    level: Optional[str] = None,
+    language: Optional[str] = None,
+    min_analyses: int = 1,
+    limit: int = 50,
+) -> List[SessionScore]:
+    """Average, min and max score per session, most recent sessions first"""
+    last_analysis_at = func.max(CodeAnalysis.created_at)
+    statement = (
+        _with_filters(
+            _analyses_with_messages(
+                StudentMessage.session_id,
+                func.count().label('analyses'),
+                func.avg(ANALYSIS_SCORE).label('avg_score'),
+                func.min(ANALYSIS_SCORE).label('min_score'),
+                func.max(ANALYSIS_SCORE).label('max_score'),
+                last_analysis_at.label('last_analysis_at'),
+            ),
+            since=since,
+            level=level,
+            language=language,
+        )
+        .group_by(StudentMessage.session_id)
+        .having(func.count() >= min_analyses)
+        .order_by(last_analysis_at.desc())
+        .limit(limit)
+    )
+    rows = (await db.execute(statement)).all()
+    return [
+        SessionScore(
+            **{**row._mapping, 'avg_score': _round(row.avg_score)}
+        )
+        for row in rows
+    ]
+
+
+def _topics_of(db: AsyncSession):
+    """One row per element of `analise_geral.topicos_envolvidos`"""
+    column = CodeAnalysis.analysis
+    if _is_postgres(db):
+        return func.jsonb_array_elements_text(
+            column[('analise_geral', 'topicos_envolvidos')]
+        ).table_valued('value')
+    return func.json_each(
+        column, '$.analise_geral.topicos_envolvidos'
+    ).table_valued('value')
+
+
+async def atop_topics(
+    db: AsyncSession,
+    *,
+    since: Optional[datetime] = None,
+    session_id: Optional[int] = None,
+    level: Optional[str] = None,
+    language: Optional[str] = None,
+    limit: int = 20,
+) -> List[TopicCount]:
+    """
+    Most frequent topics (case-insensitive) across the analyses; an
+    analysis listing the same topic twice counts once
+    """
+    topics = _topics_of(db)
+    topic = func.lower(func.trim(topics.c.value))
+    analyses = func.count(distinct(CodeAnalysis.id))
+    statement = (
+        _with_filters(
+            _analyses_with_messages(
+                topic.label('topic'), analyses.label('analyses')
+            ).join(topics, true()),
+            since=since,
+            session_id=session_id,
+            level=level,
+            language=language,
+        )
+        .group_by(topic)
+        .order_by(analyses.desc(), topic)
+        .limit(limit)
+    )
+    rows = (await db.execute(statement)).all()
+    return [TopicCount(**row._mapping) for row in rows]
+
+
+def _has_high_impact_error(db: AsyncSession, category: ErrorCategory):
+    if _is_postgres(db):
+        # Containment is served by the GIN (jsonb_path_ops) index
+        pattern = {
+            'diagnostico_erros': {
+                'erros_por_categoria': {
+                    category.value: [{'impacto_aprendizado': 'alto'}]
+                }
+            }
+        }
+        return CodeAnalysis.analysis.op('@>')(literal(pattern, JSONB))
+
+    errors = func.json_each(
+        CodeAnalysis.analysis,
+        f'$.diagnostico_erros.erros_por_categoria.{category.value}',
+    ).table_valued('value')
+    return exists(
+        select(1)
+        .select_from(errors)
+        .where(
+            func.json_extract(errors.c.value, '$.impacto_aprendizado')
+            == 'alto'
+        )
+    )
+
+
+async def asessions_with_high_impact_errors(
+    db: AsyncSession,
+    *,
+    category: ErrorCategory = ErrorCategory.LOGICOS,
+    since: Optional[datetime] = None,
+    level: Optional[str] = None,
+    language: Optional[str] = None,
+    limit: int = 50,
+) -> List[SessionErrorImpact]:
+    """
+    Sessions with analyses reporting high-impact errors of a category,
+    ordered by how many such analyses they have
+    """
+    last_analysis_at = func.max(CodeAnalysis.created_at)
+    statement = (
+        _with_filters(
+            _analyses_with_messages(
+                StudentMessage.session_id,
+                func.count().label('analyses'),
+                last_analysis_at.label('last_analysis_at'),
+            ).where(_has_high_impact_error(db, category)),
+            since=since,
+            level=level,
+            language=language,
+        )
+        .group_by(StudentMessage.session_id)
+        .order_by(func.count().desc(), last_analysis_at.desc())
+        .limit(limit)
+    )
+    rows = (await db.execute(statement)).all()
+    return [SessionErrorImpact(**row._mapping) for row in rows]
+
+
+async def aanalysis_breakdown(
+    db: AsyncSession,
+    *,
+    by: BreakdownField,
+    since: Optional[datetime] = None,
+    session_id: Optional[int] = None,
+    level: Optional[str] = None,
+    language: Optional[str] = None,
+) -> List[AnalysisBreakdown]:
+    """Analyses, average score and average error count per level/language"""
+    key = BREAKDOWN_EXPRESSIONS[by]
+    statement = (
+        _with_filters(
+            _analyses_with_messages(
+                key.label('key'),
+                func.count().label('analyses'),
+                func.avg(ANALYSIS_SCORE).label('avg_score'),
+                func.avg(ANALYSIS_TOTAL_ERRORS).label('avg_errors'),
+            ),
+            since=since,
+            session_id=session_id,
+            level=level,
+            language=language,
+        )
+        .group_by(key)
+        .order_by(func.count().desc())
+    )
+    rows = (await db.execute(statement)).all()
+    return [
+        AnalysisBreakdown(
+            key=row.key,
+            analyses=row.analyses,
+            avg_score=_round(row.avg_score),
+            avg_errors=_round(row.avg_errors),
+        )
+        for row in rows
+    ]
@@ -0,0 +1,149 @@
+import base64
+import binascii
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+from sqlalchemy import select, tuple_
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.models import (
+    ANALYSIS_LANGUAGE,
+    ANALYSIS_LEVEL,
+    ANALYSIS_SCORE,
+    ANALYSIS_TOTAL_ERRORS,
+    CodeAnalysis,
+    StudentMessage,
+    StudentSession,
+    TeacherResponse,
+)
+
+
+class AnalysisSummary(BaseModel):
+    score: Optional[int] = None
+    level: Optional[str] = None
+    language: Optional[str] = None
+    total_errors: Optional[int] = None
+
+
+class HistoryTurn(BaseModel):
+    message_id: int
+    created_at: datetime
+    message: str
+    code: Optional[str] = None
+    response: Optional[str] = None
+    summary: Optional[AnalysisSummary] = None
+    analysis: Optional[dict] = None
+
+
+class SessionHistoryPage(BaseModel):
+    session_id: int
+    turns: List[HistoryTurn]
+    # Pass it back as `cursor` to get the next (older) page
+    next_cursor: Optional[str] = None
+
+
+def encode_cursor(created_at: datetime, message_id: int) -> str:
+    raw = f'{created_at.isoformat()}|{message_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, message_id = (
+            base64.urlsafe_b64decode(padded).decode().split('|')
+        )
+        return datetime.fromisoformat(created_at), int(message_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail='Invalid cursor')
+
+
+async def aget_session_history(
+    session_id: int,
+    db: AsyncSession,
+    *,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    include_code: bool = False,
+    include_analysis: bool = False,
+) -> SessionHistoryPage:
+    """
+    One page of a session's turns, newest first.
+
+    Keyset pagination on (created_at, id) over the composite index of
+    student_messages, so every page costs the same regardless of depth.
+    The analysis and the teacher response come in the same query (outer
+    joins; each message has at most one of each). Code and the analysis
+    JSON are only selected when asked for; otherwise the analysis is
+    summarized in SQL from its indexed fields.
+    """
+    columns = [
+        StudentMessage.id,
+        StudentMessage.created_at,
+        StudentMessage.message,
+        TeacherResponse.response,
+        CodeAnalysis.id.label('analysis_id'),
+        ANALYSIS_SCORE.label('score'),
+        ANALYSIS_LEVEL.label('level'),
+        ANALYSIS_LANGUAGE.label('language'),
+        ANALYSIS_TOTAL_ERRORS.label('total_errors'),
+    ]
+    if include_code:
+        columns.append(StudentMessage.code)
+    if include_analysis:
+        columns.append(CodeAnalysis.analysis)
+
+    statement = (
+        select(*columns)
+        .outerjoin(CodeAnalysis, CodeAnalysis.message_id == StudentMessage.id)
+        .outerjoin(
+            TeacherResponse, TeacherResponse.message_id == StudentMessage.id
+        )
+        .where(StudentMessage.session_id == session_id)
+        .order_by(StudentMessage.created_at.desc(), StudentMessage.id.desc())
+        # One extra row tells whether there is a next page
+        .limit(limit + 1)
+    )
+    if cursor is not None:
+        statement = statement.where(
+            tuple_(StudentMessage.created_at, StudentMessage.id)
+            < tuple_(*decode_cursor(cursor))
+        )
+
+    rows = (await db.execute(statement)).all()
+    if not rows and cursor is None:
+        # Empty first page: tell a missing session from an empty one
+        if await db.get(StudentSession, session_id) is None:
+            raise HTTPException(status_code=404, detail='Session not found')
+
+    turns = [
+        HistoryTurn(
+            message_id=row.id,
+            created_at=row.created_at,
+            message=row.message,
+            code=row.code if include_code else None,
+            response=row.response,
+            summary=(
+                AnalysisSummary(
+                    score=row.score,
+                    level=row.level,
+                    language=row.language,
+                    total_errors=row.total_errors,
+                )
+                if row.analysis_id is not None
+                else None
+            ),
+            analysis=row.analysis if include_analysis else None,
+        )
+        for row in rows[:limit]
+    ]
+    next_cursor = None
+    if len(rows) > limit:
+        last = turns[-1]
+        next_cursor = encode_cursor(last.created_at, last.message_id)
+
+    return SessionHistoryPage(
+        session_id=session_id, turns=turns, next_cursor=next_cursor
+    )
@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import List, Optional, Tuple
+
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.core.config import settings
+from app.core.deps import async_session_maker
+from app.core.metrics import (
+    WRITE_BEHIND_BATCH_SIZE,
+    WRITE_BEHIND_FLUSH_DURATION,
+)
+from app.core.similarity import similarity_index
+from app.core.tasks import spawn
+from app.crud import (
+    TutoringTurnCreate,
+    apersist_tutoring_turn,
+    apersist_tutoring_turns,
+)
+from app.models import StudentMessage, schema_name
+
+logger = logging.getLogger(__name__)
+
+
+class MessageIdAllocator:
+    """
+    Reserva ids de `student_messages` em blocos.
+
+    No PostgreSQL os ids vêm da sequence da tabela (`nextval`), então não
+    colidem com inserts feitos por outros workers; uma ida ao banco rende
+    `block_size` ids. Em outros bancos (ex.: SQLite nos benchmarks) os ids
+    são contados a partir do maior id existente, o que só é seguro com um
+    único processo.
+    """
+
+    def __init__(self, *, session_maker: async_sessionmaker, block_size: int):
+        self.session_maker = session_maker
+        self.block_size = block_size
+        self._ids: deque[int] = deque()
+        self._next_local_id: Optional[int] = None
+        self._lock = asyncio.Lock()
+
+    async def reserve(self) -> int:
+        while not self._ids:
+            async with self._lock:
+                if not self._ids:
+                    self._ids.extend(await self._fetch_block())
+        return self._ids.popleft()
+
+    async def _fetch_block(self) -> List[int]:
+        async with self.session_maker() as db:
+            if db.bind.dialect.name == 'postgresql':
+                result = await db.execute(
+                    text('SELECT nextval(:seq) FROM generate_series(1, :n)'),
+                    {
+                        'seq': f'{schema_name}.student_messages_id_seq',
+                        'n': self.block_size,
+                    },
+                )
+                return list(result.scalars())
+
+            if self._next_local_id is None:
+                max_id = await db.scalar(select(func.max(StudentMessage.id)))
+                self._next_local_id = (max_id or 0) + 1
+
+        start = self._next_local_id
+        self._next_local_id += self.block_size
+        return list(range(start, start + self.block_size))
+
+
+@dataclass
+class WriteBehindStats:
+    submitted: int = 0
+    flushed: int = 0
+    failed: int = 0
+    batches: int = 0
+
+
+class WriteBehindWriter:
+    """
+    Fila em memória que grava os turnos de tutoria fora do caminho crítico.
+
+    - Memória limitada: a fila tem no máximo `max_pending` turnos e
+      `submit` aguarda quando ela está cheia (backpressure);
+    - Lotes: o consumidor agrupa o que estiver na fila (até `batch_size`)
+      e grava tudo em uma transação com inserts em massa;
+    - `stop` grava o que estiver pendente antes de o worker encerrar.
+    """
+
+    def __init__(
+        self,
+        *,
+        session_maker: async_sessionmaker,
+        max_pending: int,
+        batch_size: int,
+        message_id_block_size: int,
+    ):
+        self.session_maker = session_maker
+        self.batch_size = batch_size
+        self.message_ids = MessageIdAllocator(
+            session_maker=session_maker, block_size=message_id_block_size
+        )
+        self.stats = WriteBehindStats()
+        self._queue: asyncio.Queue[Optional[TutoringTurnCreate]] = (
+            asyncio.Queue(maxsize=max_pending)
+        )
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Grava os turnos pendentes e encerra o consumidor."""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def reserve_message_id(self) -> int:
+        return await self.message_ids.reserve()
+
+    async def submit(self, turn: TutoringTurnCreate) -> None:
+        if turn.message_id is None:
+            turn.message_id = await self.reserve_message_id()
+        await self._queue.put(turn)
+        self.stats.submitted += 1
+
+    async def persist(self, turns: List[TutoringTurnCreate]) -> None:
+        """
+        Grava `turns` já, em lotes de até `batch_size`, sem passar pela
+        fila (ex.: a correção em lote, que junta os turnos por conta
+        própria). Cada turno deve ter o `message_id` reservado.
+        """
+        self.stats.submitted += len(turns)
+        for start in range(0, len(turns), self.batch_size):
+            await self._flush(turns[start:start + self.batch_size])
+
+    def status(self) -> dict:
+        return {**asdict(self.stats), 'pending': self._queue.qsize()}
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            turn = await self._queue.get()
+            batch = [] if turn is None else [turn]
+            stopping = turn is None
+
+            # Junta o que já estiver na fila (lote cresce sob carga)
+            while not stopping and len(batch) < self.batch_size:
+                try:
+                    turn = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if turn is None:
+                    stopping = True
+                else:
+                    batch.append(turn)
+
+            if batch:
+                await self._flush(batch)
+
+    async def _flush(self, batch: List[TutoringTurnCreate]) -> None:
+        self.stats.batches += 1
+        start = time.perf_counter()
+        outcome, written = await self._write(batch)
+        WRITE_BEHIND_FLUSH_DURATION.observe(
+            time.perf_counter() - start, outcome=outcome
+        )
+        WRITE_BEHIND_BATCH_SIZE.observe(len(batch), outcome=outcome)
+        if settings.SIMILARITY_INDEX_ENABLED and written:
+            # Os códigos gravados entram no índice de envios parecidos
+            # (assinaturas calculadas fora do event loop)
+            spawn(
+                similarity_index.aadd(
+                    [(turn.message_id, turn.code) for turn in written]
+                )
+            )
+
+    async def _write(
+        self, batch: List[TutoringTurnCreate]
+    ) -> Tuple[str, List[TutoringTurnCreate]]:
+        """
+        Grava o lote; retorna `ok` ou `retried` (gravado um a um) e os
+        turnos que foram de fato gravados.
+        """
+        async with self.session_maker() as db:
+            try:
+                await apersist_tutoring_turns(batch, db)
+                self.stats.flushed += len(batch)
+                return 'ok', batch
+            except Exception:
+                await db.rollback()
+                logger.exception(
+                    'Bulk insert of %d turns failed, retrying one by one',
+                    len(batch),
+                )
+
+            # Isola os turnos inválidos (ex.: sessão inexistente)
+            written = []
+            for turn in batch:
+                try:
+                    await apersist_tutoring_turn(turn, db)
+                    self.stats.flushed += 1
+                    written.append(turn)
+                except Exception:
+                    await db.rollback()
+                    self.stats.failed += 1
+                    logger.exception(
+                        'Could not persist tutoring turn (message_id=%s)',
+                        turn.message_id,
+                    )
+        return 'retried', written
+
+
+writer = WriteBehindWriter(
+    session_maker=async_session_maker,
+    max_pending=settings.WRITE_BEHIND_MAX_PENDING,
+    batch_size=settings.WRITE_BEHIND_BATCH_SIZE,
+    message_id_block_size=settings.MESSAGE_ID_BLOCK_SIZE,
+)
@@ -1,16 +1,248 @@
-from agno.models.google import Gemini
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional
 
-from app.core.config import settings
+from agno.models.base import Model
+from agno.models.message import Message
+
+from app.core.config import (
+    AGNO_ROUTE_MODELS,
+    DEFAULT_AGNO_MODEL,
+    GEMINI_2_5_FLASH,
+    GOOGLE_CHAT_MODELS,
+    LLM_PARAMETERS,
+    NVIDIA_CHAT_MODELS,
+    settings,
+)
+from app.core.metrics import observe_llm_call
+from app.llm.routing import llm_router, route_models
+
+# `agno.models.google` carrega o SDK `google.genai` (~1s) e
+# `agno.models.nvidia` o SDK `openai`; só são importados no primeiro uso
+# (ver `app.core.preload` para carregá-los antes do fork)
+if TYPE_CHECKING:
+    from agno.models.google import Gemini
+    from agno.models.nvidia import Nvidia
+
+
+@lru_cache(maxsize=None)
+def get_agno_model(
+    model_name: str,
+    max_output_tokens: Optional[int] = None,
+    thinking_budget: Optional[int] = None,
+) -> 'Gemini | Nvidia':
+    """
+    Cliente do modelo reutilizado por todos os agentes do worker.
+
+    O cliente HTTP (`genai.Client` ou `openai.AsyncOpenAI`) é criado uma vez
+    por modelo (e limites de saída) e mantém as conexões HTTP (keep-alive)
+    abertas entre as requisições. `thinking_budget` só vale para o Gemini.
+    """
+    if model_name in NVIDIA_CHAT_MODELS:
+        from agno.models.nvidia import Nvidia
+
+        return Nvidia(
+            id=model_name,
+            api_key=settings.NVIDIA_NIM_API_KEY,
+            max_tokens=(
+                max_output_tokens or LLM_PARAMETERS[model_name]['max_tokens']
+            ),
+        )
+    if model_name not in GOOGLE_CHAT_MODELS:
+        raise ValueError(f'Invalid model name: "{model_name}"')
+
+    from agno.models.google import Gemini
+
+    return Gemini(
+        id=model_name,
+        api_key=settings.GEMINI_API_KEY,
+        max_output_tokens=max_output_tokens,
+        thinking_budget=thinking_budget,
+    )
+
+
+@dataclass
+class RoutedAgnoModel(Model):
+    """
+    Modelo do agno que passa cada chamada pela rota de provedores
+    (`app.llm.routing.llm_router`): hedge, failover e circuit breaker,
+    como no stream do LangChain. `models` é a rota, o principal primeiro;
+    nome, provedor e suporte a saída estruturada vêm dele.
+
+    Cada tentativa recebe a própria cópia da lista de mensagens (o agno
+    acrescenta nela a resposta do assistente); a do vencedor volta para a
+    lista do agente. As chamadas síncronas (`response`) vão direto ao
+    principal: a rota roda no event loop.
+    """
+
+    id: str = ''
+    models: List[Model] = field(default_factory=list)
+
+    def __post_init__(self):
+        primary = self.models[0]
+        self.id = primary.id
+        self.name = primary.name
+        self.provider = primary.provider
+        self.supports_native_structured_outputs = (
+            primary.supports_native_structured_outputs
+        )
+        self.supports_json_schema_outputs = (
+            primary.supports_json_schema_outputs
+        )
+        self._by_id: Dict[str, Model] = {
+            model.id: model for model in self.models
+        }
+
+    @property
+    def primary(self) -> Model:
+        return self.models[0]
+
+    async def aresponse(self, messages: List[Message], **kwargs):
+        async def call(model_id: str):
+            attempt_messages = list(messages)
+            response = await self._by_id[model_id].aresponse(
+                messages=attempt_messages, **kwargs
+            )
+            return response, attempt_messages
+
+        response, routed_messages = await llm_router.ainvoke(
+            list(self._by_id),
+            call,
+            hedge_delay=settings.LLM_RESPONSE_HEDGE_DELAY,
+            timeout=settings.LLM_RESPONSE_TIMEOUT,
+        )
+        messages[:] = routed_messages
+        return response
+
+    async def aresponse_stream(
+        self, messages: List[Message], **kwargs
+    ) -> AsyncIterator[Any]:
+        finished: List[List[Message]] = []
+
+        def make_stream(model_id: str):
+            attempt_messages = list(messages)
+
+            async def stream():
+                events = self._by_id[model_id].aresponse_stream(
+                    messages=attempt_messages, **kwargs
+                )
+                try:
+                    async for event in events:
+                        yield event
+                    finished.append(attempt_messages)
+                finally:
+                    await events.aclose()
+
+            return stream()
+
+        # Com saída estruturada o agno não faz streaming do modelo: o
+        # "primeiro chunk" é a resposta inteira
+        whole = not kwargs.get('stream_model_response', True)
+        async for event in llm_router.astream(
+            list(self._by_id),
+            make_stream,
+            hedge_delay=settings.LLM_RESPONSE_HEDGE_DELAY if whole else None,
+            timeout=settings.LLM_RESPONSE_TIMEOUT if whole else None,
+        ):
+            yield event
+        if finished:
+            messages[:] = finished[-1]
+
+    def response(self, *args, **kwargs):
+        return self.primary.response(*args, **kwargs)
+
+    def response_stream(self, *args, **kwargs):
+        return self.primary.response_stream(*args, **kwargs)
+
+    def invoke(self, *args, **kwargs):
+        return self.primary.invoke(*args, **kwargs)
+
+    async def ainvoke(self, *args, **kwargs):
+        return await self.primary.ainvoke(*args, **kwargs)
+
+    def invoke_stream(self, *args, **kwargs):
+        return self.primary.invoke_stream(*args, **kwargs)
+
+    def ainvoke_stream(self, *args, **kwargs):
+        return self.primary.ainvoke_stream(*args, **kwargs)
+
+    def _parse_provider_response(self, response: Any, **kwargs):
+        return self.primary._parse_provider_response(response, **kwargs)
+
+    def _parse_provider_response_delta(self, response: Any):
+        return self.primary._parse_provider_response_delta(response)
+
+    def get_system_message_for_model(self, tools=None):
+        return self.primary.get_system_message_for_model(tools)
+
+    def get_instructions_for_model(self, tools=None):
+        return self.primary.get_instructions_for_model(tools)
+
+
+@lru_cache(maxsize=None)
+def get_routed_agno_model(
+    model_name: str,
+    max_output_tokens: Optional[int] = None,
+    thinking_budget: Optional[int] = None,
+) -> RoutedAgnoModel:
+    """
+    `model_name` seguido dos modelos de `AGNO_ROUTE_MODELS` de outros
+    provedores com chave configurada, uma instância por worker.
+    """
+    return RoutedAgnoModel(
+        models=[
+            get_agno_model(
+                model,
+                max_output_tokens,
+                thinking_budget if model == model_name else None,
+            )
+            for model in route_models(model_name, AGNO_ROUTE_MODELS)
+        ]
+    )
 
 
 def get_default_agno_model():
-    return Gemini(id='gemini-2.5-flash', api_key=settings.GEMINI_API_KEY)
+    return get_routed_agno_model(DEFAULT_AGNO_MODEL)
 
 
-def generate_stream(*, agent, input):
-    for event in agent.run(input, stream=True):
+def get_quick_agno_model():
+    """Modelo padrão com saída curta, usado na análise rápida."""
+    return get_routed_agno_model(
+        DEFAULT_AGNO_MODEL,
+        max_output_tokens=settings.QUICK_ANALYSIS_MAX_TOKENS,
+        # Só os modelos 2.5 têm orçamento de raciocínio configurável
+        thinking_budget=(
+            settings.QUICK_ANALYSIS_THINKING_BUDGET
+            if DEFAULT_AGNO_MODEL == GEMINI_2_5_FLASH
+            else None
+        ),
+    )
+
+
+async def generate_stream(*, agent, input, **kwargs):
+    async for event in agent.arun(input, stream=True, **kwargs):
         # Extract the content from the RunContentEvent
         if hasattr(event, 'content') and event.content:
             yield event.content
         elif hasattr(event, 'delta') and event.delta:
             yield event.delta
+
+
+def observe_run_output(response, *, stage: str, model: str) -> None:
+    """Registra caracteres e tokens de uma execução do agente (`RunOutput`)."""
+    content = next(
+        (
+            message.content
+            for message in reversed(response.messages or [])
+            if message.role == 'assistant' and isinstance(message.content, str)
+        ),
+        '',
+    )
+    metrics = response.metrics
+    observe_llm_call(
+        stage,
+        model=model,
+        chars=len(content),
+        input_tokens=getattr(metrics, 'input_tokens', 0) or 0,
+        output_tokens=getattr(metrics, 'output_tokens', 0) or 0,
+    )
@@ -1,19 +1,29 @@
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import PromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_nvidia_ai_endpoints import ChatNVIDIA
+from functools import lru_cache
+from typing import TYPE_CHECKING
 
 from app.agents.teacher_agent import PROMPT_TEACHER_AGENT
+from app.agents.template import compile_template
 from app.core.config import (
     GEMINI_2_0_FLASH,
     GOOGLE_CHAT_MODELS,
+    LANGCHAIN_ROUTE_MODELS,
     LLM_PARAMETERS,
     NVIDIA_CHAT_MODELS,
     settings,
 )
+from app.core.metrics import instrument_stream
+from app.llm.routing import llm_router, route_models
 
+# Os pacotes do LangChain e das integrações só são importados no primeiro
+# uso (ver `app.core.preload` para carregá-los antes do fork)
+if TYPE_CHECKING:
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    from langchain_nvidia_ai_endpoints import ChatNVIDIA
+
+
+def load_nvidia_chat_model(model_name: str) -> 'ChatNVIDIA':
+    from langchain_nvidia_ai_endpoints import ChatNVIDIA
 
-def load_nvidia_chat_model(model_name: str) -> ChatNVIDIA:
     return ChatNVIDIA(
         model=model_name,
         api_key=settings.NVIDIA_NIM_API_KEY,
@@ -22,7 +32,9 @@ def load_nvidia_chat_model(model_name: str) -> ChatNVIDIA:
     )
 
 
-def load_google_chat_model(model_name: str) -> ChatGoogleGenerativeAI:
+def load_google_chat_model(model_name: str) -> 'ChatGoogleGenerativeAI':
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
     return ChatGoogleGenerativeAI(
         model=model_name,
         google_api_key=settings.GEMINI_API_KEY,
@@ -45,15 +57,34 @@ def init_llm_model(model_name: str):
     return load_model(model_name)
 
 
+@lru_cache(maxsize=None)
+def get_llm_model(model_name: str):
+    """Cliente LangChain reutilizado (uma instância por modelo e worker)."""
+    return init_llm_model(model_name)
+
+
+@lru_cache(maxsize=None)
+def get_teacher_chain(model_name: str):
+    """Chain `prompt | llm | parser` compilada uma única vez por modelo."""
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.runnables import RunnableLambda
+
+    # O template usa `{{variavel}}`, que no formato f-string do
+    # `PromptTemplate` vira um literal; usamos o template pré-compilado
+    prompt = RunnableLambda(compile_template(PROMPT_TEACHER_AGENT).render_dict)
+    return prompt | get_llm_model(model_name) | StrOutputParser()
+
+
 def langchain_make_question(
     *, question: str, code: str, model_name: str = GEMINI_2_0_FLASH
 ):
-    llm = init_llm_model(model_name)
-    prompt = PromptTemplate(
-        template=PROMPT_TEACHER_AGENT,
-        input_variables=['student_message', 'student_code', 'code_analysis'],
-    )
-    chain = prompt | llm | StrOutputParser()
+    """
+    Resposta do professor numa chamada síncrona, direto no `model_name`:
+    fora da rota de provedores (sem hedge, failover nem circuit breaker),
+    que roda no event loop. Nenhum endpoint a usa; `/call/langchain/` vai
+    por `langchain_make_question_stream`.
+    """
+    chain = get_teacher_chain(model_name)
 
     answer = chain.invoke(
         {
@@ -69,18 +100,25 @@ def langchain_make_question(
 async def langchain_make_question_stream(
     *, question: str, code: str, model_name: str = GEMINI_2_0_FLASH
 ):
-    llm = init_llm_model(model_name)
-    prompt = PromptTemplate(
-        template=PROMPT_TEACHER_AGENT,
-        input_variables=['student_message', 'student_code', 'code_analysis'],
-    )
-    chain = prompt | llm | StrOutputParser()
-
-    async for chunk in chain.astream(
-        {
-            'student_message': question,
-            'student_code': code,
-            'code_analysis': 'Sem analises',
-        }
+    """
+    Resposta do professor em streaming pela rota de provedores: hedge para
+    o próximo provedor se o primeiro token demorar, failover em erros e
+    circuit breaker (ver `app.llm.routing`).
+    """
+    inputs = {
+        'student_message': question,
+        'student_code': code,
+        'code_analysis': 'Sem analises',
+    }
+
+    def make_stream(model: str):
+        return instrument_stream(
+            get_teacher_chain(model).astream(inputs),
+            stage='teacher',
+            model=model,
+        )
+
+    async for chunk in llm_router.astream(
+        route_models(model_name, LANGCHAIN_ROUTE_MODELS), make_stream
     ):
         yield chunk
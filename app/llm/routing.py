@@ -0,0 +1,395 @@
+import asyncio
+import logging
+import time
+from dataclasses import asdict, dataclass, field
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from fastapi import HTTPException
+
+from app.core.config import GOOGLE_CHAT_MODELS, NVIDIA_CHAT_MODELS, settings
+from app.core.metrics import LLM_PROVIDER_ATTEMPT_DURATION, current_endpoint
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_PROVIDER = 'google'
+NVIDIA_PROVIDER = 'nvidia'
+
+# Peso da última medição na média móvel de latência
+LATENCY_EWMA_WEIGHT = 0.2
+
+# Fim de um stream sem nenhum chunk
+_END = object()
+
+
+def provider_of(model_name: str) -> str:
+    if model_name in GOOGLE_CHAT_MODELS:
+        return GOOGLE_PROVIDER
+    if model_name in NVIDIA_CHAT_MODELS:
+        return NVIDIA_PROVIDER
+    raise ValueError(f'Invalid model name: "{model_name}"')
+
+
+def has_credentials(model_name: str) -> bool:
+    """Provedor do modelo com chave de API configurada"""
+    if provider_of(model_name) == GOOGLE_PROVIDER:
+        return bool(settings.GEMINI_API_KEY)
+    return bool(settings.NVIDIA_NIM_API_KEY)
+
+
+@dataclass
+class ProviderHealth:
+    """
+    Saúde de um provedor e o circuit breaker correspondente.
+
+    - closed: recebe pedidos normalmente;
+    - open: `failure_threshold` falhas seguidas; fica fora da rota por
+      `reset_timeout` segundos;
+    - half_open: passado o tempo, um único pedido de teste decide se o
+      circuito fecha (sucesso) ou abre de novo (falha).
+    """
+
+    failure_threshold: int
+    reset_timeout: float
+    successes: int = 0
+    failures: int = 0
+    consecutive_failures: int = 0
+    latency_ewma: Optional[float] = None
+    opened_at: Optional[float] = None
+    _probing: bool = field(default=False, repr=False)
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return 'open'
+        return 'half_open'
+
+    def allow(self) -> bool:
+        """Reserva um pedido (no half_open, só o pedido de teste passa)"""
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'half_open' and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def release(self) -> None:
+        """Pedido cancelado (ex.: perdeu o hedge): não conta como falha"""
+        self._probing = False
+
+    def record_success(self, latency: float) -> None:
+        self.successes += 1
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probing = False
+        self.latency_ewma = (
+            latency
+            if self.latency_ewma is None
+            else LATENCY_EWMA_WEIGHT * latency
+            + (1 - LATENCY_EWMA_WEIGHT) * self.latency_ewma
+        )
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.consecutive_failures += 1
+        if (
+            self._probing
+            or self.consecutive_failures >= self.failure_threshold
+        ):
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def as_dict(self) -> dict:
+        return {
+            'state': self.state,
+            'successes': self.successes,
+            'failures': self.failures,
+            'consecutive_failures': self.consecutive_failures,
+            'latency_ewma': (
+                None
+                if self.latency_ewma is None
+                else round(self.latency_ewma, 3)
+            ),
+        }
+
+
+@dataclass
+class RouterStats:
+    requests: int = 0
+    hedges: int = 0
+    failovers: int = 0
+    unavailable: int = 0
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass
+class _Attempt:
+    model: str
+    provider: str
+    kind: str
+    health: ProviderHealth
+    started_at: float
+    stream: Optional[AsyncIterator] = None
+
+
+def _attempt_outcome(exc: Optional[BaseException]) -> str:
+    if exc is None:
+        return 'ok'
+    if isinstance(exc, asyncio.TimeoutError):
+        return 'timeout'
+    if isinstance(exc, asyncio.CancelledError):
+        return 'cancelled'
+    return 'error'
+
+
+class ProviderRouter:
+    """
+    Envia cada chamada ao LLM por uma rota de modelos de provedores
+    diferentes, na ordem dada.
+
+    Sem resposta do primeiro após `hedge_delay` segundos, dispara um pedido
+    duplicado (hedge) para o próximo da rota e fica com o que responder
+    primeiro; o outro é cancelado. Um erro, ou `timeout` segundos sem
+    resposta, passa para o próximo (failover). Provedores com o circuito
+    aberto são pulados. Nos streams, a disputa vale até o primeiro chunk:
+    depois dele o stream vencedor segue até o fim. Por processo, para ser
+    usado a partir do event loop.
+
+    Passam por aqui o stream do LangChain (`/call/langchain/`) e as
+    chamadas dos agentes do agno (`app.llm.agno.RoutedAgnoModel`). Só
+    `langchain_make_question`, síncrona, chama direto o modelo pedido.
+    `hedge_delay` e `timeout` valem por padrão; cada chamada pode trocá-los
+    (ex.: respostas inteiras, sem streaming, demoram mais que um primeiro
+    chunk).
+    """
+
+    def __init__(
+        self,
+        *,
+        hedge_delay: float,
+        timeout: float,
+        failure_threshold: int,
+        reset_timeout: float,
+    ):
+        self.hedge_delay = hedge_delay
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.providers: Dict[str, ProviderHealth] = {}
+        self.stats = RouterStats()
+
+    def health_of(self, provider: str) -> ProviderHealth:
+        if provider not in self.providers:
+            self.providers[provider] = ProviderHealth(
+                failure_threshold=self.failure_threshold,
+                reset_timeout=self.reset_timeout,
+            )
+        return self.providers[provider]
+
+    def status(self) -> dict:
+        return {
+            **self.stats.as_dict(),
+            'providers': {
+                provider: health.as_dict()
+                for provider, health in self.providers.items()
+            },
+        }
+
+    def _observe(self, attempt: _Attempt, exc: Optional[BaseException]):
+        LLM_PROVIDER_ATTEMPT_DURATION.observe(
+            time.perf_counter() - attempt.started_at,
+            endpoint=current_endpoint(),
+            provider=attempt.provider,
+            model=attempt.model,
+            kind=attempt.kind,
+            outcome=_attempt_outcome(exc),
+        )
+
+    async def _race(
+        self,
+        models: Sequence[str],
+        start: Callable[[str], Tuple[Awaitable, Optional[AsyncIterator]]],
+        *,
+        hedge_delay: Optional[float] = None,
+        timeout: Optional[float] = None,
+    ) -> Tuple[_Attempt, Any]:
+        """
+        Disputa entre as tentativas da rota.
+
+        `start(model)` devolve o awaitable da resposta (ou do primeiro
+        chunk) e, nos streams, o stream a ser fechado se a tentativa perder.
+        """
+        if hedge_delay is None:
+            hedge_delay = self.hedge_delay
+        if timeout is None:
+            timeout = self.timeout
+        self.stats.requests += 1
+        remaining = list(models)
+        pending: Dict[asyncio.Task, _Attempt] = {}
+        last_error: Optional[BaseException] = None
+
+        def launch(kind: str) -> bool:
+            while remaining:
+                model = remaining.pop(0)
+                provider = provider_of(model)
+                health = self.health_of(provider)
+                if not health.allow():
+                    continue
+                awaitable, stream = start(model)
+                task = asyncio.ensure_future(
+                    asyncio.wait_for(awaitable, timeout)
+                )
+                pending[task] = _Attempt(
+                    model=model,
+                    provider=provider,
+                    kind=kind,
+                    health=health,
+                    started_at=time.perf_counter(),
+                    stream=stream,
+                )
+                return True
+            return False
+
+        launch('primary')
+        try:
+            while pending:
+                can_hedge = hedge_delay > 0 and bool(remaining)
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=hedge_delay if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    if launch('hedge'):
+                        self.stats.hedges += 1
+                    continue
+
+                for task in done:
+                    attempt = pending.pop(task)
+                    exc = task.exception()
+                    self._observe(attempt, exc)
+                    if exc is None:
+                        attempt.health.record_success(
+                            time.perf_counter() - attempt.started_at
+                        )
+                        return attempt, task.result()
+
+                    last_error = exc
+                    attempt.health.record_failure()
+                    if attempt.stream is not None:
+                        await attempt.stream.aclose()
+                    logger.warning(
+                        'LLM attempt failed provider=%s model=%s kind=%s: %r',
+                        attempt.provider,
+                        attempt.model,
+                        attempt.kind,
+                        exc,
+                    )
+
+                if not pending and launch('failover'):
+                    self.stats.failovers += 1
+        finally:
+            # Perdedores do hedge (ou todos, se o chamador cancelou)
+            for task in pending:
+                task.cancel()
+            for task, attempt in pending.items():
+                await asyncio.gather(task, return_exceptions=True)
+                self._observe(attempt, asyncio.CancelledError())
+                attempt.health.release()
+                if attempt.stream is not None:
+                    await attempt.stream.aclose()
+
+        if last_error is not None:
+            raise last_error
+        self.stats.unavailable += 1
+        raise HTTPException(
+            status_code=503,
+            detail='Provedores de LLM indisponíveis, tente novamente',
+        )
+
+    async def ainvoke(
+        self,
+        models: Sequence[str],
+        call: Callable[[str], Awaitable[Any]],
+        *,
+        hedge_delay: Optional[float] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """Resposta do primeiro modelo que responder sem erro"""
+        _, result = await self._race(
+            models,
+            lambda model: (call(model), None),
+            hedge_delay=hedge_delay,
+            timeout=timeout,
+        )
+        return result
+
+    async def astream(
+        self,
+        models: Sequence[str],
+        make_stream: Callable[[str], AsyncIterator[Any]],
+        *,
+        hedge_delay: Optional[float] = None,
+        timeout: Optional[float] = None,
+    ) -> AsyncIterator[Any]:
+        """Chunks do stream do primeiro modelo que emitir um chunk"""
+
+        def start(model: str):
+            stream = make_stream(model)
+
+            async def first_chunk():
+                try:
+                    return await stream.__anext__()
+                except StopAsyncIteration:
+                    return _END
+
+            return first_chunk(), stream
+
+        attempt, first = await self._race(
+            models, start, hedge_delay=hedge_delay, timeout=timeout
+        )
+        stream = attempt.stream
+        try:
+            if first is not _END:
+                yield first
+                async for chunk in stream:
+                    yield chunk
+        except Exception:
+            # Falha depois do primeiro chunk: sem failover, mas conta
+            attempt.health.record_failure()
+            raise
+        finally:
+            await stream.aclose()
+
+
+def route_models(model_name: str, route: Sequence[str]) -> List[str]:
+    """Modelo pedido primeiro, depois os da rota com chave configurada"""
+    return [model_name] + [
+        model
+        for model in route
+        if model != model_name
+        and provider_of(model) != provider_of(model_name)
+        and has_credentials(model)
+    ]
+
+
+llm_router = ProviderRouter(
+    hedge_delay=settings.LLM_HEDGE_DELAY,
+    timeout=settings.LLM_REQUEST_TIMEOUT,
+    failure_threshold=settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=settings.LLM_CIRCUIT_RESET_TIMEOUT,
+)
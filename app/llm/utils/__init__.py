@@ -1,9 +1,11 @@
 import json
+from typing import TYPE_CHECKING
 
-from transformers import PreTrainedTokenizerBase
+if TYPE_CHECKING:
+    from transformers import PreTrainedTokenizerBase
 
 
-def count_tokens(text: str, tokenizer: PreTrainedTokenizerBase) -> int:
+def count_tokens(text: str, tokenizer: 'PreTrainedTokenizerBase') -> int:
     """Contar o número de tokens em um texto usando o tokenizer fornecido."""
     return len(tokenizer.encode(text))
 
@@ -0,0 +1,279 @@
+import logging
+import math
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+
+from app.core.config import LLM_PARAMETERS, settings
+from app.core.metrics import LLM_PROMPT_TOKENS, current_endpoint
+from app.llm.utils import count_tokens
+
+if TYPE_CHECKING:
+    from app.agents.code_analyser_agent.models import AnaliseCodigo
+
+logger = logging.getLogger(__name__)
+
+# Média de caracteres por token usada quando não há tokenizer configurado
+# (código e português ficam em torno de 3.5-4)
+CHARS_PER_TOKEN = 3.5
+
+TRIM_MARKER = '\n# ... [{omitted} linhas omitidas] ...\n'
+TRIM_LINE_MARKER = ' ... [linha cortada] ... '
+
+
+class TokenCounter:
+    """Conta tokens com um tokenizer do `transformers` ou por aproximação."""
+
+    def __init__(self, tokenizer=None):
+        self.tokenizer = tokenizer
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.tokenizer is not None:
+            return count_tokens(text, self.tokenizer)
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+@lru_cache(maxsize=1)
+def get_token_counter() -> TokenCounter:
+    if not settings.TOKENIZER_NAME:
+        return TokenCounter()
+
+    from transformers import AutoTokenizer
+
+    return TokenCounter(AutoTokenizer.from_pretrained(settings.TOKENIZER_NAME))
+
+
+@dataclass
+class BudgetReport:
+    """Contagem de tokens de uma etapa (analyser, teacher...)."""
+
+    stage: str
+    model: str
+    limit: int
+    prompt_tokens: int = 0
+    code_tokens: int = 0
+    history_tokens: int = 0
+    analysis_tokens: int = 0
+    trimmed: List[str] = field(default_factory=list)
+
+    @property
+    def total_tokens(self) -> int:
+        return (
+            self.prompt_tokens
+            + self.code_tokens
+            + self.history_tokens
+            + self.analysis_tokens
+        )
+
+
+def is_compactable(analysis: Optional['AnaliseCodigo']) -> bool:
+    """Só a análise completa tem partes que podem ser removidas."""
+    from app.agents.code_analyser_agent.models import AnaliseCodigoCompleta
+
+    return isinstance(analysis, AnaliseCodigoCompleta)
+
+
+def compact_analysis(analysis: 'AnaliseCodigo', level: int) -> 'AnaliseCodigo':
+    """
+    Remove as partes menos úteis da análise para o professor.
+
+    - nível 1: código corrigido completo;
+    - nível 2: também recursos recomendados e próximos passos.
+
+    A `AnaliseRapida` já é curta e é devolvida sem mudanças.
+    """
+    if not is_compactable(analysis):
+        return analysis
+
+    update = {}
+    if level >= 1:
+        update['codigo_melhorado'] = analysis.codigo_melhorado.model_copy(
+            update={'versao_corrigida': None}
+        )
+    if level >= 2:
+        update['feedback_construtivo'] = (
+            analysis.feedback_construtivo.model_copy(
+                update={'recursos_recomendados': [], 'proximos_passos': []}
+            )
+        )
+    return analysis.model_copy(update=update)
+
+
+def trim_code(code: str, max_chars: int) -> str:
+    """
+    Mantém o início e o fim do código e omite as linhas do meio. Uma linha
+    longa que ocuparia a maior parte do espaço (ex.: código minificado)
+    entra cortada, em vez de sumir inteira.
+    """
+    if len(code) <= max_chars:
+        return code
+
+    lines = code.splitlines()
+    head, tail = [], []
+    first, last = 0, len(lines) - 1
+    size = 0
+    # Alterna entre o início e o fim até esgotar o espaço
+    while first <= last:
+        take_head = len(head) <= len(tail)
+        line = lines[first] if take_head else lines[last]
+        if size + len(line) + 1 > max_chars:
+            break
+        size += len(line) + 1
+        if take_head:
+            head.append(line)
+            first += 1
+        else:
+            tail.append(line)
+            last -= 1
+
+    free = max_chars - size
+    keep = free - len(TRIM_LINE_MARKER)
+    if first <= last and free > max_chars // 2 and keep > 0:
+        if take_head:
+            head.append(lines[first][:keep] + TRIM_LINE_MARKER)
+            first += 1
+        else:
+            tail.append(TRIM_LINE_MARKER + lines[last][-keep:])
+            last -= 1
+
+    omitted = last - first + 1
+    if omitted == 0:
+        return '\n'.join(head + tail[::-1])
+    return (
+        '\n'.join(head)
+        + TRIM_MARKER.format(omitted=omitted)
+        + '\n'.join(reversed(tail))
+    )
+
+
+class TokenBudget:
+    """
+    Orçamento de tokens de entrada de uma chamada ao modelo.
+
+    O limite é `context_length - max_tokens` do modelo em `LLM_PARAMETERS`,
+    restrito a `TOKEN_BUDGET_MAX_INPUT_TOKENS`. Quando a entrada não cabe,
+    corta na ordem: histórico mais antigo, partes da análise e o meio do
+    código. Entradas sem chance de caber são rejeitadas com 413 antes de
+    qualquer chamada ao modelo.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        *,
+        counter: Optional[TokenCounter] = None,
+        max_input_tokens: Optional[int] = None,
+    ):
+        parameters = LLM_PARAMETERS[model_name]
+        self.model_name = model_name
+        self.counter = counter or get_token_counter()
+        self.limit = min(
+            parameters['context_length'] - parameters['max_tokens'],
+            max_input_tokens or settings.TOKEN_BUDGET_MAX_INPUT_TOKENS,
+        )
+
+    def fit(
+        self,
+        *,
+        stage: str,
+        prompt: str,
+        code: str,
+        history: Sequence[str] = (),
+        analysis: Optional['AnaliseCodigo'] = None,
+    ) -> Tuple[str, List[str], Optional['AnaliseCodigo'], BudgetReport]:
+        """
+        Ajusta as entradas ao orçamento.
+
+        Args:
+                stage: Nome da etapa (para o relatório)
+                prompt: Texto fixo do prompt mais a pergunta do aluno
+                code: Código do aluno
+                history: Contexto da memória do agente, do mais antigo ao
+                        mais recente (ver `BoundedMemoryAgent.aload_context`)
+                analysis: Análise do senior, completa ou rápida (professor)
+
+        Returns:
+                Código, histórico e análise ajustados e o relatório de tokens
+        """
+        # Rejeição barata, sem tokenizar: código muito maior que o limite
+        if (
+            len(code) / CHARS_PER_TOKEN
+            > self.limit * settings.TOKEN_BUDGET_HOPELESS_FACTOR
+        ):
+            raise HTTPException(
+                status_code=413,
+                detail=(
+                    'Código grande demais para análise: reduza o trecho '
+                    f'enviado (limite aproximado de {self.limit} tokens)'
+                ),
+            )
+
+        count = self.counter.count
+        history = list(history)
+        report = BudgetReport(
+            stage=stage,
+            model=self.model_name,
+            limit=self.limit,
+            prompt_tokens=count(prompt),
+            code_tokens=count(code),
+            history_tokens=sum(count(turn) for turn in history),
+            analysis_tokens=(
+                count(str(analysis.model_dump())) if analysis else 0
+            ),
+        )
+
+        while history and report.total_tokens > self.limit:
+            report.history_tokens -= count(history.pop(0))
+            if 'history' not in report.trimmed:
+                report.trimmed.append('history')
+
+        level = 0
+        while (
+            is_compactable(analysis)
+            and level < 2
+            and report.total_tokens > self.limit
+        ):
+            level += 1
+            analysis = compact_analysis(analysis, level)
+            report.analysis_tokens = count(str(analysis.model_dump()))
+            report.trimmed.append(f'analysis:{level}')
+
+        excess = report.total_tokens - self.limit
+        if excess > 0:
+            available = report.code_tokens - excess
+            if available <= 0:
+                raise HTTPException(
+                    status_code=413,
+                    detail=(
+                        'Entrada grande demais para o modelo '
+                        f'({report.total_tokens} de {self.limit} tokens)'
+                    ),
+                )
+            code = trim_code(code, int(available * CHARS_PER_TOKEN * 0.95))
+            report.code_tokens = count(code)
+            report.trimmed.append('code')
+
+        LLM_PROMPT_TOKENS.observe(
+            report.total_tokens,
+            endpoint=current_endpoint(),
+            stage=report.stage,
+            model=report.model,
+        )
+        logger.info(
+            'token budget stage=%s model=%s total=%d limit=%d prompt=%d '
+            'code=%d history=%d analysis=%d trimmed=%s',
+            report.stage,
+            report.model,
+            report.total_tokens,
+            report.limit,
+            report.prompt_tokens,
+            report.code_tokens,
+            report.history_tokens,
+            report.analysis_tokens,
+            ','.join(report.trimmed) or '-',
+        )
+        return code, history, analysis, report
@@ -1,28 +1,62 @@
 import asyncio
 import uuid
-from typing import Optional
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List, Optional
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.agents.code_analyser_agent import call_code_analyser_agent
-from app.agents.teacher_agent import call_teacher_agent_agent
-from app.core.deps import SessionDep
+from app.agents.code_analyser_agent import ModoAnalise, aget_code_analysis
+from app.agents.code_analyser_agent.batch import (
+    Submission,
+    batch_grader,
+)
+from app.agents.code_analyser_agent.cache import (
+    analysis_cache,
+    analysis_flights,
+)
+from app.agents.teacher_agent import stream_teacher_agent_agent
+from app.core.admission import admission
+from app.core.config import settings
+from app.core.deps import AsyncSessionDep, SessionDep, get_pool_status
+from app.core.metrics import MetricsMiddleware, registry, span
+from app.core.resumable import streams
+from app.core.similarity import similarity_index
+from app.core.sse import (
+    EVENT_STREAM_HEADERS,
+    EVENT_STREAM_MEDIA_TYPE,
+    accepts_event_stream,
+    format_event,
+    with_heartbeats,
+)
+from app.core.tasks import wait_background_tasks
 from app.crud import (
-    CodeAnalysisCreate,
-    StudentMessageCreate,
-    TeacherResponseCreate,
-    create_code_analysis,
-    create_student_message,
-    create_student_session,
-    create_teacher_response,
+    TutoringTurnCreate,
+    acreate_student_session,
+    astudent_session_exists,
 )
-from app.llm.langchain import (
-    langchain_make_question,
-    langchain_make_question_stream,
+from app.crud.analytics import (
+    AnalysisBreakdown,
+    BreakdownField,
+    ErrorCategory,
+    SessionErrorImpact,
+    SessionScore,
+    TopicCount,
+    aanalysis_breakdown,
+    asession_scores,
+    asessions_with_high_impact_errors,
+    atop_topics,
 )
+from app.crud.history import SessionHistoryPage, aget_session_history
+from app.crud.writer import writer
+from app.llm.langchain import langchain_make_question_stream
+from app.llm.routing import llm_router
+from app.llm.utils.budget import compact_analysis
+
 
 class QuestionRequest(BaseModel):
     """Modelo para requisições de perguntas sobre código"""
@@ -38,6 +72,24 @@ class QuestionRequest(BaseModel):
         ...,
         description="Código a ser analisado",
     )
+    analysis_mode: ModoAnalise = Field(
+        default=ModoAnalise.COMPLETA,
+        description="Profundidade da análise: `full` (completa) ou `quick` (rápida, para clientes sensíveis à latência)",
+    )
+
+
+class BatchGradingRequest(BaseModel):
+    """Modelo para a correção em lote das entregas de uma turma"""
+    items: List[Submission] = Field(
+        ...,
+        min_length=1,
+        max_length=settings.BATCH_GRADING_MAX_ITEMS,
+        description="Entregas dos alunos (`student_id`, `code` e `question`), todas do mesmo exercício ou não",
+    )
+    analysis_mode: ModoAnalise = Field(
+        default=ModoAnalise.COMPLETA,
+        description="Profundidade da análise de todas as entregas: `full` (completa) ou `quick` (rápida)",
+    )
 
 
 class StandardResponse(BaseModel):
@@ -51,7 +103,21 @@ class ErrorResponse(BaseModel):
     detail: str = Field(..., description="Descrição do erro")
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Inicia o writer assíncrono e grava o que estiver pendente no shutdown"""
+    writer.start()
+    if settings.SIMILARITY_INDEX_ENABLED:
+        # Carrega o snapshot e as análises novas em segundo plano
+        similarity_index.start()
+    yield
+    await wait_background_tasks()
+    await writer.stop()
+    await similarity_index.stop()
+
+
 app = FastAPI(
+    lifespan=lifespan,
     title="Sistema de Ensino com IA",
     description="""
     ## API de Ensino Assistido por Inteligência Artificial
@@ -85,8 +151,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=['*'],
     allow_headers=['*'],
-    expose_headers=['X-Session-ID'],
+    expose_headers=['X-Session-ID', 'X-Message-ID', 'X-Stream-Worker'],
 )
+app.add_middleware(MetricsMiddleware)
 
 
 async def fake_text_streamer():
@@ -102,6 +169,30 @@ async def fake_text_streamer():
         await asyncio.sleep(1)
 
 
+def sse_body(stream, after: int = 0):
+    """Eventos do turno em SSE (`id` = sequência), com heartbeats"""
+
+    async def events():
+        async for seq, event, data in stream.subscribe(after):
+            yield format_event(event, data, id=str(seq))
+
+    return with_heartbeats(events(), settings.SSE_HEARTBEAT_INTERVAL)
+
+
+async def text_body(stream, offset: int = 0):
+    """Só o texto do professor, a partir de `offset` caracteres"""
+    position = 0
+    async for _, event, data in stream.subscribe():
+        if event == 'teacher_delta':
+            text = data['text']
+            if position + len(text) > offset:
+                yield text[max(offset - position, 0):]
+            position += len(text)
+        elif event == 'error':
+            # Interrompe a resposta, como um erro no meio do stream
+            raise RuntimeError(data['detail'])
+
+
 @app.post(
     '/fake_stream',
     summary="Teste de Streaming",
@@ -143,15 +234,19 @@ async def fake_stream_endpoint(request_body: QuestionRequest):
     **Fluxo de processamento:**
     1. Cria/recupera sessão do estudante
     2. Analisa o código com Code Analyser Agent
-    3. Gera resposta pedagógica com Teacher Agent
-    4. Persiste dados no banco
-    5. Retorna resposta em streaming
+    3. Gera resposta pedagógica com Teacher Agent, enviada token a token
+    4. Enfileira o turno (mensagem, análise e resposta) para gravação em lote
+
+    Com `Accept: text/event-stream`, responde em Server-Sent Events tipados (`session`, `analysis_started`, `analysis_ready`, `teacher_delta`, `done` e `error`), com heartbeats durante a análise.
     """,
     response_class=StreamingResponse,
     responses={
         200: {
             "description": "Resposta pedagógica em streaming",
-            "content": {"text/plain": {"example": "Analisando seu código...\nSua função está bem estruturada..."}},
+            "content": {
+                "text/plain": {"example": "Analisando seu código...\nSua função está bem estruturada..."},
+                "text/event-stream": {"example": 'event: session\ndata: {"session_id": 7, "message_id": 120}\n\nevent: analysis_started\ndata: {"mode": "full"}\n\n: ping\n\nevent: analysis_ready\ndata: {"mode": "full", "cache_key": "...", "analysis": {...}}\n\nevent: teacher_delta\ndata: {"text": "Sua função"}\n\nevent: done\ndata: {"session_id": 7, "message_id": 120}\n\n'},
+            },
             "headers": {
                 "X-Session-ID": {
                     "description": "ID da sessão (criado automaticamente se não fornecido)",
@@ -159,12 +254,17 @@ async def fake_stream_endpoint(request_body: QuestionRequest):
                 }
             }
         },
+        404: {"model": ErrorResponse, "description": "Sessão informada não encontrada"},
         422: {"model": ErrorResponse, "description": "Erro de validação"},
-        500: {"model": ErrorResponse, "description": "Erro interno do servidor"}
+        429: {"model": ErrorResponse, "description": "Já existe um turno em andamento nesta sessão"},
+        500: {"model": ErrorResponse, "description": "Erro interno do servidor"},
+        503: {"model": ErrorResponse, "description": "Worker sem vaga para o turno (tente após `Retry-After`)"}
     },
     tags=["Agentes IA"]
 )
-async def call_agno_system(request_body: QuestionRequest, session: SessionDep):
+async def call_agno_system(
+    request_body: QuestionRequest, request: Request, session: AsyncSessionDep
+):
     """
     Endpoint principal que utiliza o sistema completo de ensino com IA.
 
@@ -178,6 +278,19 @@ async def call_agno_system(request_body: QuestionRequest, session: SessionDep):
     - **question**: Sua pergunta específica sobre o código
     - **code**: Código para análise (Python, JavaScript, etc.)
     - **session_id**: Opcional - permite continuidade da conversa
+    - **analysis_mode**: Opcional - `full` (padrão) ou `quick` (`AnaliseRapida`, várias vezes mais rápida)
+
+    **Modo SSE** (`Accept: text/event-stream`): o stream começa antes da análise, com o
+    evento `session`; `analysis_ready` traz a análise compacta (sem código corrigido nem
+    recursos), para o cliente mostrar a pontuação e os erros enquanto o professor escreve;
+    `teacher_delta` traz cada trecho da resposta. Erros depois do início do stream chegam
+    no evento `error` (`status_code` e `detail`), e um comentário `: ping` é enviado a cada
+    `SSE_HEARTBEAT_INTERVAL` segundos sem eventos.
+
+    **Retomada**: a geração continua se a conexão cair; o restante do stream é lido em
+    `GET /call/agno/stream/{X-Message-ID}?worker={X-Stream-Worker}` (com `Last-Event-ID`
+    no SSE ou `offset` no texto). O buffer fica na memória do worker que atendeu o turno,
+    então a retomada precisa ser encaminhada a ele (roteamento por `worker`).
 
     **Exemplo de uso:**
     ```python
@@ -187,72 +300,276 @@ async def call_agno_system(request_body: QuestionRequest, session: SessionDep):
     }
     ```
     """
+    # Sessão normalizada ("07" e "7" são a mesma); id inválido é 404
+    session_key = None
+    if request_body.session_id:
+        if not str(request_body.session_id).isdigit():
+            raise HTTPException(status_code=404, detail='Session not found')
+        session_key = int(request_body.session_id)
+
+    # Um turno ativo por sessão (entre workers) e limite de turnos
+    # simultâneos no worker (429/503 antes de qualquer trabalho); a vaga é
+    # liberada quando a geração termina
+    with span('admission'):
+        ticket = await admission.acquire(session_key)
+
+    event_stream = accepts_event_stream(request)
+    senior_analysis = cache_key = teacher_stream = None
     try:
         # Cria nova sessão se não fornecida
-        if not request_body.session_id:
-            student_session = await create_student_session(db=session)
-            request_body.session_id = student_session.id
-
-        # Salva mensagem do estudante
-        student_message = await create_student_message(
-            StudentMessageCreate(
-                session_id=int(request_body.session_id),
+        if session_key is None:
+            with span('session'):
+                student_session = await acreate_student_session(db=session)
+            session_id = student_session.id
+        else:
+            # Sessão informada pelo cliente: 404 antes das chamadas ao LLM
+            # (sem ela, o turno só falharia depois, na gravação em lote)
+            with span('session'):
+                exists = await astudent_session_exists(session_key, session)
+            if not exists:
+                raise HTTPException(
+                    status_code=404, detail='Session not found'
+                )
+            session_id = session_key
+        request_body.session_id = str(session_id)
+
+        # Id da mensagem reservado agora; a gravação acontece depois
+        with span('message_id'):
+            message_id = await writer.reserve_message_id()
+
+        if not event_stream:
+            # No modo texto a análise e o prompt do professor vêm antes da
+            # resposta, e os erros (ex.: 413) saem com o status HTTP
+            senior_analysis, cache_key = await aget_code_analysis(
+                session_id=str(session_id),
                 code=request_body.code,
-                message=request_body.question,
-            ),
-            session,
-        )
+                question=request_body.question,
+                db=session,
+                mode=request_body.analysis_mode,
+            )
+            teacher_stream = await stream_teacher_agent_agent(
+                session_id=str(session_id),
+                code=request_body.code,
+                question=request_body.question,
+                code_analysis=senior_analysis,
+            )
 
-        # Executa análise de código
-        senior_analysis = call_code_analyser_agent(
-            session_id=str(request_body.session_id),
-            code=request_body.code,
-            question=request_body.question,
-        )
+    except HTTPException:
+        await ticket.arelease()
+        raise
 
-        # Salva análise no banco
-        await create_code_analysis(
-            CodeAnalysisCreate(
-                message_id=student_message.id,
-                analysis=senior_analysis.model_dump(),
-            ),
-            session,
+    except Exception as e:
+        await ticket.arelease()
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erro no sistema de agentes: {str(e)}"
         )
 
-        # Gera resposta pedagógica
-        teacher_message = call_teacher_agent_agent(
-            session_id=str(request_body.session_id),
-            code=request_body.code,
-            question=request_body.question,
-            code_analysis=senior_analysis,
-        )
+    async def tutoring_events():
+        """
+        Eventos do turno; erros viram o evento `error`. Roda numa task
+        própria (`streams`), que continua se o cliente cair
+        """
+        nonlocal senior_analysis, cache_key, teacher_stream
+        chunks = []
+        try:
+            ids = {'session_id': session_id, 'message_id': message_id}
+            yield 'session', ids
+            yield 'analysis_started', {'mode': request_body.analysis_mode.value}
+            if senior_analysis is None:
+                # A sessão da requisição fecha quando o endpoint retorna;
+                # aqui, uma própria no mesmo engine
+                async with AsyncSession(session.bind) as db:
+                    senior_analysis, cache_key = await aget_code_analysis(
+                        session_id=str(session_id),
+                        code=request_body.code,
+                        question=request_body.question,
+                        db=db,
+                        mode=request_body.analysis_mode,
+                    )
+            # Sem código corrigido nem recursos: o cliente já pode mostrar a
+            # pontuação e o resumo dos erros
+            yield 'analysis_ready', {
+                'mode': request_body.analysis_mode.value,
+                'cache_key': cache_key,
+                'analysis': compact_analysis(
+                    senior_analysis, level=2
+                ).model_dump(mode='json'),
+            }
 
-        # Salva resposta do professor
-        await create_teacher_response(
-            TeacherResponseCreate(
-                message_id=student_message.id,
-                response=teacher_message
-            ),
-            session,
+            if teacher_stream is None:
+                teacher_stream = await stream_teacher_agent_agent(
+                    session_id=str(session_id),
+                    code=request_body.code,
+                    question=request_body.question,
+                    code_analysis=senior_analysis,
+                )
+            async for chunk in teacher_stream:
+                chunks.append(chunk)
+                yield 'teacher_delta', {'text': chunk}
+
+            yield 'done', ids
+        except Exception as e:
+            yield 'error', {
+                'status_code': getattr(e, 'status_code', 500),
+                'detail': (
+                    e.detail
+                    if isinstance(e, HTTPException)
+                    else f"Erro no sistema de agentes: {str(e)}"
+                ),
+            }
+        finally:
+            try:
+                if senior_analysis is not None:
+                    # Mensagem, análise e resposta vão para a fila de
+                    # gravação em lote. Com a fila cheia, o turno aguarda
+                    # aqui segurando a vaga da admissão: a pressão chega
+                    # aos novos turnos como 503, sem acumular turnos na
+                    # memória
+                    await writer.submit(
+                        TutoringTurnCreate(
+                            message_id=message_id,
+                            session_id=session_id,
+                            code=request_body.code,
+                            message=request_body.question,
+                            analysis=senior_analysis.model_dump(),
+                            cache_key=cache_key,
+                            response=''.join(chunks) or None,
+                        )
+                    )
+            finally:
+                await ticket.arelease()
+
+    stream = streams.start(message_id, tutoring_events())
+    headers = {
+        'X-Session-ID': str(session_id),
+        'X-Message-ID': str(message_id),
+        # Worker com o buffer do turno, para encaminhar a retomada
+        'X-Stream-Worker': streams.worker_id,
+    }
+    if event_stream:
+        return StreamingResponse(
+            sse_body(stream),
+            media_type=EVENT_STREAM_MEDIA_TYPE,
+            headers={**EVENT_STREAM_HEADERS, **headers},
         )
+    return StreamingResponse(
+        text_body(stream), media_type='text/plain', headers=headers
+    )
 
-        def stream_response(teacher_message):
-            """Gerador para streaming da resposta"""
-            for chunk in teacher_message:
-                yield chunk
 
+@app.get(
+    '/call/agno/stream/{message_id}',
+    summary="Retomar Stream",
+    description="Continua o stream de um turno de `/call/agno/` a partir do ponto em que a conexão caiu, sem gerar a resposta de novo",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "description": "Restante do stream, no mesmo formato do original (texto ou SSE, conforme o `Accept`)",
+            "content": {
+                "text/plain": {"example": "...continuação da resposta"},
+                "text/event-stream": {"example": 'id: 12\nevent: teacher_delta\ndata: {"text": "continuação"}\n\n'},
+            },
+        },
+        404: {"model": ErrorResponse, "description": "Stream expirado ou iniciado em outro worker (consulte o histórico da sessão)"},
+        421: {"model": ErrorResponse, "description": "Retomada chegou a outro worker que não o de `worker` (encaminhe ao worker do `X-Stream-Worker` ou tente de novo em outra conexão)"},
+    },
+    tags=["Agentes IA"]
+)
+async def resume_agno_stream(
+    message_id: int,
+    request: Request,
+    last_event_id: Optional[int] = Header(None, ge=0, description="`id` do último evento SSE recebido"),
+    offset: int = Query(0, ge=0, description="Modo texto: caracteres da resposta já recebidos"),
+    worker: Optional[str] = Query(None, description="`X-Stream-Worker` do turno"),
+):
+    """
+    Os eventos de cada turno (`X-Message-ID`) ficam num buffer do worker
+    com números de sequência, e a geração continua sem o cliente por
+    `STREAM_RESUME_GRACE` segundos. Terminado o turno, o buffer fica
+    disponível por `STREAM_RESUME_TTL` segundos.
+
+    O buffer não é compartilhado entre workers: a retomada precisa chegar
+    ao worker do `X-Stream-Worker` (o proxy roteia pelo parâmetro `worker`).
+    Em outro worker, a resposta é 421; sem o buffer, o turno é lido em
+    `/sessions/{session_id}/history` depois de gravado.
+
+    - **SSE** (`Accept: text/event-stream`): eventos depois de `Last-Event-ID`;
+    - **texto**: a resposta do professor a partir de `offset` caracteres.
+    """
+    if worker is not None and worker != streams.worker_id:
+        raise HTTPException(
+            status_code=421,
+            detail=f"Stream pertence ao worker {worker}",
+        )
+    stream = streams.get(message_id)
+    if stream is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Stream não encontrado ou expirado; consulte o histórico da sessão",
+        )
+    if accepts_event_stream(request):
         return StreamingResponse(
-            stream_response(teacher_message),
-            media_type='text/plain',
-            headers={'X-Session-ID': str(request_body.session_id)},
+            sse_body(stream, after=last_event_id or 0),
+            media_type=EVENT_STREAM_MEDIA_TYPE,
+            headers=EVENT_STREAM_HEADERS,
         )
+    return StreamingResponse(
+        text_body(stream, offset=offset), media_type='text/plain'
+    )
+
+
+@app.post(
+    '/call/agno/batch/',
+    summary="Correção em Lote",
+    description="""
+    Analisa as entregas de uma turma inteira em um único pedido, com o Code Analyser Agent.
 
+    **Fluxo de processamento:**
+    1. Cria uma sessão por entrega, todas em um único insert
+    2. Analisa as entregas em paralelo (até `BATCH_GRADING_CONCURRENCY` por vez no worker, somando os lotes simultâneos), reaproveitando o cache de análises
+    3. Envia o resultado de cada entrega assim que ela termina, uma linha JSON por entrega (NDJSON)
+    4. Grava mensagens e análises com inserts em massa
+    """,
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "description": "Uma linha JSON por entrega (`event: item`, fora de ordem) e uma linha final com o resumo (`event: done`)",
+            "content": {"application/x-ndjson": {"example": '{"event":"item","index":0,"student_id":42,"session_id":7,"message_id":120,"status":"ok","analysis":{},"cache_key":"...","detail":null,"duration":3.2}\n{"event":"done","total":1,"succeeded":1,"failed":0,"duration":3.3}\n'}},
+        },
+        422: {"model": ErrorResponse, "description": "Erro de validação (inclui lotes acima de `BATCH_GRADING_MAX_ITEMS`)"},
+        500: {"model": ErrorResponse, "description": "Erro interno do servidor"}
+    },
+    tags=["Agentes IA"]
+)
+async def call_agno_batch(request_body: BatchGradingRequest):
+    """
+    Correção em lote de um exercício (30 a 200 entregas).
+
+    Cada linha traz o `index` da entrega no pedido, a sessão e a mensagem
+    criadas e a análise (`status: ok`) ou o motivo da falha
+    (`status: error`, as demais entregas seguem). Entregas idênticas
+    compartilham uma única chamada ao LLM. Se a conexão cair, a correção
+    continua e os resultados são gravados mesmo assim.
+    """
+    try:
+        results = await batch_grader.grade(
+            request_body.items, mode=request_body.analysis_mode
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
-            detail=f"Erro no sistema de agentes: {str(e)}"
+            detail=f"Erro na correção em lote: {str(e)}"
         )
 
+    async def stream_lines():
+        async for result in results:
+            yield result.model_dump_json() + '\n'
+
+    return StreamingResponse(
+        stream_lines(), media_type='application/x-ndjson'
+    )
+
 
 @app.post(
     '/call/langchain/',
@@ -319,6 +636,153 @@ def call_langchain_stream(request_body: QuestionRequest, session: SessionDep):
         )
 
 
+@app.get(
+    "/sessions/{session_id}/history",
+    summary="Histórico da Sessão",
+    description="Turnos da sessão (mensagem, resposta e resumo da análise), do mais recente ao mais antigo, com paginação por cursor",
+    response_model=SessionHistoryPage,
+    responses={
+        400: {"model": ErrorResponse, "description": "Cursor inválido"},
+        404: {"model": ErrorResponse, "description": "Sessão não encontrada"},
+    },
+    tags=["Sessões"]
+)
+async def session_history(
+    session_id: int,
+    session: AsyncSessionDep,
+    limit: int = Query(20, ge=1, le=100, description="Turnos por página"),
+    cursor: Optional[str] = Query(None, description="`next_cursor` da página anterior"),
+    include_code: bool = Query(False, description="Inclui o código enviado em cada turno"),
+    include_analysis: bool = Query(False, description="Inclui o JSON completo da análise"),
+):
+    """
+    Cada página é lida com uma única consulta (mensagens, análises e
+    respostas unidas por join), com paginação por chave (`created_at`,
+    `id`): o custo não cresce com a profundidade da página. Sem
+    `include_code`/`include_analysis`, os campos pesados ficam de fora e a
+    análise vem resumida (`summary`: pontuação, nível, linguagem e total de
+    erros).
+    """
+    return await aget_session_history(
+        session_id,
+        session,
+        limit=limit,
+        cursor=cursor,
+        include_code=include_code,
+        include_analysis=include_analysis,
+    )
+
+
+@app.get(
+    "/analytics/sessions/scores",
+    summary="Pontuação por Sessão",
+    description="Média, mínima e máxima de `pontuacao_geral` por sessão, calculadas no banco",
+    response_model=List[SessionScore],
+    tags=["Analytics"]
+)
+async def analytics_session_scores(
+    session: AsyncSessionDep,
+    since: Optional[datetime] = Query(None, description="Só análises a partir desta data"),
+    level: Optional[str] = Query(None, description="Nível do aluno (ex.: INICIANTE)"),
+    language: Optional[str] = Query(None, description="Linguagem, sem diferenciar maiúsculas (ex.: python)"),
+    min_analyses: int = Query(1, ge=1, description="Mínimo de análises na sessão"),
+    limit: int = Query(50, ge=1, le=1000),
+):
+    """
+    Sessões mais recentes primeiro. A pontuação vem de `pontuacao_geral`
+    (análise completa) ou `pontuacao` (análise rápida).
+    """
+    return await asession_scores(
+        session,
+        since=since,
+        level=level,
+        language=language,
+        min_analyses=min_analyses,
+        limit=limit,
+    )
+
+
+@app.get(
+    "/analytics/topics",
+    summary="Tópicos Mais Frequentes",
+    description="Contagem dos `topicos_envolvidos` das análises, sem diferenciar maiúsculas",
+    response_model=List[TopicCount],
+    tags=["Analytics"]
+)
+async def analytics_topics(
+    session: AsyncSessionDep,
+    since: Optional[datetime] = Query(None, description="Só análises a partir desta data"),
+    session_id: Optional[int] = Query(None, description="Restringe a uma sessão"),
+    level: Optional[str] = Query(None, description="Nível do aluno (ex.: INICIANTE)"),
+    language: Optional[str] = Query(None, description="Linguagem, sem diferenciar maiúsculas (ex.: python)"),
+    limit: int = Query(20, ge=1, le=500),
+):
+    """Tópicos identificados nas análises completas, do mais frequente ao menos frequente."""
+    return await atop_topics(
+        session,
+        since=since,
+        session_id=session_id,
+        level=level,
+        language=language,
+        limit=limit,
+    )
+
+
+@app.get(
+    "/analytics/sessions/high-impact-errors",
+    summary="Sessões com Erros de Alto Impacto",
+    description="Sessões cujas análises têm erros de impacto `alto` na categoria escolhida",
+    response_model=List[SessionErrorImpact],
+    tags=["Analytics"]
+)
+async def analytics_high_impact_errors(
+    session: AsyncSessionDep,
+    category: ErrorCategory = Query(ErrorCategory.LOGICOS, description="Categoria de erro"),
+    since: Optional[datetime] = Query(None, description="Só análises a partir desta data"),
+    level: Optional[str] = Query(None, description="Nível do aluno (ex.: INICIANTE)"),
+    language: Optional[str] = Query(None, description="Linguagem, sem diferenciar maiúsculas (ex.: python)"),
+    limit: int = Query(50, ge=1, le=1000),
+):
+    """
+    Ordenadas pelo número de análises com esse tipo de erro. No PostgreSQL
+    o filtro usa o índice GIN da coluna `analysis`.
+    """
+    return await asessions_with_high_impact_errors(
+        session,
+        category=category,
+        since=since,
+        level=level,
+        language=language,
+        limit=limit,
+    )
+
+
+@app.get(
+    "/analytics/breakdown",
+    summary="Distribuição por Nível ou Linguagem",
+    description="Número de análises, pontuação média e média de erros por nível do aluno ou linguagem",
+    response_model=List[AnalysisBreakdown],
+    tags=["Analytics"]
+)
+async def analytics_breakdown(
+    session: AsyncSessionDep,
+    by: BreakdownField = Query(..., description="`level` ou `language`"),
+    since: Optional[datetime] = Query(None, description="Só análises a partir desta data"),
+    session_id: Optional[int] = Query(None, description="Restringe a uma sessão"),
+    level: Optional[str] = Query(None, description="Nível do aluno (ex.: INICIANTE)"),
+    language: Optional[str] = Query(None, description="Linguagem, sem diferenciar maiúsculas (ex.: python)"),
+):
+    """Agrupa pelas mesmas expressões dos índices de nível e linguagem."""
+    return await aanalysis_breakdown(
+        session,
+        by=by,
+        since=since,
+        session_id=session_id,
+        level=level,
+        language=language,
+    )
+
+
 @app.get(
     "/health",
     summary="Health Check",
@@ -339,6 +803,127 @@ def health_check():
     }
 
 
+@app.get(
+    "/health/db",
+    summary="Pools de Conexão",
+    description="Métricas dos pools de conexão com o banco deste worker",
+    response_model=dict,
+    tags=["Sistema"]
+)
+def db_pool_status():
+    """
+    Retorna o estado dos pools de conexão (tamanho, conexões em uso,
+    disponíveis e overflow) do engine síncrono, usado pelo storage de
+    sessões do agno, e do engine assíncrono, usado pelos endpoints,
+    além dos contadores da fila de gravação assíncrona.
+    """
+    return {**get_pool_status(), 'write_behind': writer.status()}
+
+
+@app.get(
+    "/metrics",
+    summary="Métricas (Prometheus)",
+    description="Histogramas de latência por etapa e de tokens no formato de texto do Prometheus",
+    response_class=PlainTextResponse,
+    tags=["Sistema"]
+)
+def metrics():
+    """
+    Exporta, por worker, a duração das requisições e o TTFB, a duração de
+    cada etapa do turno de tutoria (`tutoring_stage_duration_seconds`), os
+    tokens e caracteres por chamada ao LLM e os lotes gravados pelo writer,
+    com labels de endpoint, modelo e resultado (`ok`, `rejected`,
+    `cancelled`, `error`).
+    """
+    return PlainTextResponse(
+        registry.render(),
+        media_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+@app.get(
+    "/health/cache",
+    summary="Cache de Análises",
+    description="Contadores de acerto/erro do cache de análises de código",
+    response_model=dict,
+    tags=["Sistema"]
+)
+def analysis_cache_status():
+    """
+    Retorna os acertos no cache em memória (`memory_hits`), na tabela
+    `code_analysis` (`db_hits`), as buscas sem acerto (`misses`) e a taxa de
+    acerto deste worker, além das análises agrupadas (`single_flight`):
+    `leaders` iniciaram uma análise e `followers` aguardaram uma análise
+    idêntica já em andamento. Em `similarity`, o índice de envios quase
+    idênticos: buscas, buscas com candidato, análises reaproveitadas como
+    estão (`reused`) ou adaptadas pelo LLM (`adapted`) e entradas indexadas.
+    """
+    return {
+        **analysis_cache.stats.as_dict(),
+        'memory_entries': len(analysis_cache.memory),
+        'single_flight': {
+            **analysis_flights.stats.as_dict(),
+            'in_flight': len(analysis_flights),
+        },
+        'similarity': similarity_index.status(),
+    }
+
+
+@app.get(
+    "/health/admission",
+    summary="Admissão de Turnos",
+    description="Turnos em andamento, fila de espera e rejeições do controle de admissão do worker",
+    response_model=dict,
+    tags=["Sistema"]
+)
+def admission_status():
+    """
+    Retorna, por worker, os turnos em andamento (`in_flight`), na fila
+    (`queued`) e as sessões com turno ativo ou na fila (`active_sessions`),
+    os turnos admitidos e os recusados por sessão ocupada
+    (`rejected_session`, 429), fila cheia (`rejected_queue_full`), espera
+    estimada acima do prazo (`rejected_deadline`) e prazo esgotado na fila
+    (`timeouts`), além da média móvel da duração dos turnos.
+    """
+    return admission.status()
+
+
+@app.get(
+    "/health/streams",
+    summary="Streams Retomáveis",
+    description="Turnos em geração e buffers de eventos disponíveis para retomada neste worker",
+    response_model=dict,
+    tags=["Sistema"]
+)
+def streams_status():
+    """
+    Retorna, por worker, os streams iniciados, concluídos, abandonados
+    (sem cliente por `STREAM_RESUME_GRACE` segundos, geração cancelada),
+    retomados e removidos do buffer, além dos turnos ainda em geração
+    (`running`), dos buffers guardados e do total de eventos neles.
+    """
+    return streams.status()
+
+
+@app.get(
+    "/health/llm",
+    summary="Provedores de LLM",
+    description="Estado do circuit breaker, latência e contadores de hedge/failover por provedor",
+    response_model=dict,
+    tags=["Sistema"]
+)
+def llm_router_status():
+    """
+    Retorna, por worker, os pedidos roteados (`requests`), os pedidos
+    duplicados para outro provedor (`hedges`), as trocas de provedor após
+    erro ou timeout (`failovers`) e as chamadas sem provedor disponível
+    (`unavailable`). Para cada provedor: estado do circuito (`closed`,
+    `open` ou `half_open`), sucessos, falhas, falhas seguidas e a média
+    móvel da latência até a resposta ou o primeiro token.
+    """
+    return llm_router.status()
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -1,6 +1,10 @@
 from datetime import datetime
 from typing import Optional
 
+from sqlalchemy import Index, Integer, func
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.sql.elements import BindParameter
+from sqlalchemy.sql.visitors import replacement_traverse
 from sqlmodel import JSON, Column, Field, SQLModel
 
 from app.core.deps import engine
@@ -26,14 +30,22 @@ class StudentMessage(SQLModel, table=True):
     __table_args__ = {'extend_existing': True, 'schema': schema_name}
 
     id: Optional[int] = Field(default=None, primary_key=True)
-    session_id: int = Field(
-        foreign_key=f'{schema_name}.student_session.id', index=True
-    )
+    session_id: int = Field(foreign_key=f'{schema_name}.student_session.id')
     code: str
     message: str
     created_at: datetime = Field(default_factory=datetime.now)
 
 
+# A session's turns in order (keyset pagination of the history); also
+# serves lookups by session_id alone
+Index(
+    'ix_gpt_teacher_student_messages_session_id_created_at',
+    StudentMessage.__table__.c.session_id,
+    StudentMessage.__table__.c.created_at,
+    StudentMessage.__table__.c.id,
+)
+
+
 class CodeAnalysis(SQLModel, table=True):
     """Code analysis model"""
 
@@ -44,8 +56,67 @@ class CodeAnalysis(SQLModel, table=True):
     message_id: int = Field(
         foreign_key=f'{schema_name}.student_messages.id', index=True
     )
-    analysis: dict = Field(sa_column=Column(JSON), default={})
-    created_at: datetime = Field(default_factory=datetime.now)
+    # JSONB on PostgreSQL (indexable, no re-parsing on every read)
+    analysis: dict = Field(
+        sa_column=Column(JSON().with_variant(JSONB(), 'postgresql')),
+        default={},
+    )
+    cache_key: Optional[str] = Field(default=None, max_length=64, index=True)
+    created_at: datetime = Field(default_factory=datetime.now, index=True)
+
+
+def _analysis_field(full_path: tuple, quick_key: str, as_type: str):
+    """
+    Hot field of a stored analysis: `full_path` in an AnaliseCodigoCompleta,
+    `quick_key` in an AnaliseRapida.
+    """
+    column = CodeAnalysis.__table__.c.analysis
+    expression = func.coalesce(
+        getattr(column[full_path], as_type)(),
+        getattr(column[quick_key], as_type)(),
+    )
+    # JSON keys rendered inline, as in the index DDL: a bound parameter
+    # (e.g. in a prepared statement's generic plan) doesn't match the index
+    return replacement_traverse(
+        expression,
+        {},
+        lambda element: (
+            element.render_literal_execute()
+            if isinstance(element, BindParameter)
+            else None
+        ),
+    )
+
+
+# Expressions shared by the expression indexes below and the analytics
+# queries (app.crud.analytics): the planner only uses an expression index
+# when the query repeats the exact same expression
+ANALYSIS_SCORE = _analysis_field(
+    ('analise_geral', 'pontuacao_geral'), 'pontuacao', 'as_integer'
+)
+ANALYSIS_LEVEL = _analysis_field(
+    ('analise_geral', 'nivel_aluno'), 'nivel_aluno', 'as_string'
+)
+ANALYSIS_LANGUAGE = func.lower(
+    _analysis_field(
+        ('analise_geral', 'linguagem_programacao'), 'linguagem', 'as_string'
+    )
+)
+ANALYSIS_TOTAL_ERRORS = _analysis_field(
+    ('diagnostico_erros', 'total_erros'), 'total_erros', 'as_integer'
+)
+
+Index('ix_gpt_teacher_code_analysis_score', ANALYSIS_SCORE)
+Index('ix_gpt_teacher_code_analysis_level', ANALYSIS_LEVEL)
+Index('ix_gpt_teacher_code_analysis_language', ANALYSIS_LANGUAGE)
+Index('ix_gpt_teacher_code_analysis_total_errors', ANALYSIS_TOTAL_ERRORS)
+# Containment queries (`analysis @> ...`), e.g. topics and error impact
+Index(
+    'ix_gpt_teacher_code_analysis_analysis_gin',
+    CodeAnalysis.__table__.c.analysis,
+    postgresql_using='gin',
+    postgresql_ops={'analysis': 'jsonb_path_ops'},
+).ddl_if(dialect='postgresql')
 
 
 class TeacherResponse(SQLModel, table=True):
@@ -62,8 +133,24 @@ class TeacherResponse(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.now)
 
 
+class SessionTurnLease(SQLModel, table=True):
+    """Active tutoring turn of a session, shared by all workers"""
+
+    __tablename__ = 'session_turn_leases'
+    __table_args__ = {'extend_existing': True, 'schema': schema_name}
+
+    session_id: int = Field(
+        sa_column=Column(Integer, primary_key=True, autoincrement=False)
+    )
+    # Token of the turn holding the lease (only it may release it)
+    holder: str = Field(max_length=32)
+    # A lease left behind by a crashed worker is taken over after this
+    expires_at: datetime
+
+
 if __name__ == '__main__':
     StudentSession.metadata.create_all(engine)
     StudentMessage.metadata.create_all(engine)
     CodeAnalysis.metadata.create_all(engine)
     TeacherResponse.metadata.create_all(engine)
+    SessionTurnLease.metadata.create_all(engine)
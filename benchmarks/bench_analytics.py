@@ -0,0 +1,309 @@
+"""Benchmark das consultas de analytics sobre `code_analysis`.
+
+Popula a tabela com análises sintéticas (completas e rápidas) e mede cada
+consulta de `app.crud.analytics`, com e sem os índices de expressão, além
+de mostrar o plano de execução. Por padrão usa um SQLite temporário (sem o
+índice GIN, exclusivo do PostgreSQL); `--database postgres` usa as
+variáveis `POSTGRES_*` da aplicação, mas grava em um schema descartável
+próprio (`<schema>_bench_<pid>`), criado no início e apagado no fim: o
+schema da aplicação não é lido nem alterado.
+
+Uso:
+    python -m benchmarks.bench_analytics --rows 200000
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, event, insert, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.schema import CreateIndex, DropIndex
+from sqlmodel import SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.crud.analytics import (
+    BreakdownField,
+    ErrorCategory,
+    aanalysis_breakdown,
+    asession_scores,
+    asessions_with_high_impact_errors,
+    atop_topics,
+)
+from app.models import (
+    CodeAnalysis,
+    StudentMessage,
+    StudentSession,
+    schema_name,
+)
+
+LEVELS = ['INICIANTE', 'INTERMEDIARIO', 'AVANCADO', 'EXPERT']
+LANGUAGES = ['Python', 'JavaScript', 'Java', 'C', 'Go']
+TOPICS = [
+    'Funções', 'Recursão', 'Listas', 'Dicionários', 'Classes', 'Loops',
+    'Condicionais', 'Ordenação', 'SQL', 'APIs', 'Testes', 'Strings',
+]
+IMPACTS = ['baixo', 'medio', 'alto']
+CATEGORIES = [category.value for category in ErrorCategory]
+# Índices de expressão (o GIN só existe no PostgreSQL)
+EXPRESSION_INDEXES = ('score', 'level', 'language', 'total_errors')
+
+
+def fake_analysis(rng: random.Random) -> dict:
+    level = rng.choice(LEVELS)
+    language = rng.choice(LANGUAGES)
+    score = rng.randint(0, 100)
+    if rng.random() < 0.2:
+        return {
+            'nivel_aluno': level,
+            'linguagem': language,
+            'total_erros': rng.randint(0, 5),
+            'pontuacao': score,
+            'principais_problemas': [],
+            'sugestoes': [],
+        }
+
+    errors = {category: [] for category in CATEGORIES}
+    for _ in range(rng.randint(0, 4)):
+        errors[rng.choice(CATEGORIES)].append(
+            {
+                'tipo': 'erro',
+                'descricao': 'descrição',
+                'correcao_sugerida': 'correção',
+                'impacto_aprendizado': rng.choice(IMPACTS),
+            }
+        )
+    return {
+        'analise_geral': {
+            'nivel_aluno': level,
+            'linguagem_programacao': language,
+            'objetivo_codigo': 'objetivo',
+            'topicos_envolvidos': rng.sample(TOPICS, rng.randint(1, 3)),
+            'pontuacao_geral': score,
+        },
+        'diagnostico_erros': {
+            'total_erros': sum(len(items) for items in errors.values()),
+            'erros_por_categoria': errors,
+        },
+        'feedback_construtivo': {
+            'pontos_fortes': [],
+            'areas_melhoria': [],
+            'proximos_passos': [],
+            'recursos_recomendados': [],
+        },
+        'codigo_melhorado': {'incluir': False, 'explicacao_mudancas': ''},
+    }
+
+
+def seed(engine, rows: int, sessions: int) -> None:
+    rng = random.Random(42)
+    start = datetime.now() - timedelta(days=365)
+    with engine.begin() as connection:
+        connection.execute(
+            insert(StudentSession),
+            [{'id': i, 'created_at': start} for i in range(1, sessions + 1)],
+        )
+        for offset in range(0, rows, 10_000):
+            ids = range(offset + 1, min(rows, offset + 10_000) + 1)
+            created = [start + timedelta(seconds=i * 30) for i in ids]
+            connection.execute(
+                insert(StudentMessage),
+                [
+                    {
+                        'id': i,
+                        'session_id': rng.randint(1, sessions),
+                        'code': '',
+                        'message': '',
+                        'created_at': at,
+                    }
+                    for i, at in zip(ids, created)
+                ],
+            )
+            connection.execute(
+                insert(CodeAnalysis),
+                [
+                    {
+                        'message_id': i,
+                        'analysis': fake_analysis(rng),
+                        'created_at': at,
+                    }
+                    for i, at in zip(ids, created)
+                ],
+            )
+
+
+def expression_indexes():
+    return [
+        index
+        for index in CodeAnalysis.__table__.indexes
+        if index.name.rsplit('code_analysis_', 1)[-1] in EXPRESSION_INDEXES
+    ]
+
+
+def explain(engine, statement: str, parameters) -> str:
+    prefix = (
+        'EXPLAIN QUERY PLAN '
+        if engine.dialect.name == 'sqlite'
+        else 'EXPLAIN '
+    )
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql(prefix + statement, parameters)
+        return '\n'.join(f'    {row[-1]}' for row in rows)
+
+
+QUERIES = {
+    'scores por sessão': lambda db: asession_scores(db, limit=50),
+    'scores (python, iniciante)': lambda db: asession_scores(
+        db, level='INICIANTE', language='python', limit=50
+    ),
+    'top tópicos': lambda db: atop_topics(db, limit=10),
+    'top tópicos (avançado)': lambda db: atop_topics(
+        db, level='AVANCADO', limit=10
+    ),
+    'erros lógicos alto impacto': lambda db: (
+        asessions_with_high_impact_errors(db, limit=50)
+    ),
+    'breakdown por linguagem': lambda db: aanalysis_breakdown(
+        db, by=BreakdownField.LANGUAGE
+    ),
+    'breakdown por nível (go)': lambda db: aanalysis_breakdown(
+        db, by=BreakdownField.LEVEL, language='go'
+    ),
+}
+
+
+async def time_queries(session_maker, repeat: int, captured=None) -> dict:
+    timings = {}
+    async with session_maker() as db:
+        for name, query in QUERIES.items():
+            if captured is not None:
+                captured[name] = None
+            best = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                await query(db)
+                best = min(best, time.perf_counter() - start)
+            timings[name] = best
+    return timings
+
+
+def run(args, engine, async_engine, bench_schema: str) -> None:
+    SQLModel.metadata.create_all(engine)
+    start = time.perf_counter()
+    seed(engine, args.rows, args.sessions)
+    with engine.begin() as connection:
+        connection.execute(
+            text('ANALYZE')
+            if args.database == 'sqlite'
+            else text(f'ANALYZE {bench_schema}.code_analysis')
+        )
+    print(
+        f'{args.rows} análises em {args.sessions} sessões '
+        f'({time.perf_counter() - start:.1f}s para popular)'
+    )
+
+    session_maker = async_sessionmaker(
+        async_engine, class_=AsyncSession, expire_on_commit=False
+    )
+    # SQL de cada consulta, para o EXPLAIN
+    captured = {}
+
+    @event.listens_for(async_engine.sync_engine, 'before_cursor_execute')
+    def capture(conn, cursor, statement, parameters, context, many):
+        for name, value in captured.items():
+            if value is None:
+                captured[name] = (statement, parameters)
+
+    with_indexes = asyncio.run(
+        time_queries(session_maker, args.repeat, captured)
+    )
+    event.remove(async_engine.sync_engine, 'before_cursor_execute', capture)
+    if args.plans:
+        for name, (statement, parameters) in captured.items():
+            print(f'\n{name}:\n{explain(engine, statement, parameters)}')
+
+    with engine.begin() as connection:
+        for index in expression_indexes():
+            connection.execute(DropIndex(index))
+    without_indexes = asyncio.run(
+        time_queries(session_maker, args.repeat)
+    )
+    with engine.begin() as connection:
+        for index in expression_indexes():
+            connection.execute(CreateIndex(index))
+
+    print(f'\n{"consulta":<30} {"com índices":>12} {"sem índices":>12}')
+    for name in QUERIES:
+        print(
+            f'{name:<30} {with_indexes[name] * 1000:>10.1f}ms '
+            f'{without_indexes[name] * 1000:>10.1f}ms'
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--sessions', type=int, default=2_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument(
+        '--database', choices=['sqlite', 'postgres'], default='sqlite'
+    )
+    parser.add_argument(
+        '--plans', action='store_true', help='mostra os planos de execução'
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        bench_schema = schema_name
+        if args.database == 'sqlite':
+            schema_file = os.path.join(directory, f'{schema_name}.db')
+
+            def attach_schema(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                cursor.execute(
+                    f"ATTACH DATABASE '{schema_file}' AS {schema_name}"
+                )
+                cursor.close()
+
+            main_file = os.path.join(directory, 'bench.db')
+            engine = create_engine(f'sqlite:///{main_file}')
+            async_engine = create_async_engine(
+                f'sqlite+aiosqlite:///{main_file}'
+            )
+            for sync_engine in (engine, async_engine.sync_engine):
+                event.listen(sync_engine, 'connect', attach_schema)
+        else:
+            from app.core.config import settings
+
+            # As tabelas (declaradas em `schema_name`) vão para um schema
+            # só do benchmark; nunca usa os engines de `app.core.deps`
+            bench_schema = f'{schema_name}_bench_{os.getpid()}'
+            options = {'schema_translate_map': {schema_name: bench_schema}}
+            engine = create_engine(
+                str(settings.sqlalchemy_db_uri), execution_options=options
+            )
+            async_engine = create_async_engine(
+                str(settings.sqlalchemy_async_db_uri),
+                execution_options=options,
+            )
+            with engine.begin() as connection:
+                connection.execute(text(f'CREATE SCHEMA {bench_schema}'))
+
+        try:
+            run(args, engine, async_engine, bench_schema)
+        finally:
+            if args.database == 'postgres':
+                with engine.begin() as connection:
+                    connection.execute(
+                        text(f'DROP SCHEMA {bench_schema} CASCADE')
+                    )
+            asyncio.run(async_engine.dispose())
+            engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""Benchmark de concorrência do pipeline de agentes (analyser + teacher).
+
+Compara o caminho bloqueante (`agent.run` chamado dentro de um handler
+`async`) com o caminho assíncrono (`agent.arun`) sob N requisições
+simultâneas em um único event loop, como acontece em um worker Uvicorn.
+
+Os agentes são substituídos por stubs que simulam a latência do LLM, então
+nenhuma chamada real ao Gemini ou ao Postgres é feita.
+
+Uso:
+    python -m benchmarks.bench_concurrency --requests 100 --latency 0.5
+"""
+
+import argparse
+import asyncio
+import time
+
+import app.agents.code_analyser_agent as code_analyser_agent
+import app.agents.teacher_agent as teacher_agent
+from app.agents.code_analyser_agent.models import (
+    AnaliseCodigoCompleta,
+    AnaliseGeral,
+    CodigoMelhorado,
+    DiagnosticoErros,
+    ErrosPorCategoria,
+    FeedbackConstrutivo,
+    NivelAluno,
+)
+
+FAKE_ANALYSIS = AnaliseCodigoCompleta(
+    analise_geral=AnaliseGeral(
+        nivel_aluno=NivelAluno.INICIANTE,
+        linguagem_programacao='python',
+        objetivo_codigo='somar dois números',
+        topicos_envolvidos=['funções'],
+        pontuacao_geral=80,
+    ),
+    diagnostico_erros=DiagnosticoErros(
+        total_erros=0, erros_por_categoria=ErrosPorCategoria()
+    ),
+    feedback_construtivo=FeedbackConstrutivo(
+        pontos_fortes=[],
+        areas_melhoria=[],
+        proximos_passos=[],
+        recursos_recomendados=[],
+    ),
+    codigo_melhorado=CodigoMelhorado(incluir=False, explicacao_mudancas=''),
+)
+
+
+class _Output:
+    """O que o pipeline lê de um `RunOutput` do agno."""
+
+    def __init__(self, content):
+        self.content = content
+        self.messages = []
+        self.metrics = None
+
+
+class StubAgent:
+    """
+    Agente fake com a interface de `BoundedMemoryAgent` usada pelo pipeline
+    (`run`/`arun` e a memória lida antes do orçamento de tokens).
+    """
+
+    def __init__(self, content, latency: float):
+        self.content = content
+        self.latency = latency
+
+    async def aload_context(self):
+        return []
+
+    def keep_context(self, kept: int) -> None:
+        pass
+
+    def run(self, input, stream=False, **kwargs):
+        time.sleep(self.latency)
+        return _Output(self.content)
+
+    async def arun(self, input, stream=False, **kwargs):
+        await asyncio.sleep(self.latency)
+        return _Output(self.content)
+
+
+def install_stubs(latency: float):
+    code_analyser_agent.get_code_analyser_agno_agent = (
+        lambda session_id, mode=None: StubAgent(FAKE_ANALYSIS, latency)
+    )
+    teacher_agent.get_teacher_agent_agno_agent = lambda session_id: StubAgent(
+        'Resposta do professor', latency
+    )
+
+
+async def blocking_pipeline(i: int):
+    analysis = code_analyser_agent.call_code_analyser_agent(
+        session_id=str(i), code='def soma(a, b): return a + b', question='?'
+    )
+    return teacher_agent.call_teacher_agent_agent(
+        session_id=str(i),
+        code='def soma(a, b): return a + b',
+        question='?',
+        code_analysis=analysis,
+    )
+
+
+async def async_pipeline(i: int):
+    analysis = await code_analyser_agent.acall_code_analyser_agent(
+        session_id=str(i), code='def soma(a, b): return a + b', question='?'
+    )
+    return await teacher_agent.acall_teacher_agent_agent(
+        session_id=str(i),
+        code='def soma(a, b): return a + b',
+        question='?',
+        code_analysis=analysis,
+    )
+
+
+async def run(pipeline, requests: int) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*(pipeline(i) for i in range(requests)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument(
+        '--latency',
+        type=float,
+        default=0.2,
+        help='latência simulada de cada chamada ao LLM (s)',
+    )
+    args = parser.parse_args()
+
+    install_stubs(args.latency)
+
+    for name, pipeline in (
+        ('bloqueante (run)', blocking_pipeline),
+        ('assíncrono (arun)', async_pipeline),
+    ):
+        elapsed = asyncio.run(run(pipeline, args.requests))
+        print(
+            f'{name:<20} {args.requests} requisições em {elapsed:.2f}s '
+            f'({args.requests / elapsed:.1f} req/s)'
+        )
+
+
+if __name__ == '__main__':
+    main()
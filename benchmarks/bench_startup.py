@@ -0,0 +1,127 @@
+"""Benchmark de boot dos workers: tempo de import e memória por worker.
+
+Simula o que o gunicorn faz com N workers em dois cenários:
+
+- cold: cada worker é um processo novo que importa `app.main` do zero;
+- preload: o master roda `app.core.preload.preload_modules()` e faz fork
+  dos workers, que então importam `app.main` (como com `gunicorn.conf.py`).
+
+Para cada worker são medidos o tempo de import de `app.main`, o RSS e o
+PSS/USS (memória proporcional e privada, de /proc/self/smaps_rollup), que
+mostram quanto das páginas é compartilhado copy-on-write. Só Linux.
+
+Uso:
+    python -m benchmarks.bench_startup --workers 4
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+WORKER_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import app.main  # noqa
+elapsed = time.perf_counter() - start
+sys.path.insert(0, '.')
+from benchmarks.bench_startup import memory_usage
+print(json.dumps({'import_s': elapsed, **memory_usage()}))
+"""
+
+
+def memory_usage() -> dict:
+    """RSS, PSS e USS (MB) do processo atual."""
+    fields = {}
+    with open('/proc/self/smaps_rollup') as smaps:
+        for line in smaps:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return {
+        'rss_mb': fields.get('Rss', 0.0),
+        'pss_mb': fields.get('Pss', 0.0),
+        'uss_mb': fields.get('Private_Clean', 0.0)
+        + fields.get('Private_Dirty', 0.0),
+    }
+
+
+def run_cold(workers: int) -> list:
+    results = []
+    for _ in range(workers):
+        output = subprocess.run(
+            [sys.executable, '-c', WORKER_SCRIPT],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+
+def run_preload(workers: int) -> tuple:
+    from app.core.preload import preload_modules
+
+    start = time.perf_counter()
+    preload_modules()
+    preload_s = time.perf_counter() - start
+
+    children = []
+    for _ in range(workers):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            start = time.perf_counter()
+            import app.main  # noqa: F401
+
+            result = {'import_s': time.perf_counter() - start}
+            # Mantém os workers vivos até todos medirem (PSS depende disso)
+            time.sleep(1)
+            result.update(memory_usage())
+            os.write(write_fd, json.dumps(result).encode())
+            os._exit(0)
+        os.close(write_fd)
+        children.append((pid, read_fd))
+
+    results = []
+    for pid, read_fd in children:
+        with os.fdopen(read_fd) as pipe:
+            results.append(json.loads(pipe.read()))
+        os.waitpid(pid, 0)
+    return preload_s, results
+
+
+def summarize(name: str, results: list) -> None:
+    def avg(key):
+        return sum(r[key] for r in results) / len(results)
+
+    print(
+        f'{name:<8} import {avg("import_s"):6.2f}s | '
+        f'RSS {avg("rss_mb"):7.1f} MB | PSS {avg("pss_mb"):7.1f} MB | '
+        f'USS {avg("uss_mb"):7.1f} MB  (média por worker)'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    summarize('cold', run_cold(args.workers))
+
+    # O preload roda em um processo separado para não contaminar o cold
+    pid = os.fork()
+    if pid == 0:
+        preload_s, results = run_preload(args.workers)
+        print(f'preload no master: {preload_s:.2f}s')
+        summarize('preload', results)
+        sys.stdout.flush()
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,477 @@
+"""Teste de carga dos endpoints com LLM fake (sem custo de API).
+
+Sobe a aplicação com Uvicorn em uma thread, troca os modelos do agno e do
+LangChain pelos stubs de `benchmarks.stub_llm` e dispara requisições em
+níveis crescentes de concorrência contra `/call/agno/`, `/call/langchain/`
+e `/fake_stream`. Para cada endpoint e nível são medidos:
+
+- latência total (p50/p95/p99) e TTFB, o tempo até o primeiro byte do
+  corpo da resposta (p50/p95/p99);
+- requisições por segundo;
+- idas ao banco por requisição (queries executadas, incluindo a gravação
+  em lote do writer e o storage de sessões do agno).
+
+O banco padrão é um SQLite temporário (o schema `gpt_teacher` é um
+`ATTACH`); com `--database postgres` são usados os engines da própria
+aplicação, configurados pelas variáveis `POSTGRES_*` (as tabelas são
+criadas se não existirem).
+
+Cliente e servidor rodam no mesmo processo (e dividem o GIL): os números
+servem para comparar commits na mesma máquina, não como capacidade
+absoluta de um worker.
+
+Os resultados são gravados em `benchmarks/results/<commit>.json`; use
+`--compare` com um arquivo anterior para ver a variação entre commits.
+
+Uso:
+    python -m benchmarks.load_test --concurrency 1 10 50 --ttft 0.3
+    python -m benchmarks.load_test --compare benchmarks/results/abc1234.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlmodel import Session, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from benchmarks.stub_llm import StubTiming, install_stub_models
+
+RESULTS_DIR = Path(__file__).parent / 'results'
+
+ENDPOINTS = {
+    'agno': '/call/agno/',
+    'langchain': '/call/langchain/',
+    'fake_stream': '/fake_stream',
+}
+
+CODE = 'def fibonacci(n):\n    if n <= 1:\n        return n\n' + (
+    '    return fibonacci(n - 1) + fibonacci(n - 2)\n'
+)
+
+
+class QueryCounter:
+    """Conta as queries executadas pelos engines observados."""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def watch(self, engine: Engine) -> None:
+        event.listen(engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, *args) -> None:
+        with self._lock:
+            self.count += 1
+
+
+@dataclass
+class LevelResult:
+    endpoint: str
+    concurrency: int
+    requests: int
+    errors: int
+    elapsed_s: float
+    rps: float
+    latency_ms: Dict[str, float]
+    ttfb_ms: Dict[str, float]
+    db_round_trips_per_request: float
+    status_codes: Dict[str, int] = field(default_factory=dict)
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Percentil pelo método nearest-rank."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        f'p{p}': round(percentile(values, p) * 1000, 1) for p in (50, 95, 99)
+    }
+
+
+def git_revision() -> str:
+    def git(*args):
+        return subprocess.run(
+            ['git', *args], capture_output=True, text=True
+        ).stdout.strip()
+
+    revision = git('rev-parse', '--short', 'HEAD') or 'unknown'
+    if git('status', '--porcelain', '--untracked-files=no'):
+        revision += '-dirty'
+    return revision
+
+
+def setup_sqlite(app, directory: str, counter: QueryCounter):
+    """Aponta a aplicação para um SQLite temporário."""
+    from agno.db.sqlite import SqliteDb
+
+    from app.agents.code_analyser_agent.batch import batch_grader
+    from app.core.admission import admission
+    from app.core.deps import get_async_db, get_db
+    from app.core.similarity import similarity_index
+    from app.crud.writer import writer
+    from app.models import schema_name
+
+    main_file = os.path.join(directory, 'bench.db')
+    schema_file = os.path.join(directory, f'{schema_name}.db')
+
+    def attach_schema(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f"ATTACH DATABASE '{schema_file}' AS {schema_name}")
+        cursor.close()
+
+    engine = create_engine(
+        f'sqlite:///{main_file}', connect_args={'timeout': 30}
+    )
+    async_engine = create_async_engine(
+        f'sqlite+aiosqlite:///{main_file}', connect_args={'timeout': 30}
+    )
+    for sync_engine in (engine, async_engine.sync_engine):
+        event.listen(sync_engine, 'connect', attach_schema)
+        counter.watch(sync_engine)
+    SQLModel.metadata.create_all(engine)
+
+    agno_engine = create_engine(
+        f'sqlite:///{os.path.join(directory, "agno.db")}',
+        connect_args={'timeout': 30},
+    )
+    counter.watch(agno_engine)
+
+    session_maker = async_sessionmaker(
+        async_engine, class_=AsyncSession, expire_on_commit=False
+    )
+
+    def get_sqlite_db():
+        with Session(engine) as session:
+            yield session
+
+    async def get_sqlite_async_db():
+        async with session_maker() as session:
+            yield session
+
+    app_lifespan = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan(app):
+        async with app_lifespan(app):
+            yield
+        # Fecha as threads do aiosqlite no loop do servidor (o writer já
+        # gravou o que estava pendente no shutdown da aplicação)
+        await async_engine.dispose()
+
+    app.router.lifespan_context = lifespan
+    app.dependency_overrides[get_db] = get_sqlite_db
+    app.dependency_overrides[get_async_db] = get_sqlite_async_db
+    writer.session_maker = session_maker
+    writer.message_ids.session_maker = session_maker
+    batch_grader.session_maker = session_maker
+    similarity_index.session_maker = session_maker
+    admission.leases.session_maker = session_maker
+    # Sem snapshot: cada execução começa com o banco vazio
+    similarity_index.path = ''
+    return SqliteDb(db_engine=agno_engine)
+
+
+def setup_postgres(counter: QueryCounter) -> None:
+    """Usa os engines da aplicação (variáveis `POSTGRES_*`)."""
+    from app.core.deps import async_engine, engine
+    from app.models import schema_name
+
+    with engine.begin() as connection:
+        connection.execute(text(f'CREATE SCHEMA IF NOT EXISTS {schema_name}'))
+    SQLModel.metadata.create_all(engine)
+    counter.watch(engine)
+    counter.watch(async_engine.sync_engine)
+
+
+class ServerThread:
+    """Uvicorn rodando a aplicação em uma thread (lifespan incluso)."""
+
+    def __init__(self, app):
+        import uvicorn
+
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(('127.0.0.1', 0))
+        self.port = self.socket.getsockname()[1]
+        self.server = uvicorn.Server(
+            uvicorn.Config(
+                app, log_level='warning', lifespan='on', backlog=4096
+            )
+        )
+        self.thread = threading.Thread(
+            target=self.server.run, kwargs={'sockets': [self.socket]}
+        )
+
+    @property
+    def base_url(self) -> str:
+        return f'http://127.0.0.1:{self.port}'
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            if not self.thread.is_alive():
+                raise RuntimeError('Uvicorn não iniciou')
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+async def timed_request(
+    client: httpx.AsyncClient, path: str, body: dict
+) -> tuple:
+    """Retorna (status, TTFB, latência total) de uma requisição."""
+    start = time.perf_counter()
+    ttfb = None
+    async with client.stream('POST', path, json=body) as response:
+        async for chunk in response.aiter_raw():
+            if ttfb is None and chunk:
+                ttfb = time.perf_counter() - start
+    total = time.perf_counter() - start
+    return response.status_code, ttfb if ttfb is not None else total, total
+
+
+async def wait_writer_idle(timeout: float = 30.0) -> None:
+    """Espera o writer gravar os turnos enfileirados pelo nível."""
+    from app.crud.writer import writer
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = writer.status()
+        done = status['flushed'] + status['failed']
+        if status['pending'] == 0 and done >= status['submitted']:
+            return
+        await asyncio.sleep(0.05)
+
+
+async def run_level(
+    client: httpx.AsyncClient,
+    endpoint: str,
+    concurrency: int,
+    requests: int,
+    counter: QueryCounter,
+    same_code: bool,
+) -> LevelResult:
+    path = ENDPOINTS[endpoint]
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+
+    async def worker(index: int):
+        # Código diferente por requisição para não medir só o cache de
+        # análises (a não ser com `--same-code`)
+        code = CODE if same_code else f'{CODE}# {endpoint} {index}\n'
+        body = {'question': 'Como posso otimizar esta função?', 'code': code}
+        async with semaphore:
+            try:
+                samples.append(await timed_request(client, path, body))
+            except httpx.HTTPError as e:
+                samples.append((type(e).__name__, None, None))
+
+    queries_before = counter.count
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(index) for index in range(requests)))
+    elapsed = time.perf_counter() - start
+    await wait_writer_idle()
+    queries = counter.count - queries_before
+
+    ok = [s for s in samples if s[0] == 200]
+    status_codes: Dict[str, int] = {}
+    for status, _, _ in samples:
+        status_codes[str(status)] = status_codes.get(str(status), 0) + 1
+
+    return LevelResult(
+        endpoint=endpoint,
+        concurrency=concurrency,
+        requests=requests,
+        errors=requests - len(ok),
+        elapsed_s=round(elapsed, 3),
+        rps=round(len(ok) / elapsed, 2),
+        latency_ms=summarize([s[2] for s in ok]),
+        ttfb_ms=summarize([s[1] for s in ok]),
+        db_round_trips_per_request=round(queries / requests, 2),
+        status_codes=status_codes,
+    )
+
+
+async def run_benchmark(
+    base_url: str, args, counter: QueryCounter
+) -> List[LevelResult]:
+    results = []
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(
+        base_url=base_url, timeout=None, limits=limits
+    ) as client:
+        for endpoint in args.endpoints:
+            for concurrency in args.concurrency:
+                result = await run_level(
+                    client,
+                    endpoint,
+                    concurrency,
+                    concurrency * args.rounds,
+                    counter,
+                    args.same_code,
+                )
+                print_result(result)
+                results.append(result)
+    return results
+
+
+def print_header() -> None:
+    print(
+        f'{"endpoint":<12} {"conc":>5} {"req":>5} {"err":>4} {"req/s":>8} '
+        f'{"p50":>8} {"p95":>8} {"p99":>8} {"ttfb p50":>9} {"ttfb p95":>9} '
+        f'{"db/req":>7}'
+    )
+
+
+def print_result(result: LevelResult) -> None:
+    latency, ttfb = result.latency_ms, result.ttfb_ms
+    print(
+        f'{result.endpoint:<12} {result.concurrency:>5} {result.requests:>5} '
+        f'{result.errors:>4} {result.rps:>8.1f} {latency["p50"]:>8.0f} '
+        f'{latency["p95"]:>8.0f} {latency["p99"]:>8.0f} '
+        f'{ttfb["p50"]:>9.0f} {ttfb["p95"]:>9.0f} '
+        f'{result.db_round_trips_per_request:>7.1f}'
+    )
+
+
+def compare(current: List[dict], previous_file: str) -> None:
+    """Mostra a variação de req/s, p95 e TTFB p95 em relação a outro run."""
+    with open(previous_file) as f:
+        previous = json.load(f)
+    baseline = {
+        (r['endpoint'], r['concurrency']): r for r in previous['results']
+    }
+
+    def delta(new, old):
+        return f'{(new - old) / old * 100:+.1f}%' if old else 'n/a'
+
+    print(f'\ncomparação com {previous["commit"]} ({previous_file}):')
+    print(
+        f'{"endpoint":<12} {"conc":>5} {"req/s":>9} {"p95":>9} '
+        f'{"ttfb p95":>9} {"db/req":>9}'
+    )
+    for result in current:
+        old = baseline.get((result['endpoint'], result['concurrency']))
+        if old is None:
+            continue
+        print(
+            f'{result["endpoint"]:<12} {result["concurrency"]:>5} '
+            f'{delta(result["rps"], old["rps"]):>9} '
+            f'{delta(result["latency_ms"]["p95"], old["latency_ms"]["p95"]):>9} '
+            f'{delta(result["ttfb_ms"]["p95"], old["ttfb_ms"]["p95"]):>9} '
+            f'{delta(result["db_round_trips_per_request"], old["db_round_trips_per_request"]):>9}'
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--endpoints',
+        nargs='+',
+        choices=list(ENDPOINTS),
+        default=list(ENDPOINTS),
+    )
+    parser.add_argument(
+        '--concurrency', nargs='+', type=int, default=[1, 10, 50]
+    )
+    parser.add_argument(
+        '--rounds',
+        type=int,
+        default=5,
+        help='requisições por nível = concorrência x rounds',
+    )
+    parser.add_argument(
+        '--ttft', type=float, default=0.3, help='tempo até o 1º token (s)'
+    )
+    parser.add_argument('--tokens-per-second', type=float, default=80.0)
+    parser.add_argument('--response-tokens', type=int, default=200)
+    parser.add_argument(
+        '--database', choices=['sqlite', 'postgres'], default='sqlite'
+    )
+    parser.add_argument(
+        '--same-code',
+        action='store_true',
+        help='mesmo código em todas as requisições (mede o cache)',
+    )
+    parser.add_argument('--output', default=None, help='arquivo de resultado')
+    parser.add_argument('--compare', default=None, help='resultado anterior')
+    args = parser.parse_args()
+
+    # Valores fake para os clientes dos provedores, que nunca são chamados
+    os.environ.setdefault('GEMINI_API_KEY', 'stub')
+    os.environ.setdefault('NVIDIA_NIM_API_KEY', 'stub')
+
+    from app.main import app
+
+    timing = StubTiming(
+        ttft=args.ttft,
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+    )
+    counter = QueryCounter()
+
+    with tempfile.TemporaryDirectory() as directory:
+        agent_storage = None
+        if args.database == 'sqlite':
+            agent_storage = setup_sqlite(app, directory, counter)
+        else:
+            setup_postgres(counter)
+        install_stub_models(timing, agent_storage=agent_storage)
+
+        print_header()
+        with ServerThread(app) as server:
+            results = asyncio.run(run_benchmark(server.base_url, args, counter))
+
+    revision = git_revision()
+    report = {
+        'commit': revision,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'database': args.database,
+        'config': {
+            'ttft': args.ttft,
+            'tokens_per_second': args.tokens_per_second,
+            'response_tokens': args.response_tokens,
+            'rounds': args.rounds,
+            'same_code': args.same_code,
+        },
+        'results': [asdict(result) for result in results],
+    }
+
+    output = Path(args.output or RESULTS_DIR / f'{revision}.json')
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f'\nresultados gravados em {output}')
+
+    if args.compare:
+        compare(report['results'], args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""Modelos de LLM fake (agno e LangChain) para benchmarks sem custo de API.
+
+Os stubs simulam o perfil de latência de um modelo real: esperam o tempo
+até o primeiro token (`ttft`) e depois emitem os tokens a uma taxa fixa
+(`tokens_per_second`). Quando o agente pede saída estruturada, o modelo do
+agno responde com uma `AnaliseCodigoCompleta` (ou `AnaliseRapida`, conforme
+o schema pedido) serializada em JSON.
+
+`install_stub_models` troca os modelos usados pela aplicação pelos stubs.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from agno.models.base import Model
+from agno.models.response import ModelResponse
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from app.agents.code_analyser_agent.models import AnaliseRapida, NivelAluno
+from benchmarks.bench_concurrency import FAKE_ANALYSIS
+
+FAKE_QUICK_ANALYSIS = AnaliseRapida(
+    nivel_aluno=NivelAluno.INICIANTE,
+    linguagem='python',
+    total_erros=1,
+    pontuacao=70,
+    principais_problemas=['recursão sem memoização'],
+    sugestoes=['guarde os resultados já calculados'],
+)
+
+TEACHER_TEXT = (
+    'Boa pergunta! Seu código está no caminho certo. Repare que a função '
+    'recalcula os mesmos valores várias vezes; guardar os resultados em '
+    'um dicionário evita esse retrabalho. Tente reescrever o trecho e '
+    'compare o tempo de execução antes e depois. '
+)
+
+
+@dataclass
+class StubTiming:
+    """Perfil de latência do modelo fake."""
+
+    ttft: float = 0.3
+    tokens_per_second: float = 80.0
+    response_tokens: int = 200
+
+    def tokens(self, text: str) -> List[str]:
+        """Quebra o texto em "tokens" (palavras com o espaço seguinte)."""
+        words = [word + ' ' for word in text.split(' ') if word]
+        if not words:
+            return []
+        while len(words) < self.response_tokens:
+            words.extend(words)
+        return words[: self.response_tokens]
+
+    @property
+    def token_interval(self) -> float:
+        if self.tokens_per_second <= 0:
+            return 0.0
+        return 1 / self.tokens_per_second
+
+
+@dataclass
+class StubAgnoModel(Model):
+    """Modelo do agno que não faz chamadas de rede."""
+
+    id: str = 'stub'
+    name: Optional[str] = 'StubAgnoModel'
+    provider: Optional[str] = 'stub'
+    # Como o Gemini: o agno passa o schema (`output_schema`) como
+    # `response_format` e converte o JSON da resposta
+    supports_native_structured_outputs: bool = True
+    timing: StubTiming = field(default_factory=StubTiming)
+    text: str = TEACHER_TEXT
+
+    def _chunks(self, response_format) -> List[str]:
+        if response_format is AnaliseRapida:
+            return [FAKE_QUICK_ANALYSIS.model_dump_json()]
+        if response_format is not None:
+            return [FAKE_ANALYSIS.model_dump_json()]
+        return self.timing.tokens(self.text)
+
+    def _content(self, response_format) -> str:
+        return ''.join(self._chunks(response_format))
+
+    def _total_time(self, chunks: List[str]) -> float:
+        return self.timing.ttft + len(chunks) * self.timing.token_interval
+
+    def invoke(self, *args, response_format=None, **kwargs) -> ModelResponse:
+        time.sleep(self._total_time(self._chunks(response_format)))
+        return ModelResponse(
+            role='assistant', content=self._content(response_format)
+        )
+
+    async def ainvoke(
+        self, *args, response_format=None, **kwargs
+    ) -> ModelResponse:
+        await asyncio.sleep(self._total_time(self._chunks(response_format)))
+        return ModelResponse(
+            role='assistant', content=self._content(response_format)
+        )
+
+    def invoke_stream(
+        self, *args, response_format=None, **kwargs
+    ) -> Iterator[ModelResponse]:
+        time.sleep(self.timing.ttft)
+        for chunk in self._chunks(response_format):
+            yield ModelResponse(role='assistant', content=chunk)
+            time.sleep(self.timing.token_interval)
+
+    async def ainvoke_stream(
+        self, *args, response_format=None, **kwargs
+    ) -> AsyncIterator[ModelResponse]:
+        await asyncio.sleep(self.timing.ttft)
+        for chunk in self._chunks(response_format):
+            yield ModelResponse(role='assistant', content=chunk)
+            await asyncio.sleep(self.timing.token_interval)
+
+    def _parse_provider_response(self, response: Any, **kwargs):
+        return response
+
+    def _parse_provider_response_delta(self, response: Any):
+        return response
+
+
+class StubChatModel(BaseChatModel):
+    """Chat model do LangChain que não faz chamadas de rede."""
+
+    timing: StubTiming = StubTiming()
+    text: str = TEACHER_TEXT
+
+    @property
+    def _llm_type(self) -> str:
+        return 'stub'
+
+    def _result(self) -> ChatResult:
+        content = ''.join(self.timing.tokens(self.text))
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content=content))]
+        )
+
+    def _total_time(self) -> float:
+        tokens = len(self.timing.tokens(self.text))
+        return self.timing.ttft + tokens * self.timing.token_interval
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self._total_time())
+        return self._result()
+
+    async def _agenerate(
+        self, messages, stop=None, run_manager=None, **kwargs
+    ):
+        await asyncio.sleep(self._total_time())
+        return self._result()
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.timing.ttft)
+        for token in self.timing.tokens(self.text):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+            time.sleep(self.timing.token_interval)
+
+    async def _astream(
+        self, messages, stop=None, run_manager=None, **kwargs
+    ):
+        await asyncio.sleep(self.timing.ttft)
+        for token in self.timing.tokens(self.text):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+            await asyncio.sleep(self.timing.token_interval)
+
+
+def install_stub_models(timing: StubTiming, agent_storage=None) -> None:
+    """
+    Troca os modelos do agno e do LangChain pelos stubs.
+
+    `agent_storage` substitui o storage de sessões do agno (por padrão o
+    PostgreSQL de `app.agents.storage`).
+    """
+    import app.agents.code_analyser_agent as code_analyser_agent
+    import app.agents.teacher_agent as teacher_agent
+    import app.llm.langchain as langchain
+
+    from app.core.config import DEFAULT_AGNO_MODEL
+    from app.llm.agno import RoutedAgnoModel
+
+    # Pela rota de provedores, como os modelos reais
+    agno_model = RoutedAgnoModel(
+        models=[StubAgnoModel(id=DEFAULT_AGNO_MODEL, timing=timing)]
+    )
+    chat_model = StubChatModel(timing=timing)
+
+    code_analyser_agent.get_quick_agno_model = lambda: agno_model
+    for module in (code_analyser_agent, teacher_agent):
+        module.get_default_agno_model = lambda: agno_model
+        if agent_storage is not None:
+            module.get_agent_storage = lambda: agent_storage
+
+    langchain.get_llm_model.cache_clear()
+    langchain.get_teacher_chain.cache_clear()
+    langchain.get_llm_model = lambda model_name: chat_model
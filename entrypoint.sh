@@ -6,6 +6,7 @@ set -e
 
 # Comando para rodar o servidor com hot reload, workers e timeout estendido
 exec uv run gunicorn app.main:app \
+    --config gunicorn.conf.py \
     --workers 4 \
     --threads 2 \
     --worker-class uvicorn.workers.UvicornWorker \
@@ -0,0 +1,16 @@
+from app.core.config import settings
+
+
+def on_starting(server):
+    """Pré-carrega os módulos pesados no master, antes do fork dos workers"""
+    if not settings.PRELOAD_MODULES:
+        return
+
+    from app.core.preload import preload_modules
+
+    timings = preload_modules()
+    server.log.info(
+        'Preloaded %d modules in %.2fs',
+        len(timings),
+        sum(timings.values()),
+    )
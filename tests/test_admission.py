@@ -0,0 +1,148 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.admission import AdmissionController, SessionLeases
+
+
+class FakeLeases:
+    """Leases em memória, compartilhados entre controladores ("workers")"""
+
+    def __init__(self):
+        self.holders = {}
+
+    async def claim(self, session_id):
+        if session_id in self.holders:
+            return None
+        token = self.holders[session_id] = f'token-{session_id}'
+        return token
+
+    async def release(self, session_id, token):
+        if self.holders.get(session_id) == token:
+            del self.holders[session_id]
+
+
+def make_controller(**overrides) -> AdmissionController:
+    options = dict(
+        max_in_flight=2, max_queue=2, max_wait=1.0, session_queue=0
+    )
+    options.update(overrides)
+    return AdmissionController(**options)
+
+
+def test_same_session_is_rejected_with_429():
+    async def scenario():
+        controller = make_controller()
+        ticket = await controller.acquire(7)
+        with pytest.raises(HTTPException) as error:
+            await controller.acquire(7)
+        assert error.value.status_code == 429
+        ticket.release()
+        (await controller.acquire(7)).release()
+        assert controller.status()['active_sessions'] == 0
+
+    asyncio.run(scenario())
+
+
+def test_session_queue_waits_for_previous_turn():
+    async def scenario():
+        controller = make_controller(session_queue=1)
+        first = await controller.acquire(7)
+        waiting = asyncio.ensure_future(controller.acquire(7))
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        first.release()
+        (await waiting).release()
+
+    asyncio.run(scenario())
+
+
+def test_global_queue_full_is_rejected_with_503():
+    async def scenario():
+        controller = make_controller(max_in_flight=1, max_queue=0)
+        ticket = await controller.acquire()
+        with pytest.raises(HTTPException) as error:
+            await controller.acquire()
+        assert error.value.status_code == 503
+        assert 'Retry-After' in error.value.headers
+        ticket.release()
+        assert controller.status()['in_flight'] == 0
+
+    asyncio.run(scenario())
+
+
+def test_lease_rejects_turn_running_in_another_worker():
+    async def scenario():
+        leases = FakeLeases()
+        worker_a = make_controller(leases=leases)
+        worker_b = make_controller(leases=leases)
+        ticket = await worker_a.acquire(7)
+        with pytest.raises(HTTPException) as error:
+            await worker_b.acquire(7)
+        assert error.value.status_code == 429
+        # A recusa não deixa vaga nem sessão presas no outro worker
+        assert worker_b.status()['in_flight'] == 0
+        assert worker_b.status()['active_sessions'] == 0
+
+        # No fim do turno o lease sai antes da resposta terminar
+        await ticket.arelease()
+        assert leases.holders == {}
+        (await worker_b.acquire(7)).release()
+        await asyncio.sleep(0)
+        assert leases.holders == {}
+
+    asyncio.run(scenario())
+
+
+def test_lease_failure_falls_back_to_local_gate():
+    class BrokenLeases:
+        async def claim(self, session_id):
+            raise ConnectionError
+
+    async def scenario():
+        controller = make_controller(leases=BrokenLeases())
+        ticket = await controller.acquire(7)
+        assert ticket.lease is None
+        ticket.release()
+
+    asyncio.run(scenario())
+
+
+def test_session_leases_on_database():
+    pytest.importorskip('aiosqlite')
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlmodel.ext.asyncio.session import AsyncSession
+
+    from app.models import SessionTurnLease, schema_name
+
+    async def scenario():
+        engine = create_async_engine(
+            'sqlite+aiosqlite://',
+            execution_options={'schema_translate_map': {schema_name: None}},
+        )
+        async with engine.begin() as connection:
+            await connection.run_sync(
+                SessionTurnLease.metadata.create_all,
+                tables=[SessionTurnLease.__table__],
+            )
+        leases = SessionLeases(
+            session_maker=async_sessionmaker(engine, class_=AsyncSession),
+            ttl=60,
+        )
+        token = await leases.claim(7)
+        assert token is not None
+        assert await leases.claim(7) is None
+        # Só o dono libera
+        await leases.release(7, 'other')
+        assert await leases.claim(7) is None
+        await leases.release(7, token)
+        assert await leases.claim(7) is not None
+
+        # Um lease expirado (worker que caiu) é retomado
+        expired = SessionLeases(session_maker=leases.session_maker, ttl=-1)
+        assert await expired.claim(8) is not None
+        assert await leases.claim(8) is not None
+        await engine.dispose()
+
+    asyncio.run(scenario())
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+import app.agents.code_analyser_agent.batch as batch_module
+from app.agents.code_analyser_agent.batch import BatchGrader, Submission
+from app.agents.code_analyser_agent.models import ModoAnalise
+
+
+class FakeSession:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeAnalysis:
+    def model_dump(self):
+        return {}
+
+
+def make_grader(concurrency: int = 2, flush_size: int = 2) -> BatchGrader:
+    return BatchGrader(
+        session_maker=FakeSession,
+        concurrency=concurrency,
+        flush_size=flush_size,
+    )
+
+
+async def drain(results: asyncio.Queue) -> list:
+    items = []
+    while (item := await results.get()) is not None:
+        items.append(item)
+    return items
+
+
+async def grade_all(grader: BatchGrader, total: int, results: asyncio.Queue):
+    await grader._grade_all(
+        submissions=[
+            Submission(code=f'print({index})', question='?')
+            for index in range(total)
+        ],
+        session_ids=list(range(total)),
+        message_ids=list(range(100, 100 + total)),
+        mode=ModoAnalise.COMPLETA,
+        results=results,
+    )
+
+
+def test_concurrency_is_shared_by_all_batches(monkeypatch):
+    running = peak = 0
+
+    async def aget_code_analysis(**kwargs):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return FakeAnalysis(), 'key'
+
+    async def persist(turns):
+        pass
+
+    monkeypatch.setattr(batch_module, 'aget_code_analysis', aget_code_analysis)
+    monkeypatch.setattr(batch_module.writer, 'persist', persist)
+
+    async def scenario():
+        grader = make_grader(concurrency=2)
+        queues = [asyncio.Queue(), asyncio.Queue()]
+        await asyncio.gather(*(grade_all(grader, 5, queue) for queue in queues))
+        return [await drain(queue) for queue in queues]
+
+    first, second = asyncio.run(scenario())
+    assert len(first) == len(second) == 5
+    assert peak == 2
+
+
+def test_items_cancelled_by_a_persist_failure_are_reported(monkeypatch):
+    async def aget_code_analysis(code, **kwargs):
+        # As primeiras terminam logo; as demais ficam pendentes
+        await asyncio.sleep(0 if code in ('print(0)', 'print(1)') else 1)
+        return FakeAnalysis(), 'key'
+
+    async def persist(turns):
+        raise ConnectionError('banco fora do ar')
+
+    monkeypatch.setattr(batch_module, 'aget_code_analysis', aget_code_analysis)
+    monkeypatch.setattr(batch_module.writer, 'persist', persist)
+
+    async def scenario():
+        results = asyncio.Queue()
+        with pytest.raises(ConnectionError):
+            await grade_all(make_grader(concurrency=5), 5, results)
+        return await drain(results)
+
+    items = asyncio.run(scenario())
+    assert sorted(item.index for item in items) == [0, 1, 2, 3, 4]
+    errors = [item for item in items if item.status == 'error']
+    assert len(errors) == 3
+    assert all('banco fora do ar' in item.detail for item in errors)
@@ -0,0 +1,27 @@
+import asyncio
+
+import pytest
+
+import app.agents.code_analyser_agent as code_analyser_agent
+import app.agents.teacher_agent as teacher_agent
+from benchmarks.bench_concurrency import (
+    async_pipeline,
+    blocking_pipeline,
+    install_stubs,
+)
+
+
+@pytest.fixture
+def stubs(monkeypatch):
+    # `install_stubs` troca as fábricas dos agentes; o monkeypatch restaura
+    for module, name in (
+        (code_analyser_agent, 'get_code_analyser_agno_agent'),
+        (teacher_agent, 'get_teacher_agent_agno_agent'),
+    ):
+        monkeypatch.setattr(module, name, getattr(module, name))
+    install_stubs(latency=0)
+
+
+@pytest.mark.parametrize('pipeline', [blocking_pipeline, async_pipeline])
+def test_stub_agents_follow_the_agent_interface(stubs, pipeline):
+    assert asyncio.run(pipeline(1)) == 'Resposta do professor'
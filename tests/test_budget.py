@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+from agno.models.message import Message
+from agno.run.agent import RunOutput
+from agno.run.base import RunStatus
+from agno.session.agent import AgentSession
+from agno.session.summary import SessionSummary
+from fastapi import HTTPException
+
+from app.agents.memory import (
+    BoundedMemoryAgent,
+    MemoryPolicy,
+    bounded_history,
+)
+from app.core.config import DEFAULT_AGNO_MODEL
+from app.llm.utils.budget import (
+    TRIM_LINE_MARKER,
+    TokenBudget,
+    TokenCounter,
+    trim_code,
+)
+
+
+def test_trim_code_keeps_head_and_tail():
+    code = '\n'.join(f'linha {index}' for index in range(100))
+    trimmed = trim_code(code, 200)
+    assert trimmed.startswith('linha 0\n')
+    assert trimmed.endswith('linha 99')
+    assert 'linhas omitidas' in trimmed
+
+
+def test_trim_code_cuts_a_single_long_line():
+    code = 'x = [' + ', '.join(str(index) for index in range(5000)) + ']'
+    trimmed = trim_code(code, 1000)
+    assert trimmed.startswith('x = [0, 1, 2')
+    assert trimmed.endswith(TRIM_LINE_MARKER)
+    assert len(trimmed) <= 1000
+
+
+def test_trim_code_cuts_a_long_line_between_short_ones():
+    code = 'inicio()\n' + 'y' * 5000 + '\nfim()'
+    trimmed = trim_code(code, 1000)
+    assert trimmed.startswith('inicio()\nyyy')
+    assert trimmed.endswith('\nfim()')
+    assert TRIM_LINE_MARKER in trimmed
+
+
+def make_budget(limit: int) -> TokenBudget:
+    return TokenBudget(
+        DEFAULT_AGNO_MODEL, counter=TokenCounter(), max_input_tokens=limit
+    )
+
+
+def test_fit_drops_oldest_history_first():
+    history = ['a' * 350, 'b' * 350, 'c' * 350]
+    code, kept, _, report = make_budget(310).fit(
+        stage='teacher', prompt='p' * 350, code='print(1)', history=history
+    )
+    assert code == 'print(1)'
+    assert kept == ['b' * 350, 'c' * 350]
+    assert report.trimmed == ['history']
+    assert report.total_tokens <= 310
+
+
+def test_fit_rejects_input_that_cannot_fit():
+    with pytest.raises(HTTPException) as error:
+        make_budget(100).fit(stage='teacher', prompt='p' * 1000, code='x')
+    assert error.value.status_code == 413
+
+
+def teacher_with_session(turns: int) -> BoundedMemoryAgent:
+    agent = BoundedMemoryAgent(
+        id='teacher',
+        memory_policy=MemoryPolicy(
+            history_turns=10,
+            max_history_tokens=10_000,
+            max_stored_runs=10,
+            summarize=True,
+        ),
+        session_id='1',
+    )
+    runs = [
+        RunOutput(
+            run_id=str(index),
+            agent_id='teacher',
+            session_id='1',
+            status=RunStatus.completed,
+            messages=[
+                Message(role='user', content=f'pergunta {index}'),
+                Message(role='assistant', content=f'resposta {index}'),
+            ],
+        )
+        for index in range(turns)
+    ]
+    agent._agent_session = AgentSession(
+        session_id='1', runs=runs, summary=SessionSummary(summary='resumo')
+    )
+    return agent
+
+
+def test_memory_context_is_counted_and_trimmed():
+    agent = teacher_with_session(3)
+    context = asyncio.run(agent.aload_context())
+    assert context == [
+        'resumo',
+        'pergunta 0\nresposta 0',
+        'pergunta 1\nresposta 1',
+        'pergunta 2\nresposta 2',
+    ]
+
+    # O orçamento manteve só os dois turnos mais recentes
+    agent.keep_context(2)
+    assert not agent.add_session_summary_to_context
+    history = [
+        message.content
+        for message in bounded_history(
+            agent._agent_session,
+            'teacher',
+            agent.memory_policy,
+            agent._history_limit,
+        )
+    ]
+    assert history == ['pergunta 1', 'resposta 1', 'pergunta 2', 'resposta 2']
@@ -0,0 +1,69 @@
+import asyncio
+
+from app.core.resumable import StreamRegistry
+
+
+async def events(count: int, delay: float = 0):
+    for index in range(count):
+        if delay:
+            await asyncio.sleep(delay)
+        yield 'teacher_delta', {'text': str(index)}
+
+
+async def collect(stream, after: int = 0):
+    return [seq async for seq, _, _ in stream.subscribe(after)]
+
+
+def test_resume_from_last_event():
+    async def scenario():
+        registry = StreamRegistry(grace=1, ttl=60, max_streams=10)
+        stream = registry.start(1, events(5, delay=0.001))
+        first, resumed = await asyncio.gather(
+            collect(stream), collect(registry.get(1), after=3)
+        )
+        assert first == [1, 2, 3, 4, 5]
+        assert resumed == [4, 5]
+        # Terminado, o buffer continua disponível para reconexão
+        assert await collect(registry.get(1), after=4) == [5]
+        assert registry.status()['completed'] == 1
+
+    asyncio.run(scenario())
+
+
+def test_stream_without_clients_is_abandoned():
+    async def scenario():
+        registry = StreamRegistry(grace=0.01, ttl=60, max_streams=10)
+        stream = registry.start(1, events(100, delay=0.01))
+        await asyncio.sleep(0.1)
+        assert stream.done and stream.abandoned
+        assert len(stream.events) < 100
+        assert registry.status()['abandoned'] == 1
+
+    asyncio.run(scenario())
+
+
+def test_finished_streams_are_evicted():
+    async def scenario():
+        registry = StreamRegistry(grace=1, ttl=60, max_streams=2)
+        for key in (1, 2):
+            await collect(registry.start(key, events(1)))
+        await collect(registry.start(3, events(1)))
+        # Acima de max_streams sai o terminado mais antigo
+        assert registry.get(1) is None
+        assert registry.get(3) is not None
+
+        registry.ttl = 0
+        await asyncio.sleep(0.01)
+        assert registry.get(3) is None
+
+    asyncio.run(scenario())
+
+
+def test_worker_id():
+    assert StreamRegistry(
+        grace=1, ttl=1, max_streams=1, worker_id='api-1'
+    ).worker_id == 'api-1'
+    generated = StreamRegistry(grace=1, ttl=1, max_streams=1).worker_id
+    assert generated and generated == StreamRegistry(
+        grace=1, ttl=1, max_streams=1
+    ).worker_id
@@ -0,0 +1,163 @@
+import asyncio
+
+import pytest
+from agno.agent import Agent
+
+import app.llm.agno as agno_module
+from app.agents.code_analyser_agent.models import AnaliseRapida
+from app.core.config import (
+    GEMINI_2_0_FLASH,
+    GEMINI_2_5_FLASH,
+    LLM_LLAMA_33_70B_INSTRUCT,
+)
+from app.llm.agno import RoutedAgnoModel
+from app.llm.routing import ProviderHealth, ProviderRouter
+from benchmarks.stub_llm import StubAgnoModel, StubTiming
+
+ROUTE = [GEMINI_2_0_FLASH, LLM_LLAMA_33_70B_INSTRUCT]
+
+
+def make_router(**overrides) -> ProviderRouter:
+    options = dict(
+        hedge_delay=0, timeout=1, failure_threshold=2, reset_timeout=60
+    )
+    options.update(overrides)
+    return ProviderRouter(**options)
+
+
+def test_circuit_opens_after_consecutive_failures():
+    health = ProviderHealth(failure_threshold=2, reset_timeout=60)
+    health.record_failure()
+    assert health.state == 'closed'
+    health.record_failure()
+    assert health.state == 'open'
+    assert not health.allow()
+
+
+def test_half_open_lets_a_single_probe_through():
+    health = ProviderHealth(failure_threshold=1, reset_timeout=0)
+    health.record_failure()
+    assert health.state == 'half_open'
+    assert health.allow()
+    assert not health.allow()
+
+    # Falha no teste reabre; sucesso fecha
+    health.record_failure()
+    assert health.allow()
+    health.record_success(0.1)
+    assert health.state == 'closed'
+    assert health.consecutive_failures == 0
+
+
+def fake_streams(failing=(), delays=None):
+    calls = []
+
+    def make_stream(model):
+        async def stream():
+            calls.append(model)
+            await asyncio.sleep((delays or {}).get(model, 0))
+            if model in failing:
+                raise ConnectionError(model)
+            yield f'{model}:1'
+            yield f'{model}:2'
+
+        return stream()
+
+    return make_stream, calls
+
+
+async def collect(router, make_stream):
+    return [chunk async for chunk in router.astream(ROUTE, make_stream)]
+
+
+def test_failover_to_next_provider_and_circuit_skip():
+    router = make_router(failure_threshold=1)
+    make_stream, calls = fake_streams(failing={GEMINI_2_0_FLASH})
+
+    first = asyncio.run(collect(router, make_stream))
+    assert first == [
+        f'{LLM_LLAMA_33_70B_INSTRUCT}:1',
+        f'{LLM_LLAMA_33_70B_INSTRUCT}:2',
+    ]
+    assert router.stats.failovers == 1
+    assert router.status()['providers']['google']['state'] == 'open'
+
+    # Com o circuito aberto, o Gemini nem é tentado
+    asyncio.run(collect(router, make_stream))
+    assert calls == [
+        GEMINI_2_0_FLASH,
+        LLM_LLAMA_33_70B_INSTRUCT,
+        LLM_LLAMA_33_70B_INSTRUCT,
+    ]
+
+
+def test_hedge_takes_the_first_provider_to_answer():
+    router = make_router(hedge_delay=0.01)
+    make_stream, _ = fake_streams(delays={GEMINI_2_0_FLASH: 0.5})
+
+    chunks = asyncio.run(collect(router, make_stream))
+    assert chunks[0] == f'{LLM_LLAMA_33_70B_INSTRUCT}:1'
+    assert router.stats.hedges == 1
+    # O perdedor do hedge não conta como falha
+    assert router.status()['providers']['google']['failures'] == 0
+
+
+def test_all_providers_failing_raises_last_error():
+    router = make_router()
+    make_stream, _ = fake_streams(failing=set(ROUTE))
+    with pytest.raises(ConnectionError):
+        asyncio.run(collect(router, make_stream))
+
+
+class BrokenAgnoModel(StubAgnoModel):
+    async def ainvoke(self, *args, **kwargs):
+        raise ConnectionError(self.id)
+
+    async def ainvoke_stream(self, *args, **kwargs):
+        raise ConnectionError(self.id)
+        yield
+
+
+def routed_agent(monkeypatch, output_schema=None) -> Agent:
+    router = make_router()
+    monkeypatch.setattr(agno_module, 'llm_router', router)
+    timing = StubTiming(ttft=0, tokens_per_second=0, response_tokens=3)
+    model = RoutedAgnoModel(
+        models=[
+            BrokenAgnoModel(id=GEMINI_2_5_FLASH, timing=timing),
+            StubAgnoModel(id=LLM_LLAMA_33_70B_INSTRUCT, timing=timing),
+        ]
+    )
+    return Agent(model=model, output_schema=output_schema, telemetry=False)
+
+
+def assistant_messages(response) -> list:
+    return [m for m in response.messages if m.role == 'assistant']
+
+
+def test_agno_agent_fails_over_to_the_next_provider(monkeypatch):
+    agent = routed_agent(monkeypatch, output_schema=AnaliseRapida)
+    assert agent.model.id == GEMINI_2_5_FLASH
+
+    response = asyncio.run(agent.arun('analise', stream=False))
+
+    assert isinstance(response.content, AnaliseRapida)
+    # Só a resposta do vencedor fica nas mensagens do run
+    assert len(assistant_messages(response)) == 1
+    assert agno_module.llm_router.stats.failovers == 1
+
+
+def test_agno_agent_stream_fails_over_to_the_next_provider(monkeypatch):
+    agent = routed_agent(monkeypatch)
+
+    async def collect_stream():
+        return [
+            event.content
+            async for event in agent.arun('explique', stream=True)
+            if getattr(event, 'content', None)
+        ]
+
+    chunks = asyncio.run(collect_stream())
+
+    assert ''.join(chunks).startswith('Boa pergunta')
+    assert agno_module.llm_router.stats.failovers == 1
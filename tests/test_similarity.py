@@ -0,0 +1,153 @@
+from app.agents.code_analyser_agent import DEFAULT_PROMPT_PARAMS
+from app.agents.code_analyser_agent.cache import analysis_cache_key
+from app.agents.code_analyser_agent.models import (
+    AnaliseCodigoCompleta,
+    ModoAnalise,
+)
+from app.agents.code_analyser_agent.similar import _first_match
+from app.agents.code_analyser_agent.static import (
+    local_analysis,
+    pre_analyse_code,
+)
+from app.core.similarity import SimilarityIndex
+
+AVERAGE = '''def media(notas):
+    # calcula a media
+    total = 0
+    for n in notas:
+        total = total + n
+    if len(notas) == 0:
+        return 0
+    return total / len(notas)
+
+print(media([7, 8, 9]))
+'''
+RENAMED = (
+    AVERAGE.replace('notas', 'valores')
+    .replace('total', 'soma')
+    .replace('media', 'calc')
+)
+RESPACED = AVERAGE.replace('# calcula a media', '# soma e divide').replace(
+    '\n\n', '\n'
+)
+UNRELATED = '''class Pilha:
+    def __init__(self):
+        self.itens = []
+
+    def empilhar(self, item):
+        self.itens.append(item)
+
+    def desempilhar(self):
+        return self.itens.pop()
+'''
+
+
+def make_index(**overrides) -> SimilarityIndex:
+    options = dict(
+        session_maker=None,
+        num_perm=64,
+        bands=8,
+        shingle_size=5,
+        min_tokens=20,
+        threshold=0.8,
+        max_entries=100,
+        path='',
+        refresh_interval=60,
+    )
+    options.update(overrides)
+    return SimilarityIndex(**options)
+
+
+def test_renamed_code_is_found_and_unrelated_is_not():
+    index = make_index()
+    index.add(1, index.signature(AVERAGE))
+    index.add(2, index.signature(UNRELATED))
+
+    assert [id for id, _ in index.query(index.signature(RENAMED))] == [1]
+    assert index.query(index.signature(UNRELATED))[0] == (2, 1.0)
+
+
+def test_signature_is_deterministic_and_skips_short_code():
+    assert make_index().signature(AVERAGE) == make_index().signature(AVERAGE)
+    assert make_index().signature('print(1)') is None
+
+
+def test_raw_similarity_ignores_comments_and_whitespace_only():
+    index = make_index()
+    assert index.raw_similarity(AVERAGE, RESPACED) == 1.0
+    assert index.raw_similarity(AVERAGE, RENAMED) < 0.5
+
+
+def test_oldest_entries_are_evicted():
+    index = make_index(max_entries=1)
+    index.add(1, index.signature(AVERAGE))
+    index.add(2, index.signature(UNRELATED))
+    assert len(index) == 1
+    assert index.query(index.signature(AVERAGE)) == []
+
+
+def full_analysis() -> dict:
+    """Análise completa gravada, sem erros de sintaxe"""
+    analysis = local_analysis(
+        pre_analyse_code('def f(:\n    pass\n'), ModoAnalise.COMPLETA
+    )
+    categorias = analysis.diagnostico_erros.erros_por_categoria
+    diagnostico = analysis.diagnostico_erros.model_copy(
+        update={
+            'total_erros': 0,
+            'erros_por_categoria': categorias.model_copy(
+                update={'sintaticos': []}
+            ),
+        }
+    )
+    return analysis.model_copy(
+        update={'diagnostico_erros': diagnostico}
+    ).model_dump()
+
+
+def match(rows, question='Está certo?', params=DEFAULT_PROMPT_PARAMS):
+    return _first_match(
+        code=RESPACED,
+        pre=pre_analyse_code(RESPACED),
+        question=question,
+        prompt_params=params,
+        mode=ModoAnalise.COMPLETA,
+        schema=AnaliseCodigoCompleta,
+        rows=rows,
+        similarities={1: 0.9},
+    )
+
+
+def stored_row(question='Está certo?', params=DEFAULT_PROMPT_PARAMS):
+    key = analysis_cache_key(
+        code=AVERAGE,
+        question=question,
+        prompt_params=params,
+        mode=ModoAnalise.COMPLETA,
+    )
+    return (1, AVERAGE, question, full_analysis(), key)
+
+
+def test_candidate_with_same_question_and_params_can_be_reused():
+    similar = match([stored_row()])
+    assert similar.same_question
+    assert similar.raw_similarity == 1.0
+
+
+def test_candidate_with_other_question_is_only_adapted():
+    similar = match([stored_row(question='Como otimizar?')])
+    assert similar is not None and not similar.same_question
+
+
+def test_candidate_with_other_params_or_no_key_is_skipped():
+    params = {**DEFAULT_PROMPT_PARAMS, 'feedback_tone': 'direto'}
+    assert match([stored_row(params=params)]) is None
+    assert match([stored_row()[:4] + (None,)]) is None
+
+
+def test_candidate_with_other_syntax_status_is_skipped():
+    row = stored_row()
+    broken = local_analysis(
+        pre_analyse_code('def f(:\n    pass\n'), ModoAnalise.COMPLETA
+    ).model_dump()
+    assert match([row[:3] + (broken,) + row[4:]]) is None
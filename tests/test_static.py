@@ -0,0 +1,138 @@
+import pytest
+
+from app.agents.code_analyser_agent.models import (
+    AnaliseGeral,
+    AnaliseRapida,
+    ModoAnalise,
+    NivelAluno,
+)
+from app.agents.code_analyser_agent.static import (
+    PYTHON,
+    answers_locally,
+    apply_pre_analysis,
+    detect_language,
+    format_pre_analysis,
+    local_analysis,
+    pre_analyse_code,
+)
+
+LUA = 'for i=1,10 do print(i) end\n'
+SWIFT = 'let x = 5\nprint(x)\n'
+KOTLIN = 'fun main() {\n    val x = 10\n    print(x)\n}\n'
+R = 'x <- c(1, 2, 3)\nfor (i in x) {\n  print(i)\n}\n'
+LUA_FUNCTION = 'function soma(a, b)\n  return a + b\nend\nprint(soma(1, 2))\n'
+
+PYTHON_OK = 'def dobro(x):\n    return x * 2\n\nprint(dobro(3))\n'
+PYTHON_BROKEN = 'def dobro(x)\n    return x * 2\n\nprint(dobro(3))\n'
+
+
+def quick_analysis(linguagem: str) -> AnaliseRapida:
+    return AnaliseRapida(
+        nivel_aluno=NivelAluno.INICIANTE,
+        linguagem=linguagem,
+        total_erros=0,
+        pontuacao=80,
+        principais_problemas=[],
+        sugestoes=[],
+    )
+
+
+@pytest.mark.parametrize('code', [LUA, SWIFT, KOTLIN, R, LUA_FUNCTION])
+def test_single_pattern_is_not_confirmed(code):
+    _, confirmed = detect_language(code)
+    assert not confirmed
+
+
+@pytest.mark.parametrize('code', [LUA, SWIFT, KOTLIN, R, LUA_FUNCTION])
+def test_ambiguous_code_is_sent_to_the_llm(code):
+    pre = pre_analyse_code(code)
+    assert not pre.linguagem_confirmada
+    assert not pre.verificado
+    assert not answers_locally(pre)
+
+
+def test_python_is_confirmed_and_verified():
+    assert detect_language(PYTHON_OK) == (PYTHON, True)
+    pre = pre_analyse_code(PYTHON_OK)
+    assert pre.verificado
+    assert not pre.erros_sintaticos
+    assert pre.metricas.funcoes == 1
+
+
+def test_broken_python_is_answered_locally():
+    pre = pre_analyse_code(PYTHON_BROKEN)
+    assert pre.linguagem == PYTHON and pre.linguagem_confirmada
+    assert pre.tem_erro_sintatico_verificado
+    assert answers_locally(pre)
+    analysis = local_analysis(pre, ModoAnalise.RAPIDA)
+    assert analysis.total_erros == 1
+
+
+def test_other_languages_are_confirmed():
+    javascript = 'const soma = (a, b) => a + b;\nconsole.log(soma(1, 2));\n'
+    java = (
+        'public class Main {\n'
+        '    public static void main(String[] args) {\n'
+        '        System.out.println("oi");\n'
+        '    }\n'
+        '}\n'
+    )
+    assert detect_language(javascript) == ('JavaScript', True)
+    assert detect_language(java) == ('Java', True)
+
+
+def test_unknown_code():
+    assert detect_language('x') == (None, False)
+    assert format_pre_analysis(pre_analyse_code('x')) == (
+        '- linguagem: não identificada localmente'
+    )
+
+
+def test_uncertain_language_is_only_a_hint():
+    pre = pre_analyse_code(R)
+    assert 'não confirmada' in format_pre_analysis(pre)
+    # A resposta do LLM prevalece sobre o palpite
+    analysis = apply_pre_analysis(quick_analysis('R'), pre)
+    assert analysis.linguagem == 'R'
+
+
+def test_confirmed_language_overrides_the_llm():
+    pre = pre_analyse_code(PYTHON_OK)
+    analysis = apply_pre_analysis(quick_analysis('JavaScript'), pre)
+    assert analysis.linguagem == PYTHON
+
+
+def test_python_tie_is_broken_by_the_compiler():
+    # `print(` (Python) e `let x =` (JavaScript) empatam
+    language, confirmed = detect_language('let x = 5\nprint(x)\n')
+    assert language == 'JavaScript' and not confirmed
+    # Compila, mas `print(` sozinho não confirma Python
+    language, confirmed = detect_language('x = 5\nprint(x)\n')
+    assert language == PYTHON and not confirmed
+
+
+def test_local_answer_keeps_the_schema():
+    pre = pre_analyse_code(PYTHON_BROKEN)
+    analysis = local_analysis(pre, ModoAnalise.COMPLETA)
+    assert isinstance(analysis.analise_geral, AnaliseGeral)
+    assert analysis.analise_geral.linguagem_programacao == PYTHON
+
+
+@pytest.mark.parametrize('terms', [400, 5_000])
+def test_deeply_nested_python_goes_to_the_llm(terms):
+    # Válido, mas estoura a pilha do visitor (400) ou do compilador (5000)
+    code = (
+        'def soma():\n'
+        f'    x = {" + ".join(["1"] * terms)}\n'
+        '    return x\n\n'
+        'print(soma())\n'
+    )
+    pre = pre_analyse_code(code)
+    assert pre.linguagem == PYTHON
+    assert not pre.linguagem_confirmada and not pre.verificado
+    assert not pre.erros_sintaticos
+    assert not answers_locally(pre)
+    assert 'não confirmada' in format_pre_analysis(pre)
+    # Empate com JavaScript (`print(` x `let y =`): desempate sem exceção
+    tie = f'let y = 1\nprint({" + ".join(["1"] * terms)})\n'
+    assert detect_language(tie)[1] is False
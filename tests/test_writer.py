@@ -0,0 +1,77 @@
+import asyncio
+
+import app.crud.writer as writer_module
+from app.crud import TutoringTurnCreate
+from app.crud.writer import WriteBehindWriter
+
+
+class FakeSession:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def rollback(self):
+        pass
+
+
+def make_writer(max_pending: int = 10) -> WriteBehindWriter:
+    return WriteBehindWriter(
+        session_maker=FakeSession,
+        max_pending=max_pending,
+        batch_size=10,
+        message_id_block_size=10,
+    )
+
+
+def turn(message_id: int, session_id: int = 1) -> TutoringTurnCreate:
+    return TutoringTurnCreate(
+        message_id=message_id,
+        session_id=session_id,
+        code=f'print({message_id})',
+        message='?',
+        analysis={},
+    )
+
+
+def test_only_written_turns_are_indexed(monkeypatch):
+    indexed = []
+
+    async def bulk(batch, db):
+        raise RuntimeError('foreign key')
+
+    async def single(turn, db):
+        if turn.session_id == 404:
+            raise RuntimeError('foreign key')
+
+    async def aadd(items):
+        indexed.extend(items)
+
+    monkeypatch.setattr(writer_module, 'apersist_tutoring_turns', bulk)
+    monkeypatch.setattr(writer_module, 'apersist_tutoring_turn', single)
+    monkeypatch.setattr(writer_module.similarity_index, 'aadd', aadd)
+
+    async def scenario():
+        writer = make_writer()
+        await writer.persist([turn(1), turn(2, session_id=404), turn(3)])
+        await asyncio.sleep(0)
+        return writer
+
+    writer = asyncio.run(scenario())
+    assert [message_id for message_id, _ in indexed] == [1, 3]
+    assert writer.stats.flushed == 2
+    assert writer.stats.failed == 1
+
+
+def test_submit_waits_when_the_queue_is_full():
+    async def scenario():
+        writer = make_writer(max_pending=1)
+        await writer.submit(turn(1))
+        blocked = asyncio.create_task(writer.submit(turn(2)))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+        writer._queue.get_nowait()
+        await asyncio.wait_for(blocked, 1)
+
+    asyncio.run(scenario())